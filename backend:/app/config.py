@@ -1,5 +1,13 @@
+import os
 
-shared_resources = {
+from methods.glance.local_cfs import CounterfactualCache
+from methods.glance.utils.feature_importance import FeatureImportanceCache
+from methods.glance.counterfactual_tree.subgroup_cache import SubgroupCache
+from app.services.jobs import job_manager_from_env
+from app.services.sessions import SessionProxy, SessionStore
+
+
+_session_defaults = {
     "method": None,
     "train_dataset": None,
     "data": None,
@@ -23,10 +31,48 @@ shared_resources = {
     "preprocess_pipeline_globece": None
 }
 
+# State of every analyst session, resolved by the session token of the
+# current request (see app/main.py). Requests without a token share the
+# default session.
+session_store = SessionStore(
+    _session_defaults,
+    max_sessions=int(os.environ.get("MAX_SESSIONS", 16)),
+    spill_dir=os.environ.get("SESSION_SPILL_PATH", os.path.join("cache", "sessions")),
+)
+shared_resources = SessionProxy(session_store)
+
 
 dataset_identifiers = {
     "rawData": "data",
     "testData": "X_test",
     "affectedData": "affected",
     "appliedAffected": "applied_affected"
-}
\ No newline at end of file
+}
+
+# Local counterfactuals shared by all C_GLANCE / T_GLANCE runs, so that
+# re-running with different downstream parameters skips their generation.
+counterfactual_cache = CounterfactualCache(
+    disk_path=os.environ.get("COUNTERFACTUAL_CACHE_PATH", os.path.join("cache", "counterfactuals.sqlite")),
+)
+
+# Permutation importances of every (model, dataset), computed by the first
+# T_GLANCE / RandomSampling run that needs them and kept on disk next to the
+# other caches, keyed by the model fingerprint.
+feature_importance_cache = FeatureImportanceCache(
+    disk_dir=os.environ.get("FEATURE_IMPORTANCE_CACHE_PATH", os.path.join("cache", "feature_importances")),
+)
+
+# Results of the T_GLANCE subgroups, shared by all runs so that re-running
+# with other split features or instances reuses the subgroups seen before.
+# The subgroups of the candidate splits are evaluated by T_GLANCE_JOBS loky
+# worker processes (joblib's n_jobs; -1 uses all cores). One by default, since
+# each run already occupies the single job worker.
+t_glance_subgroup_cache = SubgroupCache(
+    max_entries=int(os.environ.get("T_GLANCE_SUBGROUP_CACHE_ENTRIES", 4096)),
+)
+t_glance_n_jobs = int(os.environ.get("T_GLANCE_JOBS", 1))
+
+# Worker pool running the /run-* algorithms off the event loop. A single
+# worker by default, since the algorithms write their results into
+# `shared_resources`.
+job_manager = job_manager_from_env()
@@ -1,6 +1,15 @@
-from fastapi import FastAPI
-from app.routers import resources,c_glance,t_glance,apply_actions,umap,upload,groupcfe,globece  # Import your router
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from app.routers import resources,c_glance,t_glance,apply_actions,umap,upload,groupcfe,globece,jobs  # Import your router
 from fastapi.middleware.cors import CORSMiddleware
+from app.config import session_store
+from app.services.sessions import (
+    SESSION_COOKIE,
+    SESSION_HEADER,
+    reset_current_session,
+    set_current_session,
+    valid_session_token,
+)
  
 app = FastAPI()
  
@@ -21,7 +30,32 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[SESSION_HEADER],
 )
+
+
+@app.middleware("http")
+async def resolve_session(request: Request, call_next):
+    # `shared_resources` resolves to the session named by the request header
+    # or cookie; requests without either share the default session
+    token = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+    if token is None:
+        return await call_next(request)
+    if not valid_session_token(token):
+        return JSONResponse(status_code=400, content={"detail": "Invalid session token."})
+    # Only tokens issued by POST /session/ are accepted, so that a client
+    # cannot create (and evict) sessions under names of its choosing. Clients
+    # with an expired token can still create a new session.
+    creating = request.method == "POST" and request.url.path == "/session/"
+    if not session_store.exists(token) and not creating:
+        return JSONResponse(status_code=404, content={"detail": "Unknown or expired session, create one with POST /session/."})
+    reset_token = set_current_session(token)
+    try:
+        response = await call_next(request)
+    finally:
+        reset_current_session(reset_token)
+    response.headers[SESSION_HEADER] = token
+    return response
  
 # Include the router for available datasets and models
 app.include_router(upload.router)
@@ -32,6 +66,7 @@ app.include_router(groupcfe.router)
 app.include_router(globece.router)
 app.include_router(apply_actions.router)
 app.include_router(umap.router)
+app.include_router(jobs.router)
 
 @app.get("/")
 def read_root():
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, HTTPException
 import logging
-from app.config import shared_resources
+from app.config import shared_resources, counterfactual_cache, feature_importance_cache, job_manager
 logging.basicConfig(level=logging.DEBUG)
 from app.services.resources_service import load_dataset_and_model,get_data
+from app.services.inference_service import get_cached_model
 from methods.glance.iterative_merges.iterative_merges import C_GLANCE
 from typing import List, Optional
 from raiutils.exceptions import UserConfigValidationException
@@ -17,7 +18,13 @@ router = APIRouter()
 rd = redis.Redis(host="localhost", port=6379, db=0)
 
 @router.post("/run-c_glance", summary="Run C_GLANCE")
-async def run_glance(gcf_size: int = 3, cf_method: str = 'Dice', action_choice_strategy: str = 'Max Effectiveness', features_to_change: Optional[List[str]] = None):
+async def run_glance(gcf_size: int = 3, cf_method: str = 'Dice', action_choice_strategy: str = 'Max Effectiveness', features_to_change: Optional[List[str]] = None, background: bool = False):
+    # Runs on the job worker pool, so the event loop keeps serving other
+    # requests. With `background`, returns a job id to poll on /jobs/.
+    return await job_manager.run("run-c_glance", _run_glance, gcf_size, cf_method, action_choice_strategy, features_to_change, background=background)
+
+
+def _run_glance(gcf_size: int = 3, cf_method: str = 'Dice', action_choice_strategy: str = 'Max Effectiveness', features_to_change: Optional[List[str]] = None):
     cache_key = f"run-c_glance:{shared_resources['dataset_name']}:{shared_resources['model_name']}:{gcf_size}:{cf_method}:{action_choice_strategy}:{features_to_change}"
     cache = rd.get(cache_key)
     if cache:
@@ -110,7 +117,7 @@ async def run_glance(gcf_size: int = 3, cf_method: str = 'Dice', action_choice_s
         # data = shared_resources.get("data").copy(deep=True)
         # X_test = shared_resources.get("X_test").copy(deep=True)
         # affected = shared_resources.get("affected").copy(deep=True)
-        model = shared_resources.get("model")
+        model = get_cached_model(shared_resources.get("model"), endpoint="c_glance")
         target_name = shared_resources.get("target_name")
         print(X_test)
         X_test.rename(columns={"label": "target"},inplace=True)
@@ -143,7 +150,16 @@ async def run_glance(gcf_size: int = 3, cf_method: str = 'Dice', action_choice_s
             X_test,
             feat_to_vary,
             cluster_action_choice_algo = action_choice_strategy,
-            cf_generator = cf_method
+            cf_generator = cf_method,
+            cf_cache = counterfactual_cache,
+            importance_cache = feature_importance_cache,
+            # Nearest neighbor indexes are saved next to the model pickle and
+            # reused as long as they were built from the same data
+            nn__index_path = (
+                'models/{}_{}.nn_index.joblib'.format(shared_resources['dataset_name'], shared_resources['model_name'])
+                if shared_resources.get("dataset_name") in ['compas', 'default_credit', 'german_credit', 'heloc']
+                else None
+            ),
         )
         try:
             clusters, clusters_res, eff, cost = global_method.explain_group(affected.drop(columns='index'))
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException
 import logging
-from app.config import shared_resources
+from app.config import shared_resources, job_manager
 logging.basicConfig(level=logging.DEBUG)
 from methods.glance.iterative_merges.iterative_merges import C_GLANCE
 from typing import List, Optional
@@ -16,13 +16,20 @@ from app.services.resources_service import get_data,load_dataset_and_model_globe
 import math
 from sklearn.base import clone
 from sklearn.pipeline import Pipeline
+from app.services.inference_service import get_cached_model
 
 router = APIRouter()
 
 rd = redis.Redis(host="localhost", port=6379, db=0)
 
 @router.post("/run-globece", summary="Run GLOBE_CE")
-async def run_groupcfe(gcf_size: int = 3, features_to_change: int = 5, direction: int =1):
+async def run_groupcfe(gcf_size: int = 3, features_to_change: int = 5, direction: int =1, background: bool = False):
+    # Runs on the job worker pool, so the event loop keeps serving other
+    # requests. With `background`, returns a job id to poll on /jobs/.
+    return await job_manager.run("run-globece", _run_globece, gcf_size, features_to_change, direction, background=background)
+
+
+def _run_globece(gcf_size: int = 3, features_to_change: int = 5, direction: int =1):
     cache_key = f"run-globece:{shared_resources['dataset_name']}:{shared_resources['model_name']}:{gcf_size}:{features_to_change}:{direction}"
     cache = rd.get(cache_key)
     if cache:
@@ -122,6 +129,7 @@ async def run_groupcfe(gcf_size: int = 3, features_to_change: int = 5, direction
             normalise = None
 
 
+        model = get_cached_model(model, endpoint="globece")
         try:
             n_bins = 10
             ordinal_features = []
@@ -149,8 +157,7 @@ async def run_groupcfe(gcf_size: int = 3, features_to_change: int = 5, direction
                 globe_ce.select_n_deltas(n_div=direction)
             
             if direction == 1:
-                corrects, costs, scalars = globe_ce.scale(delta=delta, vector=True, plot=True, n_scalars=gcf_size)
-                min_costs, idxs = globe_ce.min_scalar_costs(costs=costs, return_idxs=True)
+                min_costs, idxs, scalars = globe_ce.first_flip_costs(delta=delta, n_scalars=gcf_size, disable_tqdm=False)
 
                 unique_actions, actions, avg_cost, effectiveness, flipped_list, cost_list = report_globece_actions(
                     globe_ce_object=globe_ce,
@@ -362,19 +369,20 @@ async def run_groupcfe(gcf_size: int = 3, features_to_change: int = 5, direction
 
                 eff_cost_actions = {}
                 z=0
-                for i,value in enumerate(corrects.tolist()):
-                    if i in np.unique(flipped_idxs):
-
-                        column_name = f"Action{z+1}_Prediction"
-                        affected_clusters[column_name] = [val/100 for val in value]
-                        if (sum(value)/100) == 0.0:
-                            eff_cost_actions[z+1] = {'eff':0.0 , 'cost':0.0}
-                            z=z+1
-                        else:
-                            eff_act = (sum(value)/100)/len(affected)
-                            cost_act = sum(costs[i])/(sum(value)/100)
-                            eff_cost_actions[z+1] = {'eff':round(eff_act,3) , 'cost':round(cost_act,3)}
-                            z=z+1
+                for i in np.unique(flipped_idxs).astype(int):
+                    # only the scalars chosen as actions are evaluated on all inputs
+                    value, cost = globe_ce.evaluate(scalars[i] * delta, vector=True)
+                    value = value.tolist()
+                    column_name = f"Action{z+1}_Prediction"
+                    affected_clusters[column_name] = [val/100 for val in value]
+                    if (sum(value)/100) == 0.0:
+                        eff_cost_actions[z+1] = {'eff':0.0 , 'cost':0.0}
+                        z=z+1
+                    else:
+                        eff_act = (sum(value)/100)/len(affected)
+                        cost_act = sum(cost)/(sum(value)/100)
+                        eff_cost_actions[z+1] = {'eff':round(eff_act,3) , 'cost':round(cost_act,3)}
+                        z=z+1
                 affected_clusters['action_idxs'] = idxs
                 affected_clusters = affected_clusters.replace(np.nan , '-')
                 z=0
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, HTTPException
 import logging
-from app.config import shared_resources
+from app.config import shared_resources, job_manager
 logging.basicConfig(level=logging.DEBUG)
 from app.services.resources_service import load_dataset_and_model,get_data
+from app.services.inference_service import get_cached_model
 from methods.glance.iterative_merges.iterative_merges import C_GLANCE
 from typing import List, Optional
 from raiutils.exceptions import UserConfigValidationException
@@ -18,7 +19,13 @@ router = APIRouter()
 rd = redis.Redis(host="localhost", port=6379, db=0)
 
 @router.post("/run-groupcfe", summary="Run GroupCFE")
-async def run_groupcfe(gcf_size: int, features_to_change: Optional[List[str]] = None):
+async def run_groupcfe(gcf_size: int, features_to_change: Optional[List[str]] = None, background: bool = False):
+    # Runs on the job worker pool, so the event loop keeps serving other
+    # requests. With `background`, returns a job id to poll on /jobs/.
+    return await job_manager.run("run-groupcfe", _run_groupcfe, gcf_size, features_to_change, background=background)
+
+
+def _run_groupcfe(gcf_size: int, features_to_change: Optional[List[str]] = None):
     cache_key = f"run-groupcfe:{shared_resources['dataset_name']}:{shared_resources['model_name']}:{gcf_size}"
     cache = rd.get(cache_key)
     if cache:
@@ -109,7 +116,7 @@ async def run_groupcfe(gcf_size: int, features_to_change: Optional[List[str]] =
         print(X_test)
         print(affected)
         # affected = shared_resources.get("affected").copy(deep=True)
-        model = shared_resources.get("model")
+        model = get_cached_model(shared_resources.get("model"), endpoint="groupcfe")
         target_name = shared_resources.get("target_name")
         train_dataset = shared_resources.get("train_dataset")
         _unaffected = shared_resources.get("_unaffected")
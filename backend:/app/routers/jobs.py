@@ -0,0 +1,40 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse
+from app.config import job_manager
+from app.services.jobs import FINISHED, FAILED
+
+router = APIRouter()
+
+
+def _get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    return job
+
+
+@router.get("/jobs/", summary="List jobs")
+async def list_jobs():
+    return job_manager.list()
+
+
+@router.get("/jobs/{job_id}", summary="Job status")
+async def get_job(job_id: str):
+    return _get_job(job_id)
+
+
+@router.get("/jobs/{job_id}/progress", summary="Job progress")
+async def get_job_progress(job_id: str):
+    job = _get_job(job_id)
+    return {"status": job["status"], "progress": job["progress"]}
+
+
+@router.get("/jobs/{job_id}/result", summary="Job result")
+async def get_job_result(job_id: str):
+    job = _get_job(job_id)
+    if job["status"] == FAILED:
+        raise HTTPException(status_code=job["error"]["status_code"], detail=job["error"]["detail"])
+    if job["status"] != FINISHED:
+        # Not done yet: 202 with the current status, to be polled again
+        return JSONResponse(status_code=202, content={"status": job["status"], "progress": job["progress"]})
+    return job_manager.result(job_id)
@@ -6,11 +6,41 @@ from app.services.resources_service import (
 )  # Import service functions
 
 import logging
-from app.config import shared_resources
+from fastapi import Response
+from app.config import shared_resources, session_store
+from app.services.inference_service import inference_metrics
+from app.services.sessions import DEFAULT_SESSION, SESSION_COOKIE, SESSION_HEADER, current_session
 import pickle
 logging.basicConfig(level=logging.DEBUG)
 router = APIRouter()
 
+@router.post("/session/")
+async def create_session(response: Response):
+    token = session_store.create()
+    response.set_cookie(SESSION_COOKIE, token, httponly=True, samesite="lax")
+    response.headers[SESSION_HEADER] = token
+    return {"session_id": token}
+
+@router.delete("/session/")
+async def delete_session(response: Response):
+    # The default session is shared by all clients without a session token
+    if current_session() == DEFAULT_SESSION:
+        raise HTTPException(status_code=400, detail="No session to delete: pass the session token of a session created with POST /session/.")
+    session_store.delete(current_session())
+    response.delete_cookie(SESSION_COOKIE)
+    return {"session_id": current_session()}
+
+@router.get("/session-memory/")
+async def get_session_memory():
+    return {
+        "session": session_store.get(current_session()).memory_usage(refresh=True),
+        "all_sessions": session_store.memory_usage(),
+    }
+
+@router.get("/inference-metrics/")
+async def get_inference_metrics():
+    return inference_metrics()
+
 @router.get("/get-data/")
 async def get_data():
     data = shared_resources.get("data")
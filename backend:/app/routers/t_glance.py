@@ -1,10 +1,11 @@
 from fastapi import APIRouter, HTTPException
 import logging
-from app.config import shared_resources
+from app.config import shared_resources, counterfactual_cache, feature_importance_cache, t_glance_subgroup_cache, t_glance_n_jobs, job_manager
 logging.basicConfig(level=logging.DEBUG)
 from app.services.resources_service import load_dataset_and_model
+from app.services.inference_service import get_cached_model
 from methods.glance.counterfactual_tree.counterfactual_tree import T_GLANCE
-from typing import Union, List
+from typing import Union, List, Optional
 from app.services.resources_t_glance import to_json_structure
 from pydantic import BaseModel
 
@@ -15,29 +16,46 @@ router = APIRouter()
 class GlanceRequest(BaseModel):
     split_features: List[str]
     local_cf_method: str
+    # Number of affected instances to explain (the first ones). Bounded by
+    # default, as the tree is built inside the single job worker.
+    max_instances: int = 11
 
 # Endpoint using the request model
 @router.post("/run-t_glance",summary="Run T_GLANCE")
-async def run_glance(request: GlanceRequest):
+async def run_glance(request: GlanceRequest, background: bool = False):
+    # Runs on the job worker pool, so the event loop keeps serving other
+    # requests. With `background`, returns a job id to poll on /jobs/.
+    if request.max_instances < 1:
+        raise HTTPException(status_code=400, detail="max_instances must be at least 1")
+    return await job_manager.run("run-t_glance", _run_glance, request, background=background)
+
+
+def _run_glance(request: GlanceRequest):
     # Extract dataset and model names from shared state
     dataset_name = shared_resources.get("dataset_name")
     model_name = shared_resources.get("model_name")
     
     # Retrieve values from shared state or load them as needed
-    train_dataset, data, X_train, y_train, X_test, y_test, affected, _unaffected, model, feat_to_vary, target_name = load_dataset_and_model(dataset_name, model_name)
+    train_dataset, data, X_train, y_train, X_test, y_test, affected, _unaffected, loaded_model, feat_to_vary, target_name, _num_features, _cate_features = load_dataset_and_model(dataset_name, model_name)
+    # The model loaded above is a fresh copy; the shared one keeps its
+    # inference service and prediction cache across runs
+    if shared_resources.get("model") is None:
+        shared_resources["model"] = loaded_model
+    model = get_cached_model(shared_resources["model"], endpoint="t_glance")
     num_features = X_train._get_numeric_data().columns.to_list()
     # Prepare arguments for the method
     global_method_args_fit = {"train_dataset": train_dataset}
 
     # Initialize and fit the T_GLANCE model
-    cf_tree = T_GLANCE(model, local_method=request.local_cf_method, split_features=request.split_features)
-    cf_tree.fit(data.drop(columns=[target_name]), data[target_name], train_dataset)
+    cf_tree = T_GLANCE(model, local_method=request.local_cf_method, split_features=request.split_features, n_jobs=t_glance_n_jobs)
+    cf_tree.fit(data.drop(columns=[target_name]), data[target_name], train_dataset, cf_cache=counterfactual_cache, importance_cache=feature_importance_cache, subgroup_cache=t_glance_subgroup_cache)
 
     # Partition the group and convert to JSON structure
-    node = cf_tree.partition_group(affected.loc[0:10])
+    instances = affected.iloc[:request.max_instances]
+    node = cf_tree.partition_group(instances)
     node_json = to_json_structure(node,numeric_features=num_features)
     eff, cost , num = cf_tree.cumulative_leaf_actions()
-    node_json['TotalEffectiveness'] = float(round(eff/len(affected.loc[0:10]),2))
+    node_json['TotalEffectiveness'] = float(round(eff/len(instances),2))
     node_json['Cost'] = float(round(cost/eff,2))
     
     # Return the JSON response
@@ -0,0 +1,277 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from methods.glance.utils.prediction_cache import CachedPredictor, set_prediction_endpoint
+
+
+class _PredictRequest:
+    __slots__ = ("method", "X", "key", "n_rows", "submitted", "done", "result", "error")
+
+    def __init__(self, method: str, X: Any):
+        self.method = method
+        self.X = X
+        if isinstance(X, pd.DataFrame):
+            self.key = (method, "frame", tuple(X.columns), tuple(X.dtypes.astype(str)))
+        else:
+            X = np.asarray(X)
+            self.X = X
+            self.key = (method, "array", X.shape[1:], X.dtype.str)
+        self.n_rows = X.shape[0]
+        self.submitted = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class InferenceService:
+    """Wraps a model so that `predict` / `predict_proba` calls coming from
+    concurrent callers are collected into micro-batches and sent to the
+    model as one large matrix.
+
+    A batch is dispatched as soon as every caller seen during the last
+    `client_timeout` seconds has a request queued, when it reaches
+    `max_batch_rows` rows, or when its oldest request has waited `max_wait`
+    seconds. A single caller is therefore never delayed. Requests are only
+    batched with requests of the same method, columns and dtypes.
+
+    Every other attribute is forwarded to the wrapped model. When pickled
+    (e.g. to be sent to a worker process), the service is re-created around
+    the unpickled model with its own worker thread.
+    """
+
+    def __init__(
+        self,
+        model: Any,
+        max_batch_rows: int = 200_000,
+        max_wait: float = 0.005,
+        client_timeout: float = 1.0,
+        idle_timeout: float = 30.0,
+    ):
+        self.model = model
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait
+        self.client_timeout = client_timeout
+        self.idle_timeout = idle_timeout
+        self._init_state()
+
+    def _init_state(self):
+        self._queue: deque = deque()
+        self._condition = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+        self._clients: Dict[int, float] = {}
+        self._metrics = {
+            "calls": 0,
+            "rows": 0,
+            "batches": 0,
+            "model_seconds": 0.0,
+            "latency_seconds": 0.0,
+            "max_latency_seconds": 0.0,
+        }
+
+    def __getstate__(self):
+        return {
+            "model": self.model,
+            "max_batch_rows": self.max_batch_rows,
+            "max_wait": self.max_wait,
+            "client_timeout": self.client_timeout,
+            "idle_timeout": self.idle_timeout,
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_state()
+
+    def __getattr__(self, name: str):
+        # Only called for attributes not found on the service itself
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def predict(self, X: Any) -> np.ndarray:
+        return self._submit("predict", X)
+
+    def predict_proba(self, X: Any) -> np.ndarray:
+        return self._submit("predict_proba", X)
+
+    def _submit(self, method: str, X: Any) -> np.ndarray:
+        request = _PredictRequest(method, X)
+        if request.n_rows == 0:
+            return np.asarray(getattr(self.model, method)(X))
+
+        with self._condition:
+            self._clients[threading.get_ident()] = request.submitted
+            self._queue.append(request)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+            self._condition.notify_all()
+
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _n_active_clients(self, now: float) -> int:
+        alive = {thread.ident for thread in threading.enumerate()}
+        self._clients = {
+            client: last_seen
+            for client, last_seen in self._clients.items()
+            if now - last_seen <= self.client_timeout and client in alive
+        }
+        return len(self._clients)
+
+    def _collect_batch(self) -> Optional[List[_PredictRequest]]:
+        with self._condition:
+            if not self._queue:
+                self._condition.wait(self.idle_timeout)
+                if not self._queue:
+                    self._worker = None
+                    return None
+
+            deadline = self._queue[0].submitted + self.max_wait
+            while True:
+                now = time.perf_counter()
+                queued_rows = sum(request.n_rows for request in self._queue)
+                if (
+                    len(self._queue) >= self._n_active_clients(now)
+                    or queued_rows >= self.max_batch_rows
+                    or now >= deadline
+                ):
+                    break
+                self._condition.wait(deadline - now)
+
+            batch = list(self._queue)
+            self._queue.clear()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                return
+            groups: "OrderedDict[tuple, List[_PredictRequest]]" = OrderedDict()
+            for request in batch:
+                groups.setdefault(request.key, []).append(request)
+            for requests in groups.values():
+                chunk, chunk_rows = [], 0
+                for request in requests:
+                    if chunk and chunk_rows + request.n_rows > self.max_batch_rows:
+                        self._execute(chunk)
+                        chunk, chunk_rows = [], 0
+                    chunk.append(request)
+                    chunk_rows += request.n_rows
+                self._execute(chunk)
+
+    def _execute(self, requests: List[_PredictRequest]):
+        if isinstance(requests[0].X, pd.DataFrame):
+            X = (
+                requests[0].X
+                if len(requests) == 1
+                else pd.concat([request.X for request in requests], ignore_index=True)
+            )
+        else:
+            X = requests[0].X if len(requests) == 1 else np.concatenate([request.X for request in requests])
+
+        start = time.perf_counter()
+        try:
+            result = np.asarray(getattr(self.model, requests[0].method)(X))
+        except Exception as e:
+            for request in requests:
+                request.error = e
+                request.done.set()
+            return
+        end = time.perf_counter()
+
+        offset = 0
+        for request in requests:
+            request.result = result[offset : offset + request.n_rows]
+            offset += request.n_rows
+
+        with self._condition:
+            self._metrics["batches"] += 1
+            self._metrics["model_seconds"] += end - start
+            for request in requests:
+                latency = end - request.submitted
+                self._metrics["calls"] += 1
+                self._metrics["rows"] += request.n_rows
+                self._metrics["latency_seconds"] += latency
+                self._metrics["max_latency_seconds"] = max(self._metrics["max_latency_seconds"], latency)
+        for request in requests:
+            request.done.set()
+
+    def metrics(self) -> Dict[str, float]:
+        with self._condition:
+            metrics = dict(self._metrics)
+        calls, batches = metrics["calls"], metrics["batches"]
+        return {
+            "calls": calls,
+            "rows": metrics["rows"],
+            "batches": batches,
+            "mean_calls_per_batch": calls / batches if batches else 0.0,
+            "mean_rows_per_batch": metrics["rows"] / batches if batches else 0.0,
+            "mean_latency_ms": 1000 * metrics["latency_seconds"] / calls if calls else 0.0,
+            "max_latency_ms": 1000 * metrics["max_latency_seconds"],
+            "model_seconds": metrics["model_seconds"],
+        }
+
+
+_services: "OrderedDict[int, InferenceService]" = OrderedDict()
+_services_lock = threading.Lock()
+
+
+def get_inference_service(model: Any, max_services: int = 8, **kwargs) -> Any:
+    """The shared `InferenceService` of `model`, created on first use. Returns
+    `model` itself if it is None or already a service."""
+    if model is None or isinstance(model, InferenceService):
+        return model
+    with _services_lock:
+        service = _services.get(id(model))
+        if service is None or service.model is not model:
+            service = InferenceService(model, **kwargs)
+            _services[id(model)] = service
+            while len(_services) > max_services:
+                _services.popitem(last=False)
+        _services.move_to_end(id(model))
+        return service
+
+
+_cached_models: "OrderedDict[int, CachedPredictor]" = OrderedDict()
+
+
+def get_cached_model(model: Any, endpoint: Optional[str] = None, max_models: int = 8, **kwargs) -> Any:
+    """The shared `CachedPredictor` of `model`, placed in front of its
+    `InferenceService` so that only cache misses are micro-batched. If
+    `endpoint` is given, cache hits and misses of the current request are
+    reported under it. Returns None if `model` is None."""
+    if endpoint is not None:
+        set_prediction_endpoint(endpoint)
+    if model is None or isinstance(model, CachedPredictor):
+        return model
+    service = get_inference_service(model)
+    with _services_lock:
+        cached = _cached_models.get(id(model))
+        if cached is None or cached.model is not service:
+            cached = CachedPredictor(service, **kwargs)
+            _cached_models[id(model)] = cached
+            while len(_cached_models) > max_models:
+                _cached_models.popitem(last=False)
+        _cached_models.move_to_end(id(model))
+        return cached
+
+
+def inference_metrics() -> Dict[str, Dict[str, Any]]:
+    with _services_lock:
+        services = list(_services.values())
+        cached_models = {id(cached.model): cached for cached in _cached_models.values()}
+    metrics = {}
+    for service in services:
+        service_metrics: Dict[str, Any] = service.metrics()
+        if id(service) in cached_models:
+            service_metrics["prediction_cache"] = cached_models[id(service)].stats()
+        metrics[type(service.model).__name__ + f"-{id(service.model)}"] = service_metrics
+    return metrics
@@ -0,0 +1,295 @@
+import asyncio
+import contextvars
+import json
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from tqdm import tqdm
+
+
+QUEUED, RUNNING, FINISHED, FAILED = "queued", "running", "finished", "failed"
+
+
+class InMemoryJobStore:
+    """Job records and results kept in the memory of the API process. Only the
+    `max_jobs` most recent jobs are kept."""
+
+    def __init__(self, max_jobs: int = 1000):
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._results: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job: Dict[str, Any]):
+        with self._lock:
+            self._jobs[job["id"]] = job
+            while len(self._jobs) > self.max_jobs:
+                evicted, _ = self._jobs.popitem(last=False)
+                self._results.pop(evicted, None)
+
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id] = {**self._jobs[job_id], **fields}
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(job) for job in self._jobs.values()]
+
+    def set_result(self, job_id: str, result: Any):
+        with self._lock:
+            if job_id in self._jobs:
+                self._results[job_id] = result
+
+    def get_result(self, job_id: str) -> Any:
+        with self._lock:
+            return self._results.get(job_id)
+
+
+class RedisJobStore:
+    """Job records and results kept in Redis, so that they are visible from
+    worker processes and survive restarts of the API process for `ttl`
+    seconds. Records are stored as JSON, results are pickled."""
+
+    def __init__(self, host: str = "localhost", port: int = 6379, db: int = 0, ttl: int = 24 * 3600):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.ttl = ttl
+        self._client = None
+
+    def __getstate__(self):
+        return {"host": self.host, "port": self.port, "db": self.db, "ttl": self.ttl, "_client": None}
+
+    @property
+    def client(self):
+        if self._client is None:
+            import redis
+
+            self._client = redis.Redis(host=self.host, port=self.port, db=self.db)
+        return self._client
+
+    def create(self, job: Dict[str, Any]):
+        self.client.set(f"job:{job['id']}", json.dumps(job), ex=self.ttl)
+        self.client.zadd("jobs", {job["id"]: job["submitted"]})
+
+    def update(self, job_id: str, **fields):
+        job = self.get(job_id)
+        if job is not None:
+            self.client.set(f"job:{job_id}", json.dumps({**job, **fields}), ex=self.ttl)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.client.get(f"job:{job_id}")
+        return json.loads(job) if job is not None else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        self.client.zremrangebyscore("jobs", "-inf", time.time() - self.ttl)
+        jobs = [self.get(job_id.decode()) for job_id in self.client.zrange("jobs", 0, -1)]
+        return [job for job in jobs if job is not None]
+
+    def set_result(self, job_id: str, result: Any):
+        self.client.set(f"job:{job_id}:result", pickle.dumps(result), ex=self.ttl)
+
+    def get_result(self, job_id: str) -> Any:
+        result = self.client.get(f"job:{job_id}:result")
+        return pickle.loads(result) if result is not None else None
+
+
+_current_job: contextvars.ContextVar = contextvars.ContextVar("current_job", default=None)
+
+
+class _JobProgress:
+    """Progress of the job running in the current thread, fed by the tqdm
+    progress bars of the algorithms."""
+
+    def __init__(self, store: Any, job_id: str, min_interval: float = 0.2):
+        self.store = store
+        self.job_id = job_id
+        self.min_interval = min_interval
+        self.completed_bars = 0
+        self._last_report = 0.0
+
+    def report(self, bar: tqdm, closed: bool = False):
+        if closed:
+            self.completed_bars += 1
+        now = time.time()
+        if not closed and now - self._last_report < self.min_interval:
+            return
+        self._last_report = now
+        total = bar.total
+        self.store.update(
+            self.job_id,
+            progress={
+                "completed_stages": self.completed_bars,
+                "stage": bar.desc or None,
+                "n": bar.n,
+                "total": total,
+                "fraction": bar.n / total if total else None,
+            },
+        )
+
+
+def _install_tqdm_hook():
+    """Makes every tqdm bar report to the job running in its thread, if any.
+    tqdm calls `update` periodically from its iterator and `close` at the end."""
+    if getattr(tqdm, "_job_hook_installed", False):
+        return
+    update, close = tqdm.update, tqdm.close
+
+    def hooked_update(self, n=1):
+        ret = update(self, n)
+        job = _current_job.get()
+        if job is not None and not self.disable:
+            job.report(self)
+        return ret
+
+    def hooked_close(self):
+        job = _current_job.get()
+        if job is not None and not self.disable and not getattr(self, "_job_closed", False):
+            self._job_closed = True
+            job.report(self, closed=True)
+        return close(self)
+
+    tqdm.update, tqdm.close = hooked_update, hooked_close
+    tqdm._job_hook_installed = True
+
+
+def _run_job(store: Optional[Any], job_id: str, func: Callable, args: Tuple, kwargs: Dict[str, Any]) -> Any:
+    """Runs a job in a worker thread or process. The final status is recorded
+    by the submitting process once the future completes."""
+    if store is not None:
+        _install_tqdm_hook()
+        store.update(job_id, status=RUNNING, started=time.time())
+        _current_job.set(_JobProgress(store, job_id))
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _current_job.set(None)
+
+
+def _job_error(e: BaseException) -> Dict[str, Any]:
+    if isinstance(e, HTTPException):
+        return {"status_code": e.status_code, "detail": e.detail}
+    return {"status_code": 500, "detail": f"Unexpected error: {str(e)}"}
+
+
+class JobManager:
+    """Runs long jobs (the /run-* algorithms) on a worker pool, off the event
+    loop, and records their status, progress and result in a job store.
+
+    With the thread executor, jobs share the API process state
+    (`shared_resources`). With the process executor, jobs must be picklable
+    and self-contained, which the /run-* jobs are not (see
+    `job_manager_from_env`); progress is only recorded when the store is
+    shared with the workers (`RedisJobStore`).
+    """
+
+    def __init__(self, store: Optional[Any] = None, executor: str = "thread", max_workers: int = 1):
+        """
+        Args:
+            store (Optional[Any]): job store. Defaults to an `InMemoryJobStore`
+            executor (str): "thread" or "process"
+            max_workers (int): number of jobs running concurrently
+        """
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unsupported job executor: {executor}")
+        self.store = store if store is not None else InMemoryJobStore()
+        self.executor = executor
+        self.max_workers = max_workers
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                pool_class = ThreadPoolExecutor if self.executor == "thread" else ProcessPoolExecutor
+                self._pool = pool_class(max_workers=self.max_workers)
+            return self._pool
+
+    def _submit(self, name: str, func: Callable, *args, **kwargs) -> Tuple[str, Future]:
+        job_id = uuid.uuid4().hex
+        self.store.create(
+            {
+                "id": job_id,
+                "name": name,
+                "status": QUEUED,
+                "submitted": time.time(),
+                "started": None,
+                "finished": None,
+                "progress": None,
+                "error": None,
+            }
+        )
+        worker_store = self.store if self.executor == "thread" or isinstance(self.store, RedisJobStore) else None
+        if self.executor == "thread":
+            # Run in a copy of the submitter's context, so that the job sees
+            # the session of the request that submitted it
+            context = contextvars.copy_context()
+            future = self.pool.submit(context.run, _run_job, worker_store, job_id, func, args, kwargs)
+        else:
+            future = self.pool.submit(_run_job, worker_store, job_id, func, args, kwargs)
+        future.add_done_callback(lambda f: self._on_done(job_id, f))
+        return job_id, future
+
+    def _on_done(self, job_id: str, future: Future):
+        error = future.exception()
+        if error is None:
+            self.store.set_result(job_id, future.result())
+            self.store.update(job_id, status=FINISHED, finished=time.time())
+        else:
+            self.store.update(job_id, status=FAILED, finished=time.time(), error=_job_error(error))
+
+    def submit(self, name: str, func: Callable, *args, **kwargs) -> str:
+        """Queues `func(*args, **kwargs)` and returns the id of the job."""
+        return self._submit(name, func, *args, **kwargs)[0]
+
+    async def run(self, name: str, func: Callable, *args, background: bool = False, **kwargs) -> Any:
+        """Runs `func(*args, **kwargs)` as a job. If `background`, returns the
+        job id right away, otherwise waits (without blocking the event loop)
+        and returns the result of the job."""
+        job_id, future = self._submit(name, func, *args, **kwargs)
+        if background:
+            return {"job_id": job_id, "status": QUEUED}
+        return await asyncio.wrap_future(future)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        return self.store.list()
+
+    def result(self, job_id: str) -> Any:
+        return self.store.get_result(job_id)
+
+
+def job_manager_from_env() -> JobManager:
+    """Job manager of the /run-* endpoints, configured by the JOB_STORE
+    ("memory" or "redis"), JOB_EXECUTOR and JOB_WORKERS environment variables.
+
+    The /run-* jobs read and write the session state (`shared_resources`) of
+    the API process, so only the "thread" executor is accepted."""
+    executor = os.environ.get("JOB_EXECUTOR", "thread")
+    if executor != "thread":
+        raise ValueError(
+            f"Unsupported JOB_EXECUTOR for the /run-* endpoints: {executor}. "
+            "Their jobs write into the session state of the API process, so they must run on threads."
+        )
+    store = RedisJobStore() if os.environ.get("JOB_STORE", "memory") == "redis" else InMemoryJobStore()
+    return JobManager(
+        store=store,
+        executor=executor,
+        max_workers=int(os.environ.get("JOB_WORKERS", 1)),
+    )
@@ -1,5 +1,6 @@
 import pandas as pd
 from methods.globe_ce.datasets import dataset_loader
+from methods.globe_ce.one_hot_segments import OneHotSegments
 import pickle
 import numpy as np
 from app.config import shared_resources
@@ -80,7 +81,7 @@ def load_dataset_and_model_globece(dataset_name,model_name):
     return dataset , X_test, B, normalise
 
 
-def round_categorical(cf,features,features_tree):
+def round_categorical(cf,features,features_tree,out=None):
         """
         This function is used after the optimization to compute the actual counterfactual
         Currently not implemented for optimization: argmax will likely break gradient descent
@@ -88,17 +89,7 @@ def round_categorical(cf,features,features_tree):
         Input: counterfactuals computed using x_aff + global translation
         Output: valid counterfactuals where one_hot encodings are integers (0 or 1), not floats
         """
-        ret = np.zeros(cf.shape)
-        i = 0
-        for feature in features:  # requires list to maintain correct order
-            if not features_tree[feature]:
-                ret[:, i] = cf[:, i]
-                i += 1
-            else:
-                n = len(features_tree[feature])
-                ret[np.arange(ret.shape[0]), i+np.argmax(cf[:, i:i+n], axis=1)] = 1
-                i += n
-        return ret
+        return OneHotSegments(features, features_tree).round(cf, out=out)
 
 def prepare_globece_data(dataset):
     for name in dataset.columns:
@@ -0,0 +1,306 @@
+import contextvars
+import copy
+import os
+import pickle
+import re
+import shutil
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_SESSION = "default"
+SESSION_HEADER = "X-Session-Id"
+SESSION_COOKIE = "session_id"
+
+_current_session: contextvars.ContextVar = contextvars.ContextVar("current_session", default=DEFAULT_SESSION)
+
+
+def set_current_session(token: str) -> contextvars.Token:
+    """Makes `shared_resources` resolve to the session `token` in the current
+    context (request, or job running on its behalf)."""
+    return _current_session.set(token)
+
+
+def reset_current_session(reset_token: contextvars.Token):
+    _current_session.reset(reset_token)
+
+
+def current_session() -> str:
+    return _current_session.get()
+
+
+def new_session_token() -> str:
+    return uuid.uuid4().hex
+
+
+def valid_session_token(token: str) -> bool:
+    # Tokens name the spill directory of the session
+    return re.fullmatch(r"[A-Za-z0-9_-]{1,64}", token) is not None
+
+
+def object_size(value: Any, _depth: int = 0) -> int:
+    """Approximate memory footprint of a session value, in bytes."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return sys.getsizeof(value)
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (str, bytes)):
+        return sys.getsizeof(value)
+    if _depth < 3 and isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            object_size(k, _depth + 1) + object_size(v, _depth + 1) for k, v in value.items()
+        )
+    if _depth < 3 and isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(object_size(v, _depth + 1) for v in value)
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+class _Spilled:
+    """Placeholder of a session value evicted to disk."""
+
+    __slots__ = ("path", "size")
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+
+
+class SessionState(MutableMapping):
+    """Key-value state of one session. Values are accounted for in memory
+    when set. When the session grows beyond `max_bytes`, its least recently
+    used values larger than `spill_min_bytes` are pickled to `spill_dir` and
+    transparently loaded back on access.
+
+    Values are accounted when set: in-place changes to a stored object (e.g.
+    adding a column to a DataFrame) are only reflected by `memory_usage(refresh=True)`.
+    """
+
+    def __init__(self, spill_dir: str, max_bytes: int, spill_min_bytes: int, values: Optional[Dict[str, Any]] = None):
+        self.spill_dir = spill_dir
+        self.max_bytes = max_bytes
+        self.spill_min_bytes = spill_min_bytes
+        self.last_access = time.time()
+        self._values: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        for key, value in (values or {}).items():
+            self[key] = value
+
+    def __getitem__(self, key: str) -> Any:
+        with self._lock:
+            value = self._values[key]
+            if isinstance(value, _Spilled):
+                with open(value.path, "rb") as f:
+                    value = pickle.load(f)
+                os.remove(self._values[key].path)
+                self._values[key] = value
+                self._sizes[key] = object_size(value)
+                self._spill(keep=key)
+            self._values.move_to_end(key)
+            return value
+
+    def __setitem__(self, key: str, value: Any):
+        with self._lock:
+            self._discard_spilled(key)
+            self._values[key] = value
+            self._values.move_to_end(key)
+            self._sizes[key] = object_size(value)
+            self._spill(keep=key)
+
+    def __delitem__(self, key: str):
+        with self._lock:
+            self._discard_spilled(key)
+            del self._values[key]
+            del self._sizes[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._values))
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def _discard_spilled(self, key: str):
+        value = self._values.get(key)
+        if isinstance(value, _Spilled) and os.path.exists(value.path):
+            os.remove(value.path)
+
+    def _in_memory_bytes(self) -> int:
+        return sum(size for key, size in self._sizes.items() if not isinstance(self._values[key], _Spilled))
+
+    def _spill(self, keep: Optional[str] = None):
+        """Evicts least recently used large values to disk until the session
+        fits in `max_bytes`. Values that cannot be pickled stay in memory."""
+        in_memory = self._in_memory_bytes()
+        if in_memory <= self.max_bytes:
+            return
+        for key in list(self._values):
+            if in_memory <= self.max_bytes:
+                break
+            value, size = self._values[key], self._sizes[key]
+            if key == keep or isinstance(value, _Spilled) or size < self.spill_min_bytes:
+                continue
+            os.makedirs(self.spill_dir, exist_ok=True)
+            path = os.path.join(self.spill_dir, f"{uuid.uuid4().hex}.pkl")
+            try:
+                with open(path, "wb") as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                if os.path.exists(path):
+                    os.remove(path)
+                continue
+            self._values[key] = _Spilled(path, size)
+            in_memory -= size
+
+    def memory_usage(self, refresh: bool = False) -> Dict[str, Any]:
+        """Bytes used by the session in memory and on disk, per key."""
+        with self._lock:
+            if refresh:
+                for key, value in self._values.items():
+                    if not isinstance(value, _Spilled):
+                        self._sizes[key] = object_size(value)
+            spilled = {key for key, value in self._values.items() if isinstance(value, _Spilled)}
+            return {
+                "memory_bytes": sum(size for key, size in self._sizes.items() if key not in spilled),
+                "disk_bytes": sum(self._sizes[key] for key in spilled),
+                "keys": {
+                    key: {"bytes": size, "on_disk": key in spilled}
+                    for key, size in self._sizes.items()
+                },
+            }
+
+    def close(self):
+        """Removes the values of the session spilled to disk."""
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+
+class SessionStore:
+    """Session-scoped state. The default session, shared by clients without
+    a session token, is always kept. Besides it, at most `max_sessions`
+    sessions are kept; when a new session is created, the least recently used
+    one is dropped. Every new session starts from a copy of `defaults`.
+    """
+
+    def __init__(
+        self,
+        defaults: Dict[str, Any],
+        max_sessions: int = 16,
+        max_session_bytes: int = 1 * 2**30,
+        spill_min_bytes: int = 16 * 2**20,
+        spill_dir: str = os.path.join("cache", "sessions"),
+    ):
+        """
+        Args:
+            defaults (Dict[str, Any]): initial state of every session
+            max_sessions (int): maximum number of live sessions
+            max_session_bytes (int): in-memory size of a session above which its large values are evicted to disk
+            spill_min_bytes (int): minimum size of a value evicted to disk
+            spill_dir (str): directory of the values evicted to disk
+        """
+        self.defaults = defaults
+        self.max_sessions = max_sessions
+        self.max_session_bytes = max_session_bytes
+        self.spill_min_bytes = spill_min_bytes
+        self.spill_dir = spill_dir
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._default: Optional[SessionState] = None
+        self._lock = threading.Lock()
+
+    def _new_session(self, token: str) -> SessionState:
+        return SessionState(
+            os.path.join(self.spill_dir, token),
+            self.max_session_bytes,
+            self.spill_min_bytes,
+            copy.deepcopy(self.defaults),
+        )
+
+    def get(self, token: str) -> SessionState:
+        with self._lock:
+            if token == DEFAULT_SESSION:
+                # Not part of the LRU, so that token sessions never evict it
+                if self._default is None:
+                    self._default = self._new_session(token)
+                session = self._default
+            else:
+                session = self._sessions.get(token)
+                if session is None:
+                    session = self._new_session(token)
+                    self._sessions[token] = session
+                    while len(self._sessions) > self.max_sessions:
+                        _, evicted = self._sessions.popitem(last=False)
+                        evicted.close()
+                self._sessions.move_to_end(token)
+            session.last_access = time.time()
+            return session
+
+    def create(self) -> str:
+        """Creates a session under a new random token and returns the token.
+        Tokens are only issued here, so that clients cannot pick the names of
+        other clients' sessions."""
+        token = new_session_token()
+        self.get(token)
+        return token
+
+    def exists(self, token: str) -> bool:
+        with self._lock:
+            return token == DEFAULT_SESSION or token in self._sessions
+
+    def delete(self, token: str):
+        if token == DEFAULT_SESSION:
+            raise ValueError("The default session cannot be deleted")
+        with self._lock:
+            session = self._sessions.pop(token, None)
+        if session is not None:
+            session.close()
+
+    def memory_usage(self) -> Dict[str, Any]:
+        """Totals over all live sessions. Session tokens are not reported."""
+        with self._lock:
+            sessions = list(self._sessions.values()) + ([self._default] if self._default is not None else [])
+        usages = [session.memory_usage(refresh=True) for session in sessions]
+        return {
+            "live_sessions": len(sessions),
+            "max_sessions": self.max_sessions,
+            "memory_bytes": sum(usage["memory_bytes"] for usage in usages),
+            "disk_bytes": sum(usage["disk_bytes"] for usage in usages),
+        }
+
+
+class SessionProxy(MutableMapping):
+    """Dict-like view of the state of the current session, so that code can
+    keep using `shared_resources[...]` while every session gets its own."""
+
+    def __init__(self, store: SessionStore):
+        self.store = store
+
+    @property
+    def session(self) -> SessionState:
+        return self.store.get(current_session())
+
+    def __getitem__(self, key: str) -> Any:
+        return self.session[key]
+
+    def __setitem__(self, key: str, value: Any):
+        self.session[key] = value
+
+    def __delitem__(self, key: str):
+        del self.session[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.session)
+
+    def __len__(self) -> int:
+        return len(self.session)
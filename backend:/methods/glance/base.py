@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from typing import List, Optional
 import pandas as pd
 import numpy as np
 
@@ -75,6 +76,41 @@ class LocalCounterfactualMethod(ABC):
         """
         pass
 
+    def explain_instances_batch(
+        self,
+        instances_list: List[pd.DataFrame],
+        num_counterfactuals: int,
+        random_seeds: Optional[List[int]] = None,
+    ) -> List[pd.DataFrame]:
+        """
+        Find the local counterfactuals for each of several groups of instances.
+
+        The default implementation explains each group separately. Methods that
+        can explain many instances in a single call (e.g. DiCE) override it.
+
+        Parameters:
+        - instances_list (List[pd.DataFrame]): Groups of input instances.
+        - num_counterfactuals (int): Number of counterfactuals to generate for each instance.
+        - random_seeds (List[int], optional): If given, the global NumPy random state is seeded with the respective seed while explaining each group, and restored afterwards.
+
+        Returns:
+        - counterfactuals (List[pd.DataFrame]): DataFrame of counterfactual instances for each group.
+        """
+        ret = []
+        for i, instances in enumerate(instances_list):
+            if random_seeds is None:
+                ret.append(self.explain_instances(instances, num_counterfactuals))
+                continue
+            # Methods that draw from the global random state get a reproducible
+            # one, without changing it for the code that runs afterwards
+            state = np.random.get_state()
+            try:
+                np.random.seed(random_seeds[i])
+                ret.append(self.explain_instances(instances, num_counterfactuals))
+            finally:
+                np.random.set_state(state)
+        return ret
+
 
 class GlobalCounterfactualMethod(ABC):
     """
@@ -3,30 +3,126 @@ import numpy as np
 import pandas as pd
 
 
+class CounterfactualCost:
+    """Array-based L1 + Hamming cost between instances and counterfactuals.
+
+    Numerical features are divided by the width of `n_bins` equal-width bins
+    over their range in `X` and compared with the L1 distance. Categorical
+    features contribute 1 for every mismatch. Bin widths are stored as a
+    vector, so that costs are computed directly on NumPy arrays. Rows
+    already encoded (numerical values divided by the bin widths, categorical
+    values as integer codes, -1 if missing) are compared one-to-many with
+    `cost_encoded` and pairwise with `pairwise_encoded`, as the C_GLANCE
+    merge queue does.
+
+    Instances of this class are callable with the `(X1, X2) -> pd.Series`
+    signature of the closures previously returned by
+    `build_dist_func_dataframe`, and can be used as a drop-in replacement.
+    """
+
+    def __init__(
+        self,
+        X: pd.DataFrame,
+        numerical_columns: List[str],
+        categorical_columns: List[str],
+        n_bins: int = 10,
+    ):
+        """
+        Args:
+            X (pd.DataFrame): data used to compute the bin widths of the numerical features
+            numerical_columns (List[str]): numerical column names
+            categorical_columns (List[str]): categorical column names
+            n_bins (int): number of bins each numerical feature range is split into
+        """
+        self.numerical_columns = list(numerical_columns)
+        self.categorical_columns = list(categorical_columns)
+        self.n_bins = n_bins
+
+        self.feat_intervals = {
+            col: ((max(X[col]) - min(X[col])) / n_bins) for col in self.numerical_columns
+        }
+        self.bin_widths = np.array(
+            [self.feat_intervals[col] for col in self.numerical_columns], dtype=float
+        )
+
+    def encode_numerical(self, X: pd.DataFrame) -> np.ndarray:
+        """Numerical features of `X` divided by their bin widths."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return X[self.numerical_columns].to_numpy(dtype=float) / self.bin_widths
+
+    @staticmethod
+    def cost_encoded(
+        num1: np.ndarray, cat1: np.ndarray, num2: np.ndarray, cat2: np.ndarray
+    ) -> np.ndarray:
+        """Costs between encoded rows, broadcasting along the first axis
+        (i.e. either row-aligned inputs, or a single row against many)."""
+        ret = np.nansum(np.abs(num1 - num2), axis=-1)
+        ret += ((cat1 != cat2) | (cat1 < 0)).sum(axis=-1)
+        return ret
+
+    def rowwise(self, X1: pd.DataFrame, X2: pd.DataFrame) -> np.ndarray:
+        """Cost between the i-th row of `X1` and the i-th row of `X2`, by position."""
+        assert X1.shape[0] == X2.shape[0]
+        ret = np.nansum(
+            np.abs(self.encode_numerical(X1) - self.encode_numerical(X2)), axis=1
+        )
+        # Row-aligned mismatches need no integer codes
+        ret += (
+            X1[self.categorical_columns].to_numpy() != X2[self.categorical_columns].to_numpy()
+        ).sum(axis=1)
+        return ret
+
+    @staticmethod
+    def pairwise_encoded(
+        num1: np.ndarray,
+        cat1: np.ndarray,
+        num2: np.ndarray,
+        cat2: np.ndarray,
+        max_chunk_elements: int = 50_000_000,
+    ) -> np.ndarray:
+        """Matrix of costs between every encoded row of the first and of the
+        second set, computed in chunks of rows of the first set so that the
+        intermediate arrays have at most `max_chunk_elements` elements."""
+        n1, n2 = num1.shape[0], num2.shape[0]
+        ret = np.empty((n1, n2))
+        row_elements = max(1, n2 * max(num1.shape[1], cat1.shape[1], 1))
+        chunk = max(1, max_chunk_elements // row_elements)
+        for start in range(0, n1, chunk):
+            end = min(start + chunk, n1)
+            ret[start:end] = CounterfactualCost.cost_encoded(
+                num1[start:end, None, :], cat1[start:end, None, :], num2[None], cat2[None]
+            )
+        return ret
+
+    def _dist_f_dataframe(self, X1: pd.DataFrame, X2: pd.DataFrame) -> pd.Series:
+        X1 = X1.copy()
+        X2 = X2.copy()
+        for col in self.numerical_columns:
+            X1[col] /= self.feat_intervals[col]
+            X2[col] /= self.feat_intervals[col]
+
+        ret = (X1[self.numerical_columns] - X2[self.numerical_columns]).abs().sum(axis="columns")
+        ret += (X1[self.categorical_columns] != X2[self.categorical_columns]).astype(int).sum(axis="columns")
+
+        return ret
+
+    def __call__(self, X1: pd.DataFrame, X2: pd.DataFrame) -> pd.Series:
+        # Rows are matched by index label, as in pandas arithmetic. Only
+        # frames with differing indexes need the label-aligned pandas path.
+        if not X1.index.equals(X2.index):
+            return self._dist_f_dataframe(X1, X2)
+        return pd.Series(self.rowwise(X1, X2), index=X1.index)
+
+
 def build_dist_func_dataframe(
     X: pd.DataFrame,
     numerical_columns: List[str],
     categorical_columns: List[str],
     n_bins: int = 10,
 ) -> Callable[[pd.DataFrame, pd.DataFrame], pd.Series]:
-    feat_intervals = {
-        col: ((max(X[col]) - min(X[col])) / n_bins) for col in numerical_columns
-    }
-
-    def bin_numericals(instances: pd.DataFrame):
-        ret = instances.copy()
-        for col in numerical_columns:
-            ret[col] /= feat_intervals[col]
-        return ret
-    
-    def dist_f(X1: pd.DataFrame, X2: pd.DataFrame) -> pd.Series:
-        X1 = bin_numericals(X1)
-        X2 = bin_numericals(X2)
-        
-        ret = (X1[numerical_columns] - X2[numerical_columns]).abs().sum(axis="columns")
-        ret += (X1[categorical_columns] != X2[categorical_columns]).astype(int).sum(axis="columns")
-
-        return ret
-    
-    return dist_f
-
+    return CounterfactualCost(
+        X,
+        numerical_columns=numerical_columns,
+        categorical_columns=categorical_columns,
+        n_bins=n_bins,
+    )
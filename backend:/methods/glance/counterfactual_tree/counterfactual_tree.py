@@ -1,14 +1,20 @@
 from typing import Union, Any, List, Optional, Dict, Tuple, Callable
+import copy
+from joblib import Parallel, delayed, effective_n_jobs
+import joblib
 from ..base import GlobalCounterfactualMethod, LocalCounterfactualMethod
 from ..iterative_merges.iterative_merges import C_GLANCE, _select_action_max_eff
 import pandas as pd
 from ..utils.metadata_requests import _decide_local_cf_method
+from ..local_cfs.cached_method import CounterfactualCache
 from ..utils.centroid import centroid_pandas
 from ..utils.action import extract_actions_pandas, apply_action_pandas
-from sklearn.inspection import permutation_importance
+from ..utils.feature_importance import FeatureImportanceCache, permutation_importances
+from ..utils.fingerprint import model_fingerprint, object_token, dataframe_fingerprint
 from ..iterative_merges.iterative_merges import cumulative
 from ..counterfactual_costs import build_dist_func_dataframe
 from .node import Node
+from .subgroup_cache import SubgroupCache, SubgroupResult
 import numpy as np
 from tqdm import tqdm
 
@@ -24,6 +30,8 @@ class T_GLANCE:
         global_method: Union[GlobalCounterfactualMethod, str] = None,
         local_method: Union[LocalCounterfactualMethod, str] = None,
         num_local_counterfactuals: int = 100,
+        n_jobs: Optional[int] = None,
+        parallel_backend: str = "loky",
     ):
         self.model = model
         self.split_features = split_features
@@ -32,6 +40,11 @@ class T_GLANCE:
         self.global_method = global_method
         self.local_method = local_method
         self.num_local_counterfactuals = num_local_counterfactuals
+        # Subgroups of a node are evaluated concurrently by `n_jobs` workers.
+        # Processes by default: DiCE reseeds the global numpy generator, so
+        # the "threading" backend is only deterministic for other local methods.
+        self.n_jobs = n_jobs
+        self.parallel_backend = parallel_backend
 
     def fit(
         self,
@@ -42,28 +55,28 @@ class T_GLANCE:
         random_seed: int = 13,
         numeric_features_names: Optional[List[str]] = None,
         categorical_features_names: Optional[List[str]] = None,
+        cf_cache: Optional[CounterfactualCache] = None,
+        importance_cache: Optional[FeatureImportanceCache] = None,
+        importance_max_samples: Optional[int] = None,
+        importance_n_jobs: Optional[int] = None,
+        subgroup_cache: Optional[SubgroupCache] = None,
     ):
-        if self.split_features == None:
-            perm_importance = permutation_importance(
-                self.model, X, y, n_repeats=30, random_state=42
-            )
-
-            feature_names = X.columns
+        if self.split_features == None or isinstance(self.split_features, int):
+            # Importances are computed once per model and dataset, see `permutation_importances`
+            mean_importance = permutation_importances(
+                self.model,
+                X,
+                y,
+                n_repeats=30,
+                random_state=42,
+                max_samples=importance_max_samples,
+                n_jobs=importance_n_jobs,
+                cache=importance_cache,
+            ).to_numpy()
 
-            mean_importance = perm_importance.importances_mean
-            top_indices = mean_importance.argsort()[-2:][::-1]
-            top_features = feature_names[top_indices]
-
-            self.split_features = list(top_features)
-        elif isinstance(self.split_features, int):
-            perm_importance = permutation_importance(
-                self.model, X, y, n_repeats=30, random_state=42
-            )
-            
             feature_names = X.columns
-
-            mean_importance = perm_importance.importances_mean
-            top_indices = mean_importance.argsort()[-self.split_features:][::-1]
+            n_split_features = 2 if self.split_features == None else self.split_features
+            top_indices = mean_importance.argsort()[-n_split_features:][::-1]
             top_features = feature_names[top_indices]
 
             self.split_features = list(top_features)
@@ -107,6 +120,8 @@ class T_GLANCE:
             categorical_features_names=self.categorical_features_names,
             feat_to_vary=self.feat_to_vary,
             random_seed=random_seed,
+            cf_cache=cf_cache,
+            importance_cache=importance_cache,
         )
 
         if self.global_method == None and self.local_method == None:
@@ -120,7 +135,7 @@ class T_GLANCE:
                 raise ValueError(
                     "You need to pass train_dataset for Dice if you want default C_GLANCE."
                 )
-            self.cf_generator.fit(X, y, self.train_dataset)
+            self.cf_generator.fit(X, y, self.train_dataset, cf_cache=cf_cache, importance_cache=importance_cache)
         elif self.global_method != None:
             self.generation_method = "Global"
             if self.partition_counterfactuals == None:
@@ -131,6 +146,24 @@ class T_GLANCE:
             if self.partition_counterfactuals == None:
                 self.partition_counterfactuals = 1
 
+        # Subgroup results depend on the model, the data and the parameters of
+        # the tree, so that trees that share a cache only reuse their own results.
+        self.subgroup_cache = subgroup_cache if subgroup_cache is not None else SubgroupCache()
+        self._config_fingerprint = joblib.hash((
+            model_fingerprint(self.model) or object_token(self.model),
+            dataframe_fingerprint(X),
+            dataframe_fingerprint(train_dataset) if train_dataset is not None else None,
+            self.generation_method,
+            model_fingerprint(self.global_method) or object_token(self.global_method),
+            model_fingerprint(self.local_method) or object_token(self.local_method),
+            self.partition_counterfactuals,
+            self.num_local_counterfactuals,
+            feat_to_vary,
+            random_seed,
+            self.numerical_features_names,
+            self.categorical_features_names,
+        ))
+
     def _local_group_eff_cost(self, instances):
         centroid = centroid_pandas(
             instances,
@@ -166,7 +199,7 @@ class T_GLANCE:
         if type(actions_info) is not list:
             actions_info = [actions_info]
         actions = [action for _, _, action in actions_info]
-        eff, cost, pred_list, action_list = cumulative(
+        eff, cost, *_ = cumulative(
             self.model,
             instances,
             actions,
@@ -174,6 +207,7 @@ class T_GLANCE:
             self.numerical_features_names,
             self.categorical_features_names,
             "-",
+            keep_details=False,
         )
         return eff, cost, actions
 
@@ -189,18 +223,49 @@ class T_GLANCE:
             if clusters < self.partition_counterfactuals:
                 return self._local_group_eff_cost(instances)
             else:
-                self.cf_generator.initial_clusters = clusters
-                clusters, cluster_res , eff, cost = self.cf_generator.explain_group(instances)
-                actions = self.cf_generator.global_actions()
+                # explain_group keeps its results on the generator, so every
+                # subgroup gets its own copy
+                cf_generator = copy.copy(self.cf_generator)
+                cf_generator.initial_clusters = clusters
+                clusters, cluster_res , eff, cost = cf_generator.explain_group(instances)
+                actions = cf_generator.global_actions()
         elif self.generation_method == 'Global':
-            eff, cost = self.cf_generator.explain_group(instances)
-            actions = self.cf_generator.global_actions()
+            cf_generator = copy.copy(self.cf_generator)
+            eff, cost = cf_generator.explain_group(instances)
+            actions = cf_generator.global_actions()
         else:
             raise ValueError("Generation method does not exist")
             
 
         return eff, cost, actions
 
+    def _evaluate_groups(self, groups: List[pd.DataFrame]) -> List[SubgroupResult]:
+        """`_group_eff_cost` of every group, served from `subgroup_cache`
+        when possible. Groups missing from the cache are evaluated once each,
+        concurrently if `n_jobs` allows it."""
+        keys = [SubgroupCache.key(self._config_fingerprint, group) for group in groups]
+        results = {key: self.subgroup_cache.get(key) for key in keys}
+        missing = {key: group for key, group in zip(keys, groups) if results[key] is None}
+
+        if len(missing) > 0:
+            missing_keys, missing_groups = list(missing.keys()), list(missing.values())
+            n_workers = effective_n_jobs(self.n_jobs) if self.n_jobs is not None else 1
+            if n_workers > 1 and len(missing) > 1:
+                # All groups are dispatched at once, so a worker picks up the
+                # next group as soon as it is done with one
+                evaluated = Parallel(n_jobs=self.n_jobs, backend=self.parallel_backend, return_as="generator")(
+                    delayed(self._group_eff_cost)(group) for group in missing_groups
+                )
+            else:
+                evaluated = (self._group_eff_cost(group) for group in missing_groups)
+            with tqdm(total=len(missing), desc="Evaluating subgroups") as progress_bar:
+                for key, result in zip(missing_keys, evaluated):
+                    self.subgroup_cache.set(key, result)
+                    results[key] = result
+                    progress_bar.update(1)
+
+        return [results[key] for key in keys]
+
     def partition_group(self, instances: pd.DataFrame):
 
         def _partition_group(
@@ -208,7 +273,7 @@ class T_GLANCE:
         ):
 
             if eff_prec == None:
-                eff_node, cost_node, actions = self._group_eff_cost(group)
+                eff_node, cost_node, actions = self._evaluate_groups([group])[0]
             else:
                 eff_node, cost_node, actions = eff_prec, cost_prec, actions_prec
 
@@ -217,26 +282,33 @@ class T_GLANCE:
             )
             possible_splits = []
 
+            # The children of all candidate splits are evaluated in one batch
+            candidates = []
             for feature in split_features:
-                eff_children, cost_children = 0, 0
-                children_info = []
-
                 for feature_split_values in self.split_values[feature]:
                     split_df = group[group[feature].isin(feature_split_values)]
-
                     if not split_df.empty:
-                        eff_child, cost_child, actions = self._group_eff_cost(split_df)
-                        eff_children += eff_child
-                        cost_children += cost_child
-                        children_info.append(
-                            (
-                                feature_split_values,
-                                split_df,
-                                eff_child,
-                                cost_child,
-                                actions,
-                            )
+                        candidates.append((feature, feature_split_values, split_df))
+            results = self._evaluate_groups([split_df for _, _, split_df in candidates])
+
+            for feature in split_features:
+                eff_children, cost_children = 0, 0
+                children_info = []
+
+                for (candidate_feature, feature_split_values, split_df), (eff_child, cost_child, actions) in zip(candidates, results):
+                    if candidate_feature != feature:
+                        continue
+                    eff_children += eff_child
+                    cost_children += cost_child
+                    children_info.append(
+                        (
+                            feature_split_values,
+                            split_df,
+                            eff_child,
+                            cost_child,
+                            actions,
                         )
+                    )
 
                 possible_splits.append(
                     (feature, eff_children, cost_children, children_info)
@@ -259,12 +331,13 @@ class T_GLANCE:
 
             return node
 
-        self.node = _partition_group(instances, self.split_features)
+        # A copy, so that the tree can be partitioned again
+        self.node = _partition_group(instances, list(self.split_features))
         self.node_instances = instances
         return self.node
 
     def cumulative_leaf_actions(self):
-        eff, cost, list_eff, action_list = cumulative(
+        eff, cost, *_ = cumulative(
             self.model,
             self.node_instances,
             self.node.return_leafs_actions(),
@@ -272,6 +345,7 @@ class T_GLANCE:
             self.numerical_features_names,
             self.categorical_features_names,
             categorical_no_action_token="-",
+            keep_details=False,
         )
 
         print(f"\nTOTAL EFFECTIVENESS: {eff / self.node_instances.shape[0]:.2%}")
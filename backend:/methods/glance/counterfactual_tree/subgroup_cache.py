@@ -0,0 +1,67 @@
+from typing import Any, List, Optional, Tuple
+from collections import OrderedDict
+import threading
+
+import joblib
+import pandas as pd
+
+from ..utils.fingerprint import dataframe_fingerprint
+
+
+# Effectiveness, cost and actions of a subgroup, as returned by `T_GLANCE._group_eff_cost`
+SubgroupResult = Tuple[Any, Any, List[pd.Series]]
+
+
+class SubgroupCache:
+    """In-memory store of the results of `T_GLANCE._group_eff_cost`, keyed by
+    the rows of the subgroup and the configuration of the tree (at most
+    `max_entries`, least recently used first out). The cache is safe to share
+    between threads and between trees; trees with different models, data or
+    parameters get different keys. When pickled, e.g. to be sent to a worker
+    process, the cache is re-created empty.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        """
+        Args:
+            max_entries (int): maximum number of subgroup results kept
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, SubgroupResult]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Worker processes start empty; their results are stored by the parent
+        return {"max_entries": self.max_entries}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @staticmethod
+    def key(config_fingerprint: str, group: pd.DataFrame) -> str:
+        """Key of a subgroup: its row index, in order, and its values, so that
+        equal index sets of different instance frames do not collide."""
+        return joblib.hash((config_fingerprint, group.index.to_numpy(), dataframe_fingerprint(group)))
+
+    def get(self, key: str) -> Optional[SubgroupResult]:
+        with self._lock:
+            value = self._memory.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: SubgroupResult):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
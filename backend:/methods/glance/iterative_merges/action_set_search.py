@@ -0,0 +1,427 @@
+from typing import Callable, List, Optional, Tuple
+import math
+import time
+import warnings
+
+import numpy as np
+from joblib import Parallel, delayed, effective_n_jobs
+from tqdm import tqdm
+
+
+def _sequential_eff_cost(action_individual_costs: np.ndarray) -> Tuple[int, float]:
+    """Effectiveness and cost of applying actions one after the other, each
+    one only to the instances that are not flipped by the previous ones.
+    Columns of `action_individual_costs` should be in application order."""
+    if action_individual_costs.shape[1] == 0:
+        return 0, 0
+    flipped = action_individual_costs != np.inf
+    any_flipped = flipped.any(axis=1)
+    first_flipping = flipped.argmax(axis=1)
+    first_costs = action_individual_costs[np.arange(action_individual_costs.shape[0]), first_flipping]
+
+    return any_flipped.sum(), first_costs[any_flipped].sum()
+
+
+def unrank_combinations(ranks: np.ndarray, n: int, k: int) -> np.ndarray:
+    """Combinations of `k` out of `range(n)` at the given ranks of the order
+    of `itertools.combinations`.
+
+    Args:
+        ranks (np.ndarray): ranks, in [0, comb(n, k))
+        n (int): number of elements
+        k (int): size of the combinations
+
+    Returns:
+        np.ndarray: array of shape (len(ranks), k) of increasing indexes.
+    """
+    ranks = np.array(ranks, dtype=np.int64)
+    ret = np.empty((ranks.shape[0], k), dtype=np.int64)
+    low = np.zeros(ranks.shape[0], dtype=np.int64)
+    for i in range(k):
+        # Number of combinations whose i-th element is at most v, for every v
+        counts = np.array([math.comb(n - v - 1, k - i - 1) for v in range(n)], dtype=np.int64)
+        cumulative_counts = np.concatenate([[0], np.cumsum(counts)])
+        # Ranks are offset by the combinations skipped before `low`
+        targets = ranks + cumulative_counts[low]
+        values = np.searchsorted(cumulative_counts, targets, side="right") - 1
+        ret[:, i] = values
+        ranks = targets - cumulative_counts[values]
+        low = values + 1
+    return ret
+
+
+def evaluate_combination_block(
+    action_costs: np.ndarray,
+    combinations: np.ndarray,
+    sequential: bool = False,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Number of flipped instances and total cost of a block of action sets,
+    with vectorized reductions over the cost matrix.
+
+    Args:
+        action_costs (np.ndarray): transposed cost matrix, of shape
+            (n_candidate_actions, n_instances), so that the costs of an action are contiguous
+        combinations (np.ndarray): action indexes of shape (n_sets, n_actions)
+        sequential (bool): see `ActionSetSearch`
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: number of flipped instances and total
+        cost of every set. Costs may differ from `ActionSetSearch.evaluate`
+        in the last bits, as they are summed in a different order.
+    """
+    def combine(instance_costs: np.ndarray, next_costs: np.ndarray) -> np.ndarray:
+        if sequential:
+            return np.where(instance_costs == np.inf, next_costs, instance_costs)
+        return np.minimum(instance_costs, next_costs, out=next_costs)
+
+    # Consecutive sets mostly share all but their last action: the costs of
+    # these prefixes are computed once
+    new_prefix = np.ones(combinations.shape[0], dtype=bool)
+    new_prefix[1:] = (combinations[1:, :-1] != combinations[:-1, :-1]).any(axis=1)
+    prefixes = combinations[new_prefix, :-1]
+    prefix_costs = np.full((prefixes.shape[0], action_costs.shape[1]), np.inf)
+    for i in range(prefixes.shape[1]):
+        prefix_costs = combine(prefix_costs, action_costs[prefixes[:, i]])
+    instance_costs = combine(prefix_costs[np.cumsum(new_prefix) - 1], action_costs[combinations[:, -1]])
+    flipped = instance_costs != np.inf
+    instance_costs[~flipped] = 0
+    return flipped.sum(axis=1), instance_costs.sum(axis=1)
+
+
+def _search_rank_range(
+    action_costs: np.ndarray,
+    n_actions: int,
+    min_flipped: int,
+    sequential: bool,
+    start: int,
+    end: int,
+    block_size: int,
+    bound: float,
+) -> np.ndarray:
+    """Action sets of ranks [start, end) that are effective and may cost at
+    most `bound` or the cheapest of them, up to rounding."""
+    n_candidates = action_costs.shape[0]
+    kept, kept_costs = [], []
+    for block_start in range(start, end, block_size):
+        combinations = unrank_combinations(
+            np.arange(block_start, min(block_start + block_size, end)), n_candidates, n_actions
+        )
+        # Sets of the block only use these actions: skip the block if even all
+        # of them cannot flip enough instances, or only at a higher cost
+        block_min = action_costs[np.unique(combinations)].min(axis=0)
+        block_min = block_min[block_min != np.inf]
+        if block_min.shape[0] < min_flipped:
+            continue
+        if min_flipped > 0 and (
+            np.partition(block_min, min_flipped - 1)[:min_flipped].sum() > bound + 1e-9 * max(1.0, abs(bound))
+        ):
+            continue
+
+        n_flipped, cost_sums = evaluate_combination_block(action_costs, combinations, sequential)
+        effective = n_flipped >= min_flipped
+        if not effective.any():
+            continue
+        bound = min(bound, cost_sums[effective].min())
+        keep = effective & (cost_sums <= bound + 1e-9 * max(1.0, abs(bound)))
+        kept.append(combinations[keep])
+        kept_costs.append(cost_sums[keep])
+
+    if len(kept) == 0:
+        return np.empty((0, n_actions), dtype=np.int64)
+    kept, kept_costs = np.concatenate(kept), np.concatenate(kept_costs)
+    return kept[kept_costs <= bound + 1e-9 * max(1.0, abs(bound))]
+
+
+class ActionSetSearch:
+    """Branch-and-bound search of the set of `n_actions` actions with the
+    lowest total recourse cost among the sets whose number of flipped
+    instances is accepted by `is_effective`.
+
+    Actions are the columns of an instance x action cost matrix (`np.inf`
+    where an action does not flip an instance), computed once. The cost of an
+    instance under a set of actions is either the cost of its cheapest
+    flipping action, or, if `sequential`, the cost of its first flipping
+    action in column order (see `_sequential_eff_cost`).
+
+    Sets are visited in the order of `itertools.combinations`. A subtree is
+    pruned when an upper bound of its number of flipped instances is not
+    effective, or when a lower bound of its cost exceeds the best set found
+    so far. A greedy solution is used as the first incumbent. Ties are broken
+    in favour of the first set in combination order, so that the result
+    equals that of an exhaustive search.
+    """
+
+    def __init__(
+        self,
+        costs: np.ndarray,
+        n_actions: int,
+        is_effective: Callable[[int], bool],
+        sequential: bool = False,
+        time_budget: Optional[float] = None,
+    ):
+        """
+        Args:
+            costs (np.ndarray): cost matrix of shape (n_instances, n_candidate_actions)
+            n_actions (int): number of actions in a set
+            is_effective (Callable[[int], bool]): whether a number of flipped instances is enough; must be monotone
+            sequential (bool): instances take their first flipping action (in column order) instead of the cheapest
+            time_budget (Optional[float]): seconds after which the best set found so far is returned
+        """
+        self.costs = costs
+        self.n_actions = n_actions
+        self.is_effective = is_effective
+        self.sequential = sequential
+        self.time_budget = time_budget
+        self.finite = costs != np.inf
+        n_instances, n_candidates = costs.shape
+        # Cheapest cost of every instance among the actions from column j on
+        self.suffix_min = np.full((n_instances, n_candidates + 1), np.inf)
+        if n_candidates > 0:
+            self.suffix_min[:, :-1] = np.minimum.accumulate(costs[:, ::-1], axis=1)[:, ::-1]
+        self.min_flipped = next(
+            (n for n in range(n_instances + 1) if is_effective(n)), n_instances + 1
+        )
+        self.timed_out = False
+        self.n_nodes = 0
+
+    def evaluate(self, idxs: Tuple[int, ...]) -> Tuple[int, float]:
+        """Number of flipped instances and total cost of a set of actions."""
+        candidate_costs = self.costs[:, list(idxs)]
+        if self.sequential:
+            return _sequential_eff_cost(candidate_costs)
+        min_costs = candidate_costs.min(axis=1)
+        flipped = min_costs != np.inf
+        return flipped.sum(), min_costs[flipped].sum()
+
+    def _greedy(self) -> Optional[Tuple[int, ...]]:
+        """Adds, one at a time, the action that most reduces the missing
+        flipped instances, then the total cost."""
+        selected: List[int] = []
+        for _ in range(self.n_actions):
+            best, best_key = None, None
+            for j in range(self.costs.shape[1]):
+                if j in selected:
+                    continue
+                n_flipped, cost_sum = self.evaluate(tuple(sorted(selected + [j])))
+                key = (max(0, self.min_flipped - n_flipped), cost_sum)
+                if best_key is None or key < best_key:
+                    best, best_key = j, key
+            if best is None:
+                return None
+            selected.append(best)
+        return tuple(sorted(selected))
+
+    def _extend(self, flipped: np.ndarray, current: np.ndarray, j: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Flipped instances and their costs after adding column `j` to a set
+        of columns before it."""
+        if self.sequential:
+            return flipped | self.finite[:, j], np.where(flipped, current, self.costs[:, j])
+        return flipped | self.finite[:, j], np.minimum(current, self.costs[:, j])
+
+    def _bounds(self, flipped: np.ndarray, current: np.ndarray, start: int, n_left: int) -> Tuple[int, float]:
+        """Upper bound of the number of flipped instances and lower bound of
+        the cost of the sets completed with `n_left` actions from column `start` on."""
+        n_flipped = int(flipped.sum())
+        remaining_min = self.suffix_min[:, start]
+        unflipped_min = remaining_min[~flipped]
+        n_flippable = n_flipped + int((unflipped_min != np.inf).sum())
+        if n_flippable >= self.min_flipped and n_left > 0:
+            new_flips = self.finite[~flipped, start:].sum(axis=0)
+            if new_flips.shape[0] > n_left:
+                new_flips = np.partition(new_flips, -n_left)[-n_left:]
+            n_flippable = min(n_flippable, n_flipped + int(new_flips.sum()))
+
+        # Flipped instances keep their cost (sequential) or at least their
+        # cheapest available one, and enough new instances must be flipped,
+        # at their cheapest cost
+        if self.sequential:
+            cost = current[flipped].sum()
+        else:
+            cost = np.minimum(current[flipped], remaining_min[flipped]).sum()
+        n_missing = self.min_flipped - n_flipped
+        if n_missing > 0:
+            unflipped_min = unflipped_min[unflipped_min != np.inf]
+            if unflipped_min.shape[0] > n_missing:
+                unflipped_min = np.partition(unflipped_min, n_missing - 1)[:n_missing]
+            cost += unflipped_min.sum()
+        return n_flippable, cost
+
+    def search(self, progress: bool = False) -> Optional[Tuple[int, float, Tuple[int, ...]]]:
+        """
+        Args:
+            progress (bool): whether to report the explored choices of the first action with tqdm
+
+        Returns:
+            Optional[Tuple[int, float, Tuple[int, ...]]]: number of flipped
+            instances, total cost and (increasing) column indexes of the best
+            effective set, or None if there is none.
+        """
+        n_instances, n_candidates = self.costs.shape
+        if n_candidates < self.n_actions or self.min_flipped > n_instances:
+            return None
+        self._deadline = time.perf_counter() + self.time_budget if self.time_budget is not None else None
+        self.timed_out = False
+        self.n_nodes = 0
+        self.best = None
+        greedy = self._greedy()
+        if greedy is not None:
+            self._offer(greedy)
+
+        n_first = n_candidates - self.n_actions + 1
+        with tqdm(total=n_first, desc="Action set search", disable=not progress) as self._progress_bar:
+            self._search((), np.zeros(n_instances, dtype=bool), np.full(n_instances, np.inf), 0)
+            # Pruned first actions are explored too
+            self._progress_bar.update(n_first - self._progress_bar.n)
+        if self.timed_out:
+            warnings.warn(
+                f"Action set search stopped after its time budget of {self.time_budget}s; the best set found so far is returned."
+            )
+        return self.best
+
+    def enumerate(
+        self,
+        block_size: Optional[int] = None,
+        n_jobs: Optional[int] = None,
+        progress: bool = False,
+        max_elements: int = 2**18,
+        parallel_backend: str = "loky",
+    ) -> Optional[Tuple[int, float, Tuple[int, ...]]]:
+        """Exhaustive alternative to `search`: action sets are ranked in
+        combination order and evaluated in contiguous blocks of ranks with
+        vectorized reductions.
+
+        Blocks are spread over `n_jobs` workers in rounds. Every round starts
+        from the cost of the best set found so far, which lets workers skip
+        blocks that cannot beat it and only return the sets that may tie it;
+        these are evaluated exactly, so the result equals that of `search`.
+
+        Args:
+            block_size (Optional[int]): number of sets per block; by default
+                as many as fit in `max_elements` gathered costs
+            n_jobs (Optional[int]): number of workers; None evaluates blocks in the calling process
+            progress (bool): whether to report the evaluated sets with tqdm
+            max_elements (int): default size of the gathered cost arrays of a block
+            parallel_backend (str): joblib backend of the workers
+
+        Returns:
+            Optional[Tuple[int, float, Tuple[int, ...]]]: see `search`.
+        """
+        n_instances, n_candidates = self.costs.shape
+        if n_candidates < self.n_actions or self.min_flipped > n_instances:
+            return None
+        self._deadline = time.perf_counter() + self.time_budget if self.time_budget is not None else None
+        self.timed_out = False
+        self.best = None
+        greedy = self._greedy()
+        if greedy is not None:
+            self._offer(greedy)
+        if self.n_actions == 0:
+            self._offer(())
+            return self.best
+
+        n_sets = math.comb(n_candidates, self.n_actions)
+        if n_sets >= 2**63:
+            raise ValueError("Too many action sets to enumerate, use the branch-and-bound search")
+        if block_size is None:
+            block_size = max(1, max_elements // max(1, n_instances))
+        n_workers = effective_n_jobs(n_jobs) if n_jobs is not None else 1
+        # Rounds are long enough to amortize dispatching, short enough to share bounds
+        round_size = block_size * n_workers * 8
+
+        action_costs = np.ascontiguousarray(self.costs.T)
+        parallel = Parallel(n_jobs=n_jobs, backend=parallel_backend) if n_workers > 1 else None
+        with tqdm(total=n_sets, disable=not progress) as progress_bar:
+            for round_start in range(0, n_sets, round_size):
+                if self._deadline is not None and time.perf_counter() > self._deadline:
+                    self.timed_out = True
+                    break
+                bound = self.best[1] if self.best is not None else np.inf
+                round_end = min(round_start + round_size, n_sets)
+                ranges = [
+                    (start, min(start + block_size * 8, round_end))
+                    for start in range(round_start, round_end, block_size * 8)
+                ]
+                if parallel is None:
+                    kept = [
+                        _search_rank_range(action_costs, self.n_actions, self.min_flipped, self.sequential, start, end, block_size, bound)
+                        for start, end in ranges
+                    ]
+                else:
+                    kept = parallel(
+                        delayed(_search_rank_range)(
+                            action_costs, self.n_actions, self.min_flipped, self.sequential, start, end, block_size, bound
+                        )
+                        for start, end in ranges
+                    )
+                for combinations in kept:
+                    for combination in combinations:
+                        self._offer(tuple(int(j) for j in combination))
+                progress_bar.update(round_end - round_start)
+
+        if self.timed_out:
+            warnings.warn(
+                f"Action set search stopped after its time budget of {self.time_budget}s; the best set found so far is returned."
+            )
+        return self.best
+
+    def _offer(self, idxs: Tuple[int, ...]):
+        n_flipped, cost_sum = self.evaluate(idxs)
+        if not self.is_effective(n_flipped):
+            return
+        if (
+            self.best is None
+            or cost_sum < self.best[1]
+            or (cost_sum == self.best[1] and idxs < self.best[2])
+        ):
+            self.best = (n_flipped, cost_sum, idxs)
+
+    def _search_last(self, prefix: Tuple[int, ...], flipped: np.ndarray, current: np.ndarray, start: int):
+        """Completes `prefix` with every column from `start` on at once. Only
+        the sets that may beat the best one are evaluated exactly."""
+        candidates = self.costs[:, start:]
+        if self.sequential:
+            completed = np.where(flipped[:, None], current[:, None], candidates)
+        else:
+            completed = np.minimum(current[:, None], candidates)
+        completed_finite = completed != np.inf
+        n_flipped = completed_finite.sum(axis=0)
+        cost_sums = np.where(completed_finite, completed, 0).sum(axis=0)
+        keep = n_flipped >= self.min_flipped
+        if self.best is not None:
+            keep &= cost_sums <= self.best[1] + 1e-9 * max(1.0, abs(self.best[1]))
+        for j in np.flatnonzero(keep):
+            self._offer(prefix + (start + int(j),))
+
+    def _search(self, prefix: Tuple[int, ...], flipped: np.ndarray, current: np.ndarray, start: int):
+        if self.timed_out:
+            return
+        self.n_nodes += 1
+        if self._deadline is not None and self.n_nodes % 64 == 0 and time.perf_counter() > self._deadline:
+            self.timed_out = True
+            return
+
+        n_left = self.n_actions - len(prefix)
+        if n_left == 0:
+            self._offer(prefix)
+            return
+
+        n_flippable, cost_bound = self._bounds(flipped, current, start, n_left)
+        if n_flippable < self.min_flipped:
+            return
+        if self.best is not None:
+            tolerance = 1e-9 * max(1.0, abs(self.best[1]))
+            if cost_bound > self.best[1] + tolerance:
+                return
+            # Sets of this subtree can only tie if they come first in combination order
+            if cost_bound >= self.best[1] - tolerance and prefix > self.best[2][:len(prefix)]:
+                return
+
+        if n_left == 1:
+            self._search_last(prefix, flipped, current, start)
+            return
+        for j in range(start, self.costs.shape[1] - n_left + 1):
+            self._search(prefix + (j,), *self._extend(flipped, current, j), j + 1)
+            if len(prefix) == 0:
+                self._progress_bar.update()
+            if self.timed_out:
+                return
@@ -1,15 +1,11 @@
 from typing import Union, Any, List, Optional, Dict, Tuple, Callable, Literal
-import math
 import numbers
-import itertools
-from tqdm import tqdm
 import warnings
 from colorama import Fore, Style
-
+from tqdm import tqdm
 import numpy as np
 import pandas as pd
 
-from scipy.cluster.hierarchy import DisjointSet
 from sklearn.preprocessing import OneHotEncoder
 from sklearn.compose import ColumnTransformer
 
@@ -17,14 +13,21 @@ from IPython.display import display
 from ..base import GlobalCounterfactualMethod
 from ..base import LocalCounterfactualMethod
 from ..base import ClusteringMethod
+from ..local_cfs.cached_method import CounterfactualCache
+from ..utils.feature_importance import FeatureImportanceCache
 from ..utils.centroid import centroid_pandas
 from ..utils.action import (
     apply_action_pandas,
     actions_mean_pandas,
+    EncodedActionApplier,
 )
-from ..counterfactual_costs import build_dist_func_dataframe
+from ..counterfactual_costs import build_dist_func_dataframe, CounterfactualCost
+from ..utils.streaming import streaming_cumulative
+from ..utils.pareto import pareto_unique_actions
 from ..utils.metadata_requests import _decide_cluster_method, _decide_local_cf_method
 from .phase2 import generate_cluster_centroid_explanations
+from .merge_queue import IncrementalMergeQueue
+from .action_set_search import ActionSetSearch, _sequential_eff_cost
 
 
 class C_GLANCE(GlobalCounterfactualMethod):
@@ -39,6 +42,7 @@ class C_GLANCE(GlobalCounterfactualMethod):
         alternative_merges: bool = True,
         random_seed: int = 13,
         verbose=True,
+        n_jobs: Optional[int] = None,
     ) -> None:
         super().__init__()
         self.model = model
@@ -49,6 +53,7 @@ class C_GLANCE(GlobalCounterfactualMethod):
         self.alternative_merges = alternative_merges
         self.random_seed = random_seed
         self.verbose = verbose
+        self.n_jobs = n_jobs
         self.final_clustering = None
         self.clusters_results = None
 
@@ -86,8 +91,9 @@ class C_GLANCE(GlobalCounterfactualMethod):
             LocalCounterfactualMethod,
             Literal["Dice", "NearestNeighbors", "NearestNeighborsScaled", "RandomSampling"]
         ] = "Dice",
-        cluster_action_choice_algo: Literal["max-eff", "mean-act", "low-cost"] = "max-eff",
+        cluster_action_choice_algo: Literal["max-eff", "mean-act", "low-cost", "min-cost-eff-thres-combinations", "eff-thres-hybrid"] = "max-eff",
         nns__n_scalars: Optional[int] = None,
+        nns__scaling: Literal["all", "min"] = "all",
         rs__n_most_important: Optional[int] = None,
         rs__n_categorical_most_frequent: Optional[int] = None,
         lowcost__action_threshold: Optional[int] = None,
@@ -95,6 +101,13 @@ class C_GLANCE(GlobalCounterfactualMethod):
         min_cost_eff_thres__effectiveness_threshold: Optional[float] = None,
         min_cost_eff_thres_combinations__num_min_cost: Optional[int] = None,
         eff_thres_hybrid__max_n_actions_full_combinations: Optional[int] = None,
+        action_set_search__time_budget: Optional[float] = None,
+        action_set_search__method: Literal["branch-and-bound", "exhaustive"] = "branch-and-bound",
+        nn__index_backend: Literal["auto", "kd_tree", "ball_tree", "brute", "hnsw"] = "auto",
+        nn__index_encoding: Literal["dense", "sparse", "float32"] = "dense",
+        nn__index_path: Optional[str] = None,
+        cf_cache: Optional[CounterfactualCache] = None,
+        importance_cache: Optional[FeatureImportanceCache] = None,
     ) -> "C_GLANCE":
         self.numerical_features_names, self.categorical_features_names = self._set_features_names(
             X=X,
@@ -110,8 +123,10 @@ class C_GLANCE(GlobalCounterfactualMethod):
         self.num_low_cost = lowcost__num_low_cost if lowcost__num_low_cost is not None else 20
         self.effectiveness_threshold = min_cost_eff_thres__effectiveness_threshold if min_cost_eff_thres__effectiveness_threshold is not None else 0.1
         self.min_cost_eff_thres_combinations__num_min_cost = min_cost_eff_thres_combinations__num_min_cost
-        self.cluster_action_choice_algo: Literal["max-eff", "mean-act", "low-cost"] = cluster_action_choice_algo
-        self.eff_thres_hybrid__max_n_actions_full_combinations = eff_thres_hybrid__max_n_actions_full_combinations if eff_thres_hybrid__max_n_actions_full_combinations is None else 50
+        self.cluster_action_choice_algo: Literal["max-eff", "mean-act", "low-cost", "min-cost-eff-thres-combinations", "eff-thres-hybrid"] = cluster_action_choice_algo
+        self.eff_thres_hybrid__max_n_actions_full_combinations = eff_thres_hybrid__max_n_actions_full_combinations if eff_thres_hybrid__max_n_actions_full_combinations is not None else 50
+        self.action_set_search__time_budget = action_set_search__time_budget
+        self.action_set_search__method = action_set_search__method
         
         if nns__n_scalars is not None:
             self.n_scalars = nns__n_scalars
@@ -137,6 +152,12 @@ class C_GLANCE(GlobalCounterfactualMethod):
             n_scalars=self.n_scalars,
             n_most_important=self.n_most_important,
             n_categorical_most_frequent=self.n_categorical_most_frequent,
+            cf_cache=cf_cache,
+            nn_index_backend=nn__index_backend,
+            nn_index_encoding=nn__index_encoding,
+            nn_index_path=nn__index_path,
+            nns_scaling=nns__scaling,
+            importance_cache=importance_cache,
         )
         self.dist_func_dataframe = build_dist_func_dataframe(
                 X=X,
@@ -181,32 +202,54 @@ class C_GLANCE(GlobalCounterfactualMethod):
                 num_local_counterfactuals=self.num_local_counterfactuals,
                 numerical_features_names=self.numerical_features_names,
                 categorical_features_names=self.categorical_features_names,
+                n_jobs=self.n_jobs,
+                random_seed=self.random_seed,
             )
         )
         # delete clusters with no explanations
         clusters = {i: cluster for i, cluster in clusters.items() if i in cluster_explanations.keys()}
         cluster_centroids = {i: cluster for i, cluster in cluster_centroids.items() if i in cluster_explanations.keys()}
 
-        while len(clusters) > self.final_clusters:
-            cluster1, cluster2 = _find_candidate_clusters(
-                clusters=clusters,
-                cluster_centroids=cluster_centroids,
-                explanations_centroid=explanations_centroid,
-                heuristic_weights=self.heuristic_weights,
-                dist_func_dataframe=self.dist_func_dataframe,
-            )
-
-            _merge_clusters(
-                cluster1=cluster1,
-                cluster2=cluster2,
+        if isinstance(self.dist_func_dataframe, CounterfactualCost):
+            merge_queue = IncrementalMergeQueue(
                 clusters=clusters,
                 cluster_explanations=cluster_explanations,
-                cluster_centroids=cluster_centroids,
                 cluster_expl_actions=cluster_expl_actions,
-                explanations_centroid=explanations_centroid,
                 numerical_features_names=self.numerical_features_names,
                 categorical_features_names=self.categorical_features_names,
+                heuristic_weights=self.heuristic_weights,
+                bin_widths=self.dist_func_dataframe.bin_widths,
             )
+            with tqdm(total=max(0, len(merge_queue) - self.final_clusters), desc="Merging clusters") as progress_bar:
+                while len(merge_queue) > self.final_clusters:
+                    cluster1, cluster2 = merge_queue.find_candidate_clusters()
+                    merge_queue.merge(cluster1, cluster2)
+                    progress_bar.update()
+            clusters, cluster_explanations, cluster_expl_actions = merge_queue.result()
+        else:
+            # cost functions without bin widths use the DataFrame-based merges
+            with tqdm(total=max(0, len(clusters) - self.final_clusters), desc="Merging clusters") as progress_bar:
+                while len(clusters) > self.final_clusters:
+                    cluster1, cluster2 = _find_candidate_clusters(
+                        clusters=clusters,
+                        cluster_centroids=cluster_centroids,
+                        explanations_centroid=explanations_centroid,
+                        heuristic_weights=self.heuristic_weights,
+                        dist_func_dataframe=self.dist_func_dataframe,
+                    )
+
+                    _merge_clusters(
+                        cluster1=cluster1,
+                        cluster2=cluster2,
+                        clusters=clusters,
+                        cluster_explanations=cluster_explanations,
+                        cluster_centroids=cluster_centroids,
+                        cluster_expl_actions=cluster_expl_actions,
+                        explanations_centroid=explanations_centroid,
+                        numerical_features_names=self.numerical_features_names,
+                        categorical_features_names=self.categorical_features_names,
+                    )
+                    progress_bar.update()
 
         clusters_res, total_eff, total_cost = cluster_results(
             model=self.model,
@@ -222,6 +265,9 @@ class C_GLANCE(GlobalCounterfactualMethod):
             effectiveness_threshold=self.effectiveness_threshold,
             num_min_cost=self.min_cost_eff_thres_combinations__num_min_cost,
             max_n_actions_full_combinations=self.eff_thres_hybrid__max_n_actions_full_combinations,
+            time_budget=self.action_set_search__time_budget,
+            search_method=self.action_set_search__method,
+            n_jobs=self.n_jobs,
         )
 
         for i, stats in clusters_res.items():
@@ -237,7 +283,7 @@ class C_GLANCE(GlobalCounterfactualMethod):
 #                 total_cost=total_cost,
 #             )
             
-        eff, cost, pred_list, actions, costs , final_costs = cumulative(
+        eff, cost, *_ = cumulative(
             self.model,
             instances,
             [stats["action"] for i, stats in clusters_res.items()],
@@ -245,6 +291,7 @@ class C_GLANCE(GlobalCounterfactualMethod):
             self.numerical_features_names,
             self.categorical_features_names,
             "-",
+            keep_details=False,
         )
         if self.verbose == True:
             print(f"{Style.BRIGHT}TOTAL EFFECTIVENESS:{Style.RESET_ALL} {Fore.GREEN}{eff / instances.shape[0]:.2%}{Fore.RESET}")
@@ -259,6 +306,35 @@ class C_GLANCE(GlobalCounterfactualMethod):
         return [stats["action"] for i, stats in self.cluster_results.items()]
 
 
+def _evaluate_actions(
+    model: Any,
+    instances: pd.DataFrame,
+    actions: List[pd.Series],
+    dist_func_dataframe: Optional[Callable[[pd.DataFrame, pd.DataFrame], pd.Series]],
+    numerical_features_names: List[str],
+    categorical_features_names: List[str],
+    categorical_no_action_token: Any = "-",
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Apply each of `actions` to all `instances` using batched model calls.
+
+    Returns:
+        Tuple[np.ndarray, Optional[np.ndarray]]: predictions and recourse costs
+        of shape (n_instances, n_actions). The cost of instances that are not
+        flipped by an action is `np.inf`. Costs are None if no distance function is given.
+    """
+    applier = EncodedActionApplier(
+        instances,
+        numerical_columns=numerical_features_names,
+        categorical_columns=categorical_features_names,
+        categorical_no_action_token=categorical_no_action_token,
+    )
+    predictions, costs = applier.evaluate(model, actions, dist_func_dataframe)
+    if costs is not None:
+        costs[predictions != 1] = np.inf
+        costs = costs.T
+    return predictions.T, costs
+
+
 def cumulative(
     model,
     instances,
@@ -267,43 +343,30 @@ def cumulative(
     numeric_features_names,
     categorical_features_names,
     categorical_no_action_token,
+    chunk_size: int = 100_000,
+    keep_details: bool = True,
 ):
-    costs = []
-    all_predictions = {}
-    action_names = [f"action{i+1}" for i in range(len(actions))]
+    if len(actions) == 0:
+        return 0, 0.
 
-    for i,action in enumerate(actions):
-        applied_df = apply_action_pandas(
-            instances,
-            action,
+    def evaluate_chunk(start: int, end: int) -> Tuple[np.ndarray, np.ndarray]:
+        return _evaluate_actions(
+            model,
+            instances.iloc[start:end],
+            actions,
+            dist_func_dataframe,
             numeric_features_names,
             categorical_features_names,
             categorical_no_action_token,
         )
 
-        predictions = model.predict(applied_df)
-        all_predictions[i+1]=predictions
-        cur_costs = dist_func_dataframe(instances.reset_index(drop=True), applied_df.reset_index(drop=True))
-
-        cur_costs[predictions == 0] = np.inf
-        costs.append(cur_costs)
-
-    if costs == []:
-        return 0, 0.
-    
-    final_costs = np.column_stack(costs).min(axis=1)
-    effectiveness = (final_costs != np.inf).sum()
-    cost = final_costs[final_costs != np.inf].sum()
-    
-    final_output = []
-    for row in np.column_stack(costs):
-        if np.all(row == np.inf):
-            final_output.append(np.inf)
-        else:
-            min_index = np.argmin(row)  
-            final_output.append(min_index)
-
-    return effectiveness, cost, all_predictions, final_output, costs , final_costs
+    return streaming_cumulative(
+        evaluate_chunk,
+        n_instances=instances.shape[0],
+        n_actions=len(actions),
+        chunk_size=chunk_size,
+        keep_details=keep_details,
+    )
 
 
 def action_fake_cost(
@@ -335,45 +398,39 @@ def _select_action_low_cost(
             action, numerical_features_names, categorical_features_names
         )
     )
-    cf_list = []
-    for action in tqdm(
-        actions_list[: min(num_low_cost, len(actions_list))], total=len(actions_list)
-    ):
-        cfs = apply_action_pandas(
-            X=instances,
-            action=action,
-            numerical_columns=numerical_features_names,
-            categorical_columns=categorical_features_names,
-            categorical_no_action_token="-",
-        )
-        predictions: np.ndarray = model.predict(cfs)
-        n_flipped = predictions.sum()
-
-        if n_flipped > (action_threshold * inv_total_clusters) * len(instances):
-            cfs = apply_action_pandas(
-                X=cluster_instances,
-                action=action,
-                numerical_columns=numerical_features_names,
-                categorical_columns=categorical_features_names,
-                categorical_no_action_token="-",
-            )
-            predictions: np.ndarray = model.predict(cfs)
-            n_flipped = predictions.sum()
-            factuals_flipped = cluster_instances[predictions == 1]
-            cfs_flipped = cfs[predictions == 1]
-            recourse_cost_sum = dist_func_dataframe(factuals_flipped, cfs_flipped).sum()
-            cf_list.append((n_flipped, recourse_cost_sum, action))
-
-    if len(cf_list) == 0:
+    actions_list = actions_list[: min(num_low_cost, len(actions_list))]
+    predictions, _ = _evaluate_actions(
+        model,
+        instances,
+        actions_list,
+        None,
+        numerical_features_names,
+        categorical_features_names,
+    )
+    above_threshold = predictions.sum(axis=0) > (action_threshold * inv_total_clusters) * len(instances)
+    actions_list = [action for action, keep in zip(actions_list, above_threshold) if keep]
+    if len(actions_list) == 0:
         raise ValueError(
             "Change action_threshold. No action found in cluster with effectiveness in all instances above the threshold."
         )
-    else:
-        n_flipped, min_recourse_cost_sum, best_action = min(
-            cf_list, key=lambda x: (x[1], -x[0])
-        )
 
-        return n_flipped, min_recourse_cost_sum, best_action
+    predictions, costs = _evaluate_actions(
+        model,
+        cluster_instances,
+        actions_list,
+        dist_func_dataframe,
+        numerical_features_names,
+        categorical_features_names,
+    )
+    cf_list = [
+        (predictions[:, i].sum(), costs[predictions[:, i] == 1, i].sum(), action)
+        for i, action in enumerate(actions_list)
+    ]
+    n_flipped, min_recourse_cost_sum, best_action = min(
+        cf_list, key=lambda x: (x[1], -x[0])
+    )
+
+    return n_flipped, min_recourse_cost_sum, best_action
 
 
 def _select_action_min_cost_eff_thres(
@@ -392,45 +449,38 @@ def _select_action_min_cost_eff_thres(
             action, numerical_features_names, categorical_features_names
         )
     )
-    cf_list = []
-    for action in tqdm(
-        actions_list, total=len(actions_list)
-    ):
-        cfs = apply_action_pandas(
-            X=instances,
-            action=action,
-            numerical_columns=numerical_features_names,
-            categorical_columns=categorical_features_names,
-            categorical_no_action_token="-",
-        )
-        predictions: np.ndarray = model.predict(cfs)
-        n_flipped = predictions.sum()
-
-        if n_flipped / len(instances) >= effectiveness_threshold:
-            cfs = apply_action_pandas(
-                X=cluster_instances,
-                action=action,
-                numerical_columns=numerical_features_names,
-                categorical_columns=categorical_features_names,
-                categorical_no_action_token="-",
-            )
-            predictions: np.ndarray = model.predict(cfs)
-            n_flipped = predictions.sum()
-            factuals_flipped = cluster_instances[predictions == 1]
-            cfs_flipped = cfs[predictions == 1]
-            recourse_cost_sum = dist_func_dataframe(factuals_flipped, cfs_flipped).sum()
-            cf_list.append((n_flipped, recourse_cost_sum, action))
-
-    if len(cf_list) == 0:
+    predictions, _ = _evaluate_actions(
+        model,
+        instances,
+        actions_list,
+        None,
+        numerical_features_names,
+        categorical_features_names,
+    )
+    above_threshold = predictions.sum(axis=0) / len(instances) >= effectiveness_threshold
+    actions_list = [action for action, keep in zip(actions_list, above_threshold) if keep]
+    if len(actions_list) == 0:
         raise ValueError(
             "Change action_threshold. No action found in cluster with effectiveness in all instances above the threshold"
         )
-    else:
-        n_flipped, min_recourse_cost_sum, best_action = min(
-            cf_list, key=lambda x: (x[1], -x[0])
-        )
 
-        return n_flipped, min_recourse_cost_sum, best_action
+    predictions, costs = _evaluate_actions(
+        model,
+        cluster_instances,
+        actions_list,
+        dist_func_dataframe,
+        numerical_features_names,
+        categorical_features_names,
+    )
+    cf_list = [
+        (predictions[:, i].sum(), costs[predictions[:, i] == 1, i].sum(), action)
+        for i, action in enumerate(actions_list)
+    ]
+    n_flipped, min_recourse_cost_sum, best_action = min(
+        cf_list, key=lambda x: (x[1], -x[0])
+    )
+
+    return n_flipped, min_recourse_cost_sum, best_action
 
 
 def actions_cumulative_eff_cost(
@@ -442,26 +492,32 @@ def actions_cumulative_eff_cost(
     categorical_columns: List[str],
     categorical_no_action_token: Any,
 ) -> Tuple[float, float]:
-    X = X.copy()
     actions_with_costs = sorted(actions_with_costs, key=lambda t: t[1])
-    n_flipped_total = 0
-    recourse_cost_sum = 0
-    for action, _old_cost in actions_with_costs:
-        cfs = apply_action_pandas(
-            X=X,
-            action=action,
-            numerical_columns=numerical_columns,
-            categorical_columns=categorical_columns,
-            categorical_no_action_token=categorical_no_action_token,
-        )
-        predictions: np.ndarray = model.predict(cfs)
-        n_flipped_total += predictions.sum()
-        factuals_flipped = X[predictions == 1]
-        cfs_flipped = cfs[predictions == 1]
-        recourse_cost_sum += dist_func_dataframe(factuals_flipped, cfs_flipped).sum()
-        X = X[predictions == 0]
+    _, action_individual_costs = _evaluate_actions(
+        model,
+        X,
+        [action for action, _old_cost in actions_with_costs],
+        dist_func_dataframe,
+        numerical_columns,
+        categorical_columns,
+        categorical_no_action_token,
+    )
+
+    return _sequential_eff_cost(action_individual_costs)
+
+
+def _run_action_set_search(
+    search: ActionSetSearch,
+    search_method: Literal["branch-and-bound", "exhaustive"],
+    n_jobs: Optional[int] = None,
+) -> Optional[Tuple[int, float, Tuple[int, ...]]]:
+    if search_method == "branch-and-bound":
+        return search.search(progress=True)
+    elif search_method == "exhaustive":
+        return search.enumerate(n_jobs=n_jobs, progress=True)
+    else:
+        raise ValueError("Unsupported action set search method")
 
-    return n_flipped_total, recourse_cost_sum
 
 def _select_action_min_cost_eff_thres_combinations(
     model: Any,
@@ -473,54 +529,50 @@ def _select_action_min_cost_eff_thres_combinations(
     categorical_features_names: List[str],
     effectiveness_threshold: float,
     num_min_cost: Optional[int] = None,
+    time_budget: Optional[float] = None,
+    search_method: Literal["branch-and-bound", "exhaustive"] = "branch-and-bound",
+    n_jobs: Optional[int] = None,
 ):
     actions_list = [action for actions_cluster in candidate_actions.values() for _, action in actions_cluster.iterrows()]
+    _, action_individual_costs = _evaluate_actions(
+        model,
+        instances,
+        actions_list,
+        dist_func_dataframe,
+        numerical_features_names,
+        categorical_features_names,
+    )
     actions_list_with_cost = []
-    for action in tqdm(actions_list):
-        cfs = apply_action_pandas(
-            X=instances,
-            action=action,
-            numerical_columns=numerical_features_names,
-            categorical_columns=categorical_features_names,
-            categorical_no_action_token="-",
-        )
-        predictions: np.ndarray = model.predict(cfs)
-        n_flipped = predictions.sum()
-        factuals_flipped = instances[predictions == 1]
-        cfs_flipped = cfs[predictions == 1]
-        mean_recourse_cost = dist_func_dataframe(factuals_flipped, cfs_flipped).mean()
-        actions_list_with_cost.append((action, mean_recourse_cost))
+    for i, action in enumerate(actions_list):
+        flipped_costs = action_individual_costs[action_individual_costs[:, i] != np.inf, i]
+        mean_recourse_cost = pd.Series(flipped_costs, dtype=float).mean()
+        actions_list_with_cost.append((i, mean_recourse_cost))
     
     actions_list_with_cost.sort(key=lambda t: t[1])
     if num_min_cost is not None:
         actions_list_with_cost = actions_list_with_cost[:num_min_cost]
     
-    num_actions = len(clusters)
-    
-    best_action_set = None
-    for candidate_action_set in itertools.combinations(actions_list_with_cost, num_actions):
-        n_flipped, cost_sum = actions_cumulative_eff_cost(
-            model=model,
-            X=instances,
-            actions_with_costs=list(candidate_action_set),
-            dist_func_dataframe=dist_func_dataframe,
-            numerical_columns=numerical_features_names,
-            categorical_columns=categorical_features_names,
-            categorical_no_action_token="-",
-        )
-    
-        if n_flipped >= effectiveness_threshold * instances.shape[0]:
-            if best_action_set is None or cost_sum < best_cost_sum:
-                best_action_set = candidate_action_set
-                best_n_flipped = n_flipped
-                best_cost_sum = cost_sum
+    # Columns in order of mean cost, which is the order actions are applied in.
+    # Unlike the hybrid selector, dominated or identical actions are kept: with
+    # first-flip semantics a dominated action placed earlier in this order can
+    # still be part of the cheapest set, so pareto_unique_actions does not apply
+    cols = [i for i, _ in actions_list_with_cost]
+    search = ActionSetSearch(
+        action_individual_costs[:, cols],
+        n_actions=len(clusters),
+        is_effective=lambda n_flipped: n_flipped >= effectiveness_threshold * instances.shape[0],
+        sequential=True,
+        time_budget=time_budget,
+    )
+    best = _run_action_set_search(search, search_method, n_jobs)
 
-    if best_action_set is None:
+    if best is None:
         raise ValueError(
             "Change effectiveness_threshold. No action set found with cumulative effectiveness above the threshold"
         )
     else:
-        return best_n_flipped, best_cost_sum, [p[0] for p in best_action_set]
+        best_n_flipped, best_cost_sum, best_action_set = best
+        return best_n_flipped, best_cost_sum, [actions_list[cols[p]] for p in best_action_set]
 
 
 def _select_actions_eff_thres_hybrid(
@@ -533,45 +585,22 @@ def _select_actions_eff_thres_hybrid(
     categorical_features_names: List[str],
     effectiveness_threshold: float,
     max_n_actions_full_combinations: int = 10,
+    time_budget: Optional[float] = None,
+    search_method: Literal["branch-and-bound", "exhaustive"] = "branch-and-bound",
+    n_jobs: Optional[int] = None,
 ):
     actions_list = [action for actions_cluster in candidate_actions.values() for _, action in actions_cluster.iterrows()]
-    action_individual_costs = np.empty((instances.shape[0], len(actions_list)))
-    for i, action in enumerate(tqdm(actions_list)):
-        cfs = apply_action_pandas(
-            X=instances,
-            action=action,
-            numerical_columns=numerical_features_names,
-            categorical_columns=categorical_features_names,
-            categorical_no_action_token="-",
-        )
-        predictions: np.ndarray = model.predict(cfs)
-        action_individual_costs[predictions == 0, i] = np.inf
-
-        factuals_flipped = instances[predictions == 1]
-        cfs_flipped = cfs[predictions == 1]
-        individual_recourse_costs = dist_func_dataframe(factuals_flipped, cfs_flipped)
-        action_individual_costs[predictions == 1, i] = individual_recourse_costs
-    
-    dominated = np.zeros(action_individual_costs.shape[1])
-    for i in tqdm(range(action_individual_costs.shape[1])):
-        for j in range(i, action_individual_costs.shape[1]):
-            if (action_individual_costs[:, i] <= action_individual_costs[:, j]).all() and (action_individual_costs[:, i] < action_individual_costs[:, j]).any():
-                dominated[j] = 1
-            if (action_individual_costs[:, i] >= action_individual_costs[:, j]).all() and (action_individual_costs[:, i] > action_individual_costs[:, j]).any():
-                dominated[i] = 1
-
-    action_individual_costs = action_individual_costs[:, ~dominated.astype(bool)]
-    non_dominated_idxs = np.where(dominated == 0)[0]
-    actions_list = [action for i, action in enumerate(actions_list) if i in non_dominated_idxs]
-    
-    uf = DisjointSet(range(action_individual_costs.shape[1]))
-    for i in tqdm(range(action_individual_costs.shape[1])):
-        for j in range(i, action_individual_costs.shape[1]):
-            if not uf.connected(i, j):
-                if (action_individual_costs[:, i] == action_individual_costs[:, j]).all():
-                    uf.merge(i, j)
+    _, action_individual_costs = _evaluate_actions(
+        model,
+        instances,
+        actions_list,
+        dist_func_dataframe,
+        numerical_features_names,
+        categorical_features_names,
+    )
     
-    sufficient_actions_idxs = [eq_class.pop() for eq_class in uf.subsets()]
+    # Drop dominated actions, and keep one of every group of identical actions
+    sufficient_actions_idxs = pareto_unique_actions(action_individual_costs)
     actions_list = [actions_list[i] for i in sufficient_actions_idxs]
     action_individual_costs = action_individual_costs[:, sufficient_actions_idxs]
     
@@ -602,29 +631,22 @@ def _select_actions_eff_thres_hybrid(
     candidate_idxs = set(smallest_cost_indices) | set(largest_eff_indices) | set(middle_cost_indices) | set(middle_eff_indices) | set(largest_ratio_indices) | set(random_indices)
     candidate_idxs = np.array(list(candidate_idxs))
     
-    num_actions = len(clusters)
-    best_action_set = None
-    for candidate_action_set in tqdm(itertools.combinations(candidate_idxs, num_actions), total=math.comb(len(candidate_idxs), num_actions)):
-        cand_matrix = action_individual_costs[:, candidate_action_set]
-        min_individual_costs = cand_matrix.min(axis=1)
-        n_individuals = min_individual_costs.shape[0]
-
-        n_flipped = (np.where(min_individual_costs != np.inf))[0].shape[0]
-        effectiveness = n_flipped / n_individuals
-        cost_sum = min_individual_costs[min_individual_costs != np.inf].sum()
-
-        if effectiveness >= effectiveness_threshold:
-            if best_action_set is None or cost_sum < best_cost_sum:
-                best_action_set = candidate_action_set
-                best_cost_sum = cost_sum
-                best_n_flipped = n_flipped
+    n_individuals = action_individual_costs.shape[0]
+    search = ActionSetSearch(
+        action_individual_costs[:, candidate_idxs],
+        n_actions=len(clusters),
+        is_effective=lambda n_flipped: n_flipped / n_individuals >= effectiveness_threshold,
+        time_budget=time_budget,
+    )
+    best = _run_action_set_search(search, search_method, n_jobs)
     
-    if best_action_set is None:
+    if best is None:
         raise ValueError(
             "Change effectiveness_threshold. No action set found with cumulative effectiveness above the threshold"
         )
     else:
-        return best_n_flipped, best_cost_sum, [actions_list[i] for i in best_action_set]
+        best_n_flipped, best_cost_sum, best_action_set = best
+        return best_n_flipped, best_cost_sum, [actions_list[candidate_idxs[p]] for p in best_action_set]
 
 
 def _select_action_max_eff(
@@ -636,30 +658,19 @@ def _select_action_max_eff(
     categorical_features_names: List[str],
     num_actions: int = 1,
 ) -> Tuple[int, int, pd.Series]:
-    max_n_flipped = 0
-    cf_list = []
-
-    for _, action in tqdm(
-        candidate_actions.iterrows(), total=candidate_actions.shape[0]
-    ):
-        cfs = apply_action_pandas(
-            X=instances,
-            action=action,
-            numerical_columns=numerical_features_names,
-            categorical_columns=categorical_features_names,
-            categorical_no_action_token="-",
-        )
-        predictions: np.ndarray = model.predict(cfs)
-        n_flipped = predictions.sum()
-
-        if n_flipped < max_n_flipped and num_actions == 1:
-            continue
-        max_n_flipped = n_flipped
-
-        factuals_flipped = instances[predictions == 1]
-        cfs_flipped = cfs[predictions == 1]
-        recourse_cost_sum = dist_func_dataframe(factuals_flipped, cfs_flipped).sum()
-        cf_list.append((n_flipped, recourse_cost_sum, action))
+    actions_list = [action for _, action in candidate_actions.iterrows()]
+    predictions, costs = _evaluate_actions(
+        model,
+        instances,
+        actions_list,
+        dist_func_dataframe,
+        numerical_features_names,
+        categorical_features_names,
+    )
+    cf_list = [
+        (predictions[:, i].sum(), costs[predictions[:, i] == 1, i].sum(), action)
+        for i, action in enumerate(actions_list)
+    ]
 
     if num_actions == 1:
         max_n_flipped, recourse_cost_sum, best_action = max(
@@ -702,6 +713,9 @@ def _select_action_mean(
     return n_flipped, recourse_cost_sum, mean_action
 
 
+MULTI_ACTION_ALGOS = ("min-cost-eff-thres-combinations", "eff-thres-hybrid")
+
+
 def cluster_results(
     model: Any,
     instances: pd.DataFrame,
@@ -710,17 +724,22 @@ def cluster_results(
     dist_func_dataframe: Callable[[pd.DataFrame, pd.DataFrame], pd.Series],
     numerical_features_names: List[str],
     categorical_features_names: List[str],
-    cluster_action_choice_algo: Literal["max-eff", "mean-act", "low-cost"] = "max-eff",
+    cluster_action_choice_algo: Literal["max-eff", "mean-act", "low-cost", "min-cost-eff-thres-combinations", "eff-thres-hybrid"] = "max-eff",
     action_threshold: int = 0.5,
     num_low_cost: int = 20,
     effectiveness_threshold: float = 0.1,
     num_min_cost: Optional[int] = None,
     max_n_actions_full_combinations: int = 50,
+    time_budget: Optional[float] = None,
+    search_method: Literal["branch-and-bound", "exhaustive"] = "branch-and-bound",
+    n_jobs: Optional[int] = None,
 ) -> Tuple[Dict[int, Dict[str, Any]], float, float]:
     n_flipped_total = 0
     total_recourse_cost_sum = 0
     ret_clusters = {}
-    for i, cluster in clusters.items():
+    # Multi-action algorithms select the actions of all clusters at once, below
+    single_action_clusters = {} if cluster_action_choice_algo in MULTI_ACTION_ALGOS else clusters
+    for i, cluster in tqdm(single_action_clusters.items(), desc="Selecting cluster actions", disable=len(single_action_clusters) == 0):
         if cluster_action_choice_algo == "max-eff":
             n_flipped, recourse_cost_sum, selected_action = _select_action_max_eff(
                 model=model,
@@ -777,6 +796,9 @@ def cluster_results(
             categorical_features_names=categorical_features_names,
             effectiveness_threshold=effectiveness_threshold,
             num_min_cost=num_min_cost,
+            time_budget=time_budget,
+            search_method=search_method,
+            n_jobs=n_jobs,
         )
         
         assert len(action_set) == len(clusters)
@@ -803,6 +825,9 @@ def cluster_results(
             categorical_features_names=categorical_features_names,
             effectiveness_threshold=effectiveness_threshold,
             max_n_actions_full_combinations=max_n_actions_full_combinations,
+            time_budget=time_budget,
+            search_method=search_method,
+            n_jobs=n_jobs,
         )
         
         assert len(action_set) == len(clusters)
@@ -0,0 +1,213 @@
+from typing import Dict, List, Tuple
+import heapq
+
+import numpy as np
+import pandas as pd
+
+from ..counterfactual_costs import CounterfactualCost
+
+
+class _GroupStatistics:
+    """Running statistics of a set of groups of rows, from which the centroid
+    of each group (mean of numerical columns, mode of categorical columns) is
+    maintained in O(features) per merge.
+
+    Categorical values are encoded as integer codes. For each group and
+    categorical column, the count and the first position of every code are
+    kept, so that ties of the mode are broken in favour of the value that
+    appears first, exactly as `centroid_pandas` does.
+    """
+
+    def __init__(
+        self,
+        numerical: List[np.ndarray],
+        categorical: List[np.ndarray],
+    ):
+        n_groups = len(numerical)
+        self.sizes = np.array([num.shape[0] for num in numerical])
+        self.sums = np.vstack([np.nansum(num, axis=0) for num in numerical])
+        self.counts = np.vstack([(~np.isnan(num)).sum(axis=0) for num in numerical])
+        self.code_stats = []
+        for cat in categorical:
+            group_stats = []
+            for j in range(cat.shape[1]):
+                codes, first_positions, counts = np.unique(
+                    cat[:, j], return_index=True, return_counts=True
+                )
+                group_stats.append(
+                    {c: (n, p) for c, n, p in zip(codes, counts, first_positions)}
+                )
+            self.code_stats.append(group_stats)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.means = self.sums / self.counts
+        self.modes = np.array(
+            [[self._mode(col_stats) for col_stats in group_stats] for group_stats in self.code_stats],
+            dtype=np.int64,
+        ).reshape(n_groups, -1)
+
+    @staticmethod
+    def _mode(col_stats: Dict[int, Tuple[int, int]]) -> int:
+        return min(col_stats, key=lambda c: (-col_stats[c][0], col_stats[c][1]))
+
+    def merge(self, source: int, target: int):
+        """Append the rows of group `source` after the rows of group `target`."""
+        target_size = self.sizes[target]
+        self.sizes[target] += self.sizes[source]
+        self.sums[target] += self.sums[source]
+        self.counts[target] += self.counts[source]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.means[target] = self.sums[target] / self.counts[target]
+
+        for j, (target_stats, source_stats) in enumerate(
+            zip(self.code_stats[target], self.code_stats[source])
+        ):
+            for code, (n, p) in source_stats.items():
+                if code in target_stats:
+                    target_stats[code] = (target_stats[code][0] + n, target_stats[code][1])
+                else:
+                    target_stats[code] = (n, target_size + p)
+            self.modes[target, j] = self._mode(target_stats)
+
+
+class IncrementalMergeQueue:
+    """State of the iterative merges phase of C_GLANCE.
+
+    Keeps the centroid and explanation centroid of every cluster as running
+    statistics, the matrix of merge heuristic values between all pairs of
+    clusters and a heap of clusters ordered by size. A merge only updates the
+    statistics of the merged cluster and one row / column of the heuristic
+    matrix, and concatenation of the cluster DataFrames is deferred until the
+    end of the phase.
+
+    The merge order is the same as repeatedly calling `_find_candidate_clusters`
+    and `_merge_clusters`: the smallest cluster (ties broken by id) is merged
+    into the cluster with the smallest heuristic value (ties broken by id).
+    """
+
+    def __init__(
+        self,
+        clusters: Dict[int, pd.DataFrame],
+        cluster_explanations: Dict[int, pd.DataFrame],
+        cluster_expl_actions: Dict[int, pd.DataFrame],
+        numerical_features_names: List[str],
+        categorical_features_names: List[str],
+        heuristic_weights: Tuple[float, float],
+        bin_widths: np.ndarray,
+    ):
+        """
+        Args:
+            clusters (Dict[int, pd.DataFrame]): instances of each cluster
+            cluster_explanations (Dict[int, pd.DataFrame]): counterfactuals of each cluster centroid
+            cluster_expl_actions (Dict[int, pd.DataFrame]): candidate actions of each cluster
+            numerical_features_names (List[str]): numerical column names
+            categorical_features_names (List[str]): categorical column names
+            heuristic_weights (Tuple[float, float]): weights of the centroid and explanation centroid distances
+            bin_widths (np.ndarray): bin width of each numerical feature, as used by the cost function
+        """
+        self.ids = sorted(clusters.keys())
+        self.slots = {cluster_id: slot for slot, cluster_id in enumerate(self.ids)}
+        self.heuristic_weights = heuristic_weights
+        self.bin_widths = np.asarray(bin_widths, dtype=float)
+        self.parts = {
+            cluster_id: (
+                [clusters[cluster_id]],
+                [cluster_explanations[cluster_id]],
+                [cluster_expl_actions[cluster_id]],
+            )
+            for cluster_id in self.ids
+        }
+
+        frames = [clusters[i] for i in self.ids] + [cluster_explanations[i] for i in self.ids]
+        categorical = [np.empty((frame.shape[0], 0), dtype=np.int64) for frame in frames]
+        if categorical_features_names:
+            categorical = [np.empty((frame.shape[0], len(categorical_features_names)), dtype=np.int64) for frame in frames]
+            for j, col in enumerate(categorical_features_names):
+                codes, _ = pd.factorize(pd.concat([frame[col] for frame in frames], ignore_index=True))
+                offsets = np.cumsum([0] + [frame.shape[0] for frame in frames])
+                for k in range(len(frames)):
+                    categorical[k][:, j] = codes[offsets[k]:offsets[k + 1]]
+        numerical = [frame[numerical_features_names].to_numpy(dtype=float) for frame in frames]
+
+        n = len(self.ids)
+        self.instance_stats = _GroupStatistics(numerical[:n], categorical[:n])
+        self.explanation_stats = _GroupStatistics(numerical[n:], categorical[n:])
+
+        self.active = np.ones(n, dtype=bool)
+        self.n_active = n
+        self.heuristic = (
+            self.heuristic_weights[0] * self._pairwise_distances(self.instance_stats)
+            + self.heuristic_weights[1] * self._pairwise_distances(self.explanation_stats)
+        )
+        self.size_heap = [(self.instance_stats.sizes[slot], cluster_id) for slot, cluster_id in enumerate(self.ids)]
+        heapq.heapify(self.size_heap)
+
+    def __len__(self) -> int:
+        return self.n_active
+
+    def _encoded(self, stats: _GroupStatistics) -> Tuple[np.ndarray, np.ndarray]:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return stats.means / self.bin_widths, stats.modes
+
+    def _distances(self, stats: _GroupStatistics, slot: int) -> np.ndarray:
+        num, modes = self._encoded(stats)
+        return CounterfactualCost.cost_encoded(num[slot], modes[slot], num, modes)
+
+    def _pairwise_distances(self, stats: _GroupStatistics) -> np.ndarray:
+        num, modes = self._encoded(stats)
+        return CounterfactualCost.pairwise_encoded(num, modes, num, modes)
+
+    def _heuristic_row(self, slot: int) -> np.ndarray:
+        return (
+            self.heuristic_weights[0] * self._distances(self.instance_stats, slot)
+            + self.heuristic_weights[1] * self._distances(self.explanation_stats, slot)
+        )
+
+    def find_candidate_clusters(self) -> Tuple[int, int]:
+        """Pair of clusters to be merged next: the smallest cluster and the
+        cluster closest to it according to the merge heuristic."""
+        while True:
+            size, smallest_cluster = self.size_heap[0]
+            slot = self.slots[smallest_cluster]
+            if self.active[slot] and self.instance_stats.sizes[slot] == size:
+                break
+            heapq.heappop(self.size_heap)
+
+        others = np.flatnonzero(self.active)
+        others = others[others != slot]
+        closest = others[np.argmin(self.heuristic[slot, others])]
+
+        return smallest_cluster, self.ids[closest]
+
+    def merge(self, cluster1: int, cluster2: int):
+        """Merge `cluster1` into `cluster2`."""
+        slot1, slot2 = self.slots[cluster1], self.slots[cluster2]
+        for parts2, parts1 in zip(self.parts[cluster2], self.parts.pop(cluster1)):
+            parts2.extend(parts1)
+        self.instance_stats.merge(slot1, slot2)
+        self.explanation_stats.merge(slot1, slot2)
+
+        self.active[slot1] = False
+        self.n_active -= 1
+        row = self._heuristic_row(slot2)
+        self.heuristic[slot2, :] = row
+        self.heuristic[:, slot2] = row
+        heapq.heappush(self.size_heap, (self.instance_stats.sizes[slot2], cluster2))
+
+    def result(
+        self,
+    ) -> Tuple[Dict[int, pd.DataFrame], Dict[int, pd.DataFrame], Dict[int, pd.DataFrame]]:
+        """The merged clusters, cluster explanations and cluster candidate actions."""
+
+        def concat(frames: List[pd.DataFrame]) -> pd.DataFrame:
+            if len(frames) == 1:
+                return frames[0]
+            return pd.concat(frames, ignore_index=True)
+
+        clusters, cluster_explanations, cluster_expl_actions = {}, {}, {}
+        for cluster_id, (instances, explanations, actions) in self.parts.items():
+            clusters[cluster_id] = concat(instances)
+            cluster_explanations[cluster_id] = concat(explanations)
+            cluster_expl_actions[cluster_id] = concat(actions)
+
+        return clusters, cluster_explanations, cluster_expl_actions
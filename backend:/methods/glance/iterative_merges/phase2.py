@@ -1,24 +1,73 @@
-from typing import Dict, List, Tuple
+from typing import Dict, List, Tuple, Optional
 
+import numpy as np
 import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
+from tqdm import tqdm
 
 from ..base import LocalCounterfactualMethod
 from ..utils.action import extract_actions_pandas
 from ..utils.centroid import centroid_pandas
 
+def _cluster_random_seeds(random_seed: int, n_clusters: int) -> List[int]:
+    return [
+        int(seed_sequence.generate_state(1)[0])
+        for seed_sequence in np.random.SeedSequence(random_seed).spawn(n_clusters)
+    ]
+
+
 def generate_cluster_centroid_explanations(
     cluster_centroids: Dict[int, pd.DataFrame],
     cf_generator: LocalCounterfactualMethod,
     num_local_counterfactuals: int,
     numerical_features_names: List[str],
     categorical_features_names: List[str],
+    n_jobs: Optional[int] = None,
+    random_seed: Optional[int] = None,
+    parallel_backend: str = "loky",
 ) -> Tuple[Dict[int, pd.DataFrame], Dict[int, pd.DataFrame], Dict[int, pd.DataFrame]]:
-    cluster_explanations = {
-        i: cf_generator.explain_instances(
-            cluster_centroids[i], num_local_counterfactuals
+    """Generate local counterfactuals for every cluster centroid and derive the
+    candidate actions of each cluster from them.
+
+    Centroids are sent to `cf_generator.explain_instances_batch` in chunks,
+    explained in turn when `n_jobs` is None or 1, otherwise by `n_jobs` workers.
+    If `random_seed` is given, every cluster gets its own seed derived from it,
+    so that results do not depend on the number of workers.
+    """
+    cluster_ids = list(cluster_centroids.keys())
+    centroids = [cluster_centroids[i] for i in cluster_ids]
+    random_seeds = (
+        _cluster_random_seeds(random_seed, len(cluster_ids))
+        if random_seed is not None
+        else None
+    )
+
+    # Centroids are explained in several chunks (a few per worker), so that
+    # progress is reported as chunks finish
+    n_workers = effective_n_jobs(n_jobs) if n_jobs is not None else 1
+    n_chunks = max(1, min(len(cluster_ids), max(10, 4 * n_workers)))
+    chunks = np.array_split(np.arange(len(cluster_ids)), n_chunks)
+    chunk_args = (
+        (
+            [centroids[j] for j in chunk],
+            num_local_counterfactuals,
+            [random_seeds[j] for j in chunk] if random_seeds is not None else None,
         )
-        for i, _ in cluster_centroids.items()
-    }
+        for chunk in chunks
+    )
+    if n_workers <= 1 or n_chunks <= 1:
+        chunk_explanations = (cf_generator.explain_instances_batch(*args) for args in chunk_args)
+    else:
+        chunk_explanations = Parallel(n_jobs=n_jobs, backend=parallel_backend, return_as="generator")(
+            delayed(cf_generator.explain_instances_batch)(*args) for args in chunk_args
+        )
+    progress_bar = tqdm(total=len(cluster_ids), desc="Local counterfactuals")
+    explanations = []
+    for chunk_cfs in chunk_explanations:
+        explanations.extend(chunk_cfs)
+        progress_bar.update(len(chunk_cfs))
+    progress_bar.close()
+    cluster_explanations = dict(zip(cluster_ids, explanations))
     returned_requested = True
     empty_cfs_idxs = []
     for i, cfs in cluster_explanations.items():
@@ -1,3 +1,4 @@
 from .dice_method import DiceMethod
 from .nearest_neighbor import NearestNeighborMethod, NearestNeighborsScaled
 from .random_sampling import RandomSampling
+from .cached_method import CachedCounterfactualMethod, CounterfactualCache
@@ -0,0 +1,275 @@
+from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from ..base import LocalCounterfactualMethod
+from ..utils.fingerprint import model_fingerprint, object_token, dataframe_fingerprint, row_fingerprints
+
+
+class CounterfactualCache:
+    """Two-tier store of local counterfactuals: an in-memory LRU tier and an
+    optional on-disk sqlite tier. Entries are evicted when they are older than
+    `ttl` seconds, or (least recently used first) when a tier grows beyond its
+    size limit. The cache is safe to share between threads and, through the
+    disk tier, between processes.
+    """
+
+    def __init__(
+        self,
+        max_memory_bytes: int = 256 * 2**20,
+        disk_path: Optional[str] = None,
+        max_disk_bytes: int = 2 * 2**30,
+        ttl: Optional[float] = 7 * 24 * 3600,
+    ):
+        """
+        Args:
+            max_memory_bytes (int): size limit of the in-memory tier
+            disk_path (Optional[str]): path of the sqlite file of the on-disk tier. If None, only the in-memory tier is used
+            max_disk_bytes (int): size limit of the on-disk tier
+            ttl (Optional[float]): time to live of entries in seconds. If None, entries do not expire
+        """
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_path = disk_path
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        self._memory: "OrderedDict[str, Tuple[pd.DataFrame, int, float]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+        if self.disk_path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.disk_path)), exist_ok=True)
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS counterfactuals ("
+                    "key TEXT PRIMARY KEY, value BLOB, size INTEGER, created REAL, accessed REAL)"
+                )
+
+    def __getstate__(self):
+        # Sent to worker processes without the in-memory tier, which they
+        # rebuild; the disk tier is shared
+        return {
+            "max_memory_bytes": self.max_memory_bytes,
+            "disk_path": self.disk_path,
+            "max_disk_bytes": self.max_disk_bytes,
+            "ttl": self.ttl,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.disk_path, timeout=30)
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, key: str, persistent: bool = True) -> Optional[pd.DataFrame]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[2]):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self._memory_bytes -= entry[1]
+                del self._memory[key]
+
+        if self.disk_path is not None and persistent:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT value, created FROM counterfactuals WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and not self._expired(row[1]):
+                    conn.execute(
+                        "UPDATE counterfactuals SET accessed = ? WHERE key = ?",
+                        (time.time(), key),
+                    )
+                    value = pickle.loads(row[0])
+                    self._put_memory(key, value, row[1])
+                    with self._lock:
+                        self.hits += 1
+                    return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _put_memory(self, key: str, value: pd.DataFrame, created: float):
+        size = int(value.memory_usage(deep=True).sum())
+        if size > self.max_memory_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory_bytes -= self._memory.pop(key)[1]
+            self._memory[key] = (value, size, created)
+            self._memory_bytes += size
+            while self._memory_bytes > self.max_memory_bytes:
+                _, (_, evicted_size, _) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted_size
+
+    def set(self, key: str, value: pd.DataFrame, persistent: bool = True):
+        """Stores `value`; only in memory if not `persistent`."""
+        created = time.time()
+        self._put_memory(key, value, created)
+
+        if self.disk_path is not None and persistent:
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO counterfactuals VALUES (?, ?, ?, ?, ?)",
+                    (key, blob, len(blob), created, created),
+                )
+                self._evict_disk(conn)
+
+    def _evict_disk(self, conn: sqlite3.Connection):
+        if self.ttl is not None:
+            conn.execute(
+                "DELETE FROM counterfactuals WHERE created < ?", (time.time() - self.ttl,)
+            )
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM counterfactuals").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        to_delete = []
+        for key, size in conn.execute(
+            "SELECT key, size FROM counterfactuals ORDER BY accessed"
+        ):
+            if total <= self.max_disk_bytes:
+                break
+            to_delete.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM counterfactuals WHERE key = ?", to_delete)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        if self.disk_path is not None:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM counterfactuals")
+
+
+def _generator_config(cf_generator: LocalCounterfactualMethod) -> Dict[str, Any]:
+    """Scalar and list-valued attributes of a counterfactual generator, which
+    together with its class describe its configuration."""
+    config = {}
+    for name, value in sorted(vars(cf_generator).items()):
+        if isinstance(value, (bool, int, float, str, type(None))):
+            config[name] = value
+        elif isinstance(value, (list, tuple, pd.Index)) and all(
+            isinstance(v, (bool, int, float, str)) for v in value
+        ):
+            config[name] = list(value)
+    return config
+
+
+class CachedCounterfactualMethod(LocalCounterfactualMethod):
+    """Memoizes the counterfactuals of a local counterfactual method.
+
+    Counterfactuals are cached per query row, under a key made of the model
+    fingerprint, the dataset fingerprint, the generator class and
+    configuration, `feat_to_vary`, the number of counterfactuals, the random
+    seed of the row's group and the hash of the row. Only rows missing from
+    the cache are sent to the wrapped generator, in a single
+    `explain_instances_batch` call, each as its own group with the seed of its
+    group, so that the counterfactuals of a row only depend on what the key
+    covers. Generators that are unseeded (a `random_state` of None and no
+    `random_seeds`) are not deterministic and bypass the cache. Models that
+    cannot be pickled have no fingerprint: their counterfactuals are only
+    cached in memory, for the lifetime of the model.
+    """
+
+    def __init__(
+        self,
+        cf_generator: LocalCounterfactualMethod,
+        cache: CounterfactualCache,
+        model: Any,
+        train_dataset: Optional[pd.DataFrame] = None,
+        feat_to_vary: Optional[Any] = None,
+    ):
+        super().__init__()
+        self.cf_generator = cf_generator
+        self.cache = cache
+        self.feat_to_vary = feat_to_vary
+
+        fingerprint = model_fingerprint(model)
+        self.persistent = fingerprint is not None
+        key_parts = {
+            "model": fingerprint if fingerprint is not None else object_token(model),
+            "dataset": dataframe_fingerprint(train_dataset) if train_dataset is not None else None,
+            "generator": type(cf_generator).__qualname__,
+            "config": _generator_config(cf_generator),
+            "feat_to_vary": feat_to_vary if isinstance(feat_to_vary, (str, type(None))) else list(feat_to_vary),
+        }
+        self.prefix = hashlib.sha256(
+            json.dumps(key_parts, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    def fit(self, **kwargs):
+        self.cf_generator.fit(**kwargs)
+
+    def _keys(
+        self, instances: pd.DataFrame, num_counterfactuals: int, random_seed: Optional[int]
+    ) -> List[str]:
+        return [
+            f"{self.prefix}-{num_counterfactuals}-{random_seed}-{row_hash}"
+            for row_hash in row_fingerprints(instances)
+        ]
+
+    def explain_instances(
+        self, instances: pd.DataFrame, num_counterfactuals: int
+    ) -> pd.DataFrame:
+        return self.explain_instances_batch([instances], num_counterfactuals)[0]
+
+    def explain_instances_batch(
+        self,
+        instances_list: List[pd.DataFrame],
+        num_counterfactuals: int,
+        random_seeds: Optional[List[int]] = None,
+    ) -> List[pd.DataFrame]:
+        # Unseeded generators draw fresh counterfactuals on every call
+        if random_seeds is None and getattr(self.cf_generator, "random_state", 0) is None:
+            return self.cf_generator.explain_instances_batch(instances_list, num_counterfactuals)
+
+        rows_cfs = []
+        missing_rows, missing_seeds, missing_positions = [], [], []
+        for i, instances in enumerate(instances_list):
+            keys = self._keys(
+                instances, num_counterfactuals, random_seeds[i] if random_seeds is not None else None
+            )
+            group_cfs = []
+            for j, key in enumerate(keys):
+                cfs = self.cache.get(key, persistent=self.persistent)
+                if cfs is None:
+                    missing_rows.append(instances.iloc[j : j + 1])
+                    missing_seeds.append(random_seeds[i] if random_seeds is not None else None)
+                    missing_positions.append((i, j, key))
+                group_cfs.append(cfs)
+            rows_cfs.append(group_cfs)
+
+        if missing_rows:
+            explanations = self.cf_generator.explain_instances_batch(
+                missing_rows,
+                num_counterfactuals,
+                missing_seeds if random_seeds is not None else None,
+            )
+            for (i, j, key), cfs in zip(missing_positions, explanations):
+                self.cache.set(key, cfs, persistent=self.persistent)
+                rows_cfs[i][j] = cfs
+
+        return [
+            pd.concat(group_cfs, ignore_index=False)
+            if group_cfs
+            else pd.DataFrame(columns=instances.columns).astype(instances.dtypes)
+            for group_cfs, instances in zip(rows_cfs, instances_list)
+        ]
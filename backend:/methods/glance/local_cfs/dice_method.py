@@ -1,6 +1,7 @@
 from ..base import LocalCounterfactualMethod
 import dice_ml
 import pandas as pd
+from typing import List, Optional
 
 
 class DiceMethod(LocalCounterfactualMethod):
@@ -53,3 +54,38 @@ class DiceMethod(LocalCounterfactualMethod):
             ],
             ignore_index=False,
         )
+
+    def explain_instances_batch(
+        self,
+        instances_list: List[pd.DataFrame],
+        num_counterfactuals: int,
+        random_seeds: Optional[List[int]] = None,
+    ) -> List[pd.DataFrame]:
+        # DiCE reseeds with `self.random_seed` for every query instance, so all
+        # groups are sent in a single call and `random_seeds` are not needed.
+        if self.cf_generator is None:
+            raise ValueError("Fit the Local Counterfactual method first.")
+
+        counterfactuals = self.cf_generator.generate_counterfactuals(
+            pd.concat(instances_list),
+            total_CFs=num_counterfactuals,
+            desired_class=1,
+            random_seed=self.random_seed,
+            features_to_vary=self.feat_to_vary,
+            posthoc_sparsity_param=None,
+        )
+
+        ret = []
+        start = 0
+        for instances in instances_list:
+            ret.append(
+                pd.concat(
+                    [
+                        counterfactuals.cf_examples_list[i].final_cfs_df.iloc[:, :-1]
+                        for i in range(start, start + len(instances))
+                    ],
+                    ignore_index=False,
+                )
+            )
+            start += len(instances)
+        return ret
@@ -1,14 +1,29 @@
-from typing import List
+from typing import List, Literal, Optional
 import warnings
 
 import pandas as pd
 import numpy as np
-from sklearn.neighbors import NearestNeighbors
-from sklearn.preprocessing import OneHotEncoder
-from sklearn.compose import ColumnTransformer
 
 from ..base import LocalCounterfactualMethod
 from ..utils.action import extract_actions_pandas, apply_actions_pandas_rows
+from .neighbor_index import IndexBackend, IndexEncoding, load_or_fit_index
+
+
+def _nearest_unaffected(
+    cf_method: LocalCounterfactualMethod,
+    instances_list: List[pd.DataFrame],
+    num_counterfactuals: int,
+) -> List[np.ndarray]:
+    """Positions in `cf_method.train_unaffected` of the nearest unaffected
+    training instances of every instance of every group, found with a single
+    query of the index of `cf_method`."""
+    if len(instances_list) == 0:
+        return []
+    if num_counterfactuals > cf_method.train_unaffected.shape[0]:
+        warnings.warn(f"{num_counterfactuals} were requested, but only {cf_method.train_unaffected.shape[0]} unaffected instances given. Taking all.")
+        num_counterfactuals = cf_method.train_unaffected.shape[0]
+    _, indices = cf_method.index.kneighbors(pd.concat(instances_list), num_counterfactuals)
+    return np.split(indices, np.cumsum([instances.shape[0] for instances in instances_list])[:-1])
 
 class NearestNeighborMethod(LocalCounterfactualMethod):
     def __init__(self):
@@ -22,19 +37,32 @@ class NearestNeighborMethod(LocalCounterfactualMethod):
         continuous_features: List[str],
         feat_to_vary: List[str],
         random_seed=13,
+        index_backend: IndexBackend = "auto",
+        index_encoding: IndexEncoding = "dense",
+        index_path: Optional[str] = None,
     ):
+        """
+        The nearest neighbor index of the unaffected training instances is
+        built here, once (see `NeighborIndex` for `index_backend` and
+        `index_encoding`). If `index_path` is given, the index is loaded from
+        there when it was built from the same data, and saved there otherwise.
+        """
         X, y = data.drop(columns=[outcome_name]), data[outcome_name]
         self.numerical_features = continuous_features
         self.categorical_features = X.columns.difference(continuous_features).tolist()
 
-        self.encoder = ColumnTransformer(
-            [("ohe", OneHotEncoder(sparse=False), self.categorical_features)],
-            remainder="passthrough",
-        ).fit(X)
-
         train_preds = model.predict(X)
         self.train_unaffected = X[train_preds == 1]
-        self.train_unaffected_one_hot = self.encoder.transform(self.train_unaffected)
+        self.index_backend = index_backend
+        self.index_encoding = index_encoding
+        self.index = load_or_fit_index(
+            X,
+            self.train_unaffected,
+            self.categorical_features,
+            backend=index_backend,
+            encoding=index_encoding,
+            index_path=index_path,
+        )
         
         self.random_seed = random_seed
         self.feat_to_vary = feat_to_vary
@@ -42,16 +70,19 @@ class NearestNeighborMethod(LocalCounterfactualMethod):
     def explain_instances(
         self, instances: pd.DataFrame, num_counterfactuals: int
     ) -> pd.DataFrame:
-        instances_one_not = self.encoder.transform(instances)
-        if num_counterfactuals > self.train_unaffected.shape[0]:
-            warnings.warn(f"{num_counterfactuals} were requested, but only {self.train_unaffected.shape[0]} unaffected instances given. Taking all.")
-            num_counterfactuals = self.train_unaffected.shape[0]
-        nn = NearestNeighbors(n_neighbors=num_counterfactuals).fit(self.train_unaffected_one_hot)
-        distances, indices = nn.kneighbors(instances_one_not)
-
-        cfs = [self.train_unaffected.iloc[row] for row in indices]
+        return self.explain_instances_batch([instances], num_counterfactuals)[0]
 
-        return pd.concat(cfs, ignore_index=False)
+    def explain_instances_batch(
+        self,
+        instances_list: List[pd.DataFrame],
+        num_counterfactuals: int,
+        random_seeds: Optional[List[int]] = None,
+    ) -> List[pd.DataFrame]:
+        # Neighbors are deterministic, so `random_seeds` are not needed
+        return [
+            pd.concat([self.train_unaffected.iloc[row] for row in indices], ignore_index=False)
+            for indices in _nearest_unaffected(self, instances_list, num_counterfactuals)
+        ]
 
 class NearestNeighborsScaled(LocalCounterfactualMethod):
     def __init__(self):
@@ -65,63 +96,143 @@ class NearestNeighborsScaled(LocalCounterfactualMethod):
         continuous_features: List[str],
         n_scalars: int,
         random_seed=13,
+        index_backend: IndexBackend = "auto",
+        index_encoding: IndexEncoding = "dense",
+        index_path: Optional[str] = None,
+        scaling: Literal["all", "min"] = "all",
+        max_rows: int = 2**17,
     ):
+        """
+        See `NearestNeighborMethod.fit` for the nearest neighbor index, and
+        `_flipping_scalars` for `scaling` and `max_rows`.
+        """
         X, y = data.drop(columns=[outcome_name]), data[outcome_name]
         self.numerical_features = continuous_features
         self.categorical_features = X.columns.difference(continuous_features).tolist()
         self.model = model
 
-        self.encoder = ColumnTransformer(
-            [("ohe", OneHotEncoder(sparse=False), self.categorical_features)],
-            remainder="passthrough",
-        ).fit(X)
-
         train_preds = model.predict(X)
         self.train_unaffected = X[train_preds == 1]
-        self.train_unaffected_one_hot = self.encoder.transform(self.train_unaffected)
+        self.index_backend = index_backend
+        self.index_encoding = index_encoding
+        self.index = load_or_fit_index(
+            X,
+            self.train_unaffected,
+            self.categorical_features,
+            backend=index_backend,
+            encoding=index_encoding,
+            index_path=index_path,
+        )
         
         self.n_scalars = n_scalars
+        self.scaling = scaling
+        self.max_rows = max_rows
         self.random_seed = random_seed
 
     def explain_instances(
         self, instances: pd.DataFrame, num_counterfactuals: int
     ) -> pd.DataFrame:
-        instances_one_not = self.encoder.transform(instances)
-        if num_counterfactuals > self.train_unaffected.shape[0]:
-            warnings.warn(f"{num_counterfactuals} were requested, but only {self.train_unaffected.shape[0]} unaffected instances given. Taking all.")
-            num_counterfactuals = self.train_unaffected.shape[0]
-        nn = NearestNeighbors(n_neighbors=num_counterfactuals).fit(self.train_unaffected_one_hot)
-        distances, indices = nn.kneighbors(instances_one_not)
-
-        factuals = instances.apply(lambda col: col.repeat(num_counterfactuals)).reset_index(drop=True)
-        cfs = [self.train_unaffected.iloc[row] for row in indices]
-        cfs = pd.concat(cfs, ignore_index=True)
-        actions = extract_actions_pandas(
-            X=factuals,
-            cfs=cfs,
-            categorical_features=self.categorical_features,
-            numerical_features=self.numerical_features,
-            categorical_no_action_token="-",
-        )
+        return self.explain_instances_batch([instances], num_counterfactuals)[0]
 
-        # and then scale
-        scalars = np.linspace(0, 1 + 1 / self.n_scalars, self.n_scalars)
-        all_scaling_factors = []
-        for i, s in enumerate(scalars):
-            candidate_actions = actions.copy()
-            candidate_actions[self.numerical_features] *= s
-            new_cfs = apply_actions_pandas_rows(
+    def explain_instances_batch(
+        self,
+        instances_list: List[pd.DataFrame],
+        num_counterfactuals: int,
+        random_seeds: Optional[List[int]] = None,
+    ) -> List[pd.DataFrame]:
+        # Neighbors and flipping scalars of all groups are found at once;
+        # scaling is deterministic, so `random_seeds` are not needed
+        if len(instances_list) == 0:
+            return []
+        neighbors = _nearest_unaffected(self, instances_list, num_counterfactuals)
+        factuals_list, actions_list = [], []
+        for instances, indices in zip(instances_list, neighbors):
+            factuals = instances.apply(lambda col: col.repeat(indices.shape[1])).reset_index(drop=True)
+            cfs = pd.concat([self.train_unaffected.iloc[row] for row in indices], ignore_index=True)
+            factuals_list.append(factuals)
+            actions_list.append(extract_actions_pandas(
                 X=factuals,
-                actions=candidate_actions,
-                numerical_columns=self.numerical_features,
-                categorical_columns=self.categorical_features,
+                cfs=cfs,
+                categorical_features=self.categorical_features,
+                numerical_features=self.numerical_features,
                 categorical_no_action_token="-",
-            )
-            new_preds = self.model.predict(new_cfs)
-            scaling_factors = np.where(new_preds == 1, s, np.nan)
-            all_scaling_factors.append(scaling_factors)
-        
-        multipliers = np.array(all_scaling_factors).T
+            ))
+
+        multipliers = self._flipping_scalars(
+            pd.concat(factuals_list, ignore_index=True), pd.concat(actions_list, ignore_index=True)
+        )
+        splits = np.cumsum([factuals.shape[0] for factuals in factuals_list])[:-1]
+        return [
+            self._scaled_counterfactuals(factuals, actions, group_multipliers)
+            for factuals, actions, group_multipliers in zip(factuals_list, actions_list, np.split(multipliers, splits))
+        ]
+
+    def _flipping_scalars(self, factuals: pd.DataFrame, actions: pd.DataFrame) -> np.ndarray:
+        """
+        Scalars of the numerical part of every action (one per row of
+        `factuals`) that flip the prediction of the factual, among
+        `n_scalars` evenly spaced in [0, 1 + 1 / n_scalars].
+
+        With `scaling="all"`, every scalar is tried: counterfactuals of blocks
+        of scalars are stacked into frames of at most `max_rows` rows, so that
+        the model is called once per block. With `scaling="min"`, only the
+        smallest flipping scalar is kept, found by bisection over the scalars,
+        which assumes that the prediction flips at most once along every action.
+
+        Returns:
+            np.ndarray: matrix of shape (n_rows, n_scalars) holding the
+            flipping scalars and NaN elsewhere.
+        """
+        scalars = np.linspace(0, 1 + 1 / self.n_scalars, self.n_scalars)
+        n_pairs = factuals.shape[0]
+        multipliers = np.full((n_pairs, scalars.shape[0]), np.nan)
+        if n_pairs == 0:
+            return multipliers
+        # Categorical changes do not depend on the scalar
+        base = apply_actions_pandas_rows(
+            X=factuals,
+            actions=actions,
+            numerical_columns=self.numerical_features,
+            categorical_columns=self.categorical_features,
+            categorical_no_action_token="-",
+        )
+        numerical_factuals = factuals[self.numerical_features].to_numpy()
+        numerical_actions = actions[self.numerical_features].to_numpy()
+
+        def flips(pair_idxs: np.ndarray, scalar_idxs: np.ndarray) -> np.ndarray:
+            ret = np.empty(pair_idxs.shape[0], dtype=bool)
+            for start in range(0, pair_idxs.shape[0], self.max_rows):
+                pairs = pair_idxs[start:start + self.max_rows]
+                scaled = scalars[scalar_idxs[start:start + self.max_rows]][:, None]
+                new_cfs = base.iloc[pairs].reset_index(drop=True)
+                new_cfs[self.numerical_features] = numerical_factuals[pairs] + numerical_actions[pairs] * scaled
+                ret[start:start + self.max_rows] = self.model.predict(new_cfs) == 1
+            return ret
+
+        if self.scaling == "all":
+            pair_idxs = np.tile(np.arange(n_pairs), scalars.shape[0])
+            scalar_idxs = np.repeat(np.arange(scalars.shape[0]), n_pairs)
+            flipped = flips(pair_idxs, scalar_idxs).reshape(scalars.shape[0], n_pairs).T
+            multipliers[flipped] = np.broadcast_to(scalars, multipliers.shape)[flipped]
+        elif self.scaling == "min":
+            # Pairs that do not flip at the largest scalar are assumed to never flip
+            pair_idxs = np.arange(n_pairs)
+            pair_idxs = pair_idxs[flips(pair_idxs, np.full(n_pairs, scalars.shape[0] - 1))]
+            low = np.full(pair_idxs.shape[0], -1)
+            high = np.full(pair_idxs.shape[0], scalars.shape[0] - 1)
+            active = high - low > 1
+            while active.any():
+                mid = (low[active] + high[active]) // 2
+                mid_flips = flips(pair_idxs[active], mid)
+                high[np.flatnonzero(active)[mid_flips]] = mid[mid_flips]
+                low[np.flatnonzero(active)[~mid_flips]] = mid[~mid_flips]
+                active = high - low > 1
+            multipliers[pair_idxs, high] = scalars[high]
+        else:
+            raise ValueError(f"Unsupported scaling mode: {self.scaling}")
+        return multipliers
+
+    def _scaled_counterfactuals(self, factuals: pd.DataFrame, actions: pd.DataFrame, multipliers: np.ndarray) -> pd.DataFrame:
         n_notna_multipliers = np.sum(~ np.isnan(multipliers), axis=1)
         factuals = factuals.apply(lambda col: col.repeat(n_notna_multipliers)).reset_index(drop=True)
         actions = actions.apply(lambda col: col.repeat(n_notna_multipliers)).reset_index(drop=True)
@@ -138,4 +249,3 @@ class NearestNeighborsScaled(LocalCounterfactualMethod):
         )
 
         return cfs
-
@@ -0,0 +1,162 @@
+from typing import Any, Dict, List, Literal, Optional, Tuple
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.neighbors import NearestNeighbors
+from sklearn.preprocessing import OneHotEncoder
+
+from ..utils.fingerprint import dataframe_fingerprint
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+IndexBackend = Literal["auto", "kd_tree", "ball_tree", "brute", "hnsw"]
+IndexEncoding = Literal["dense", "sparse", "float32"]
+
+
+class NeighborIndex:
+    """Nearest neighbor index over the one-hot encoding of a set of instances,
+    built once and queried in batches.
+
+    Backends:
+    - "auto", "kd_tree", "ball_tree", "brute": exact `sklearn.neighbors.NearestNeighbors`
+      ("brute" computes distances in BLAS batches and is the only one that
+      accepts the sparse encoding);
+    - "hnsw": approximate HNSW graph, if `hnswlib` is installed (always float32).
+
+    Encodings: "dense" (float64, as `OneHotEncoder(sparse=False)`), "sparse"
+    (CSR matrix) or "float32" (dense, half the memory). Only the default
+    "auto" backend on the dense encoding returns exactly the neighbors of a
+    `NearestNeighbors` fitted on the dense encoding; the other exact backends
+    only differ on ties.
+    """
+
+    def __init__(
+        self,
+        categorical_features: List[str],
+        backend: IndexBackend = "auto",
+        encoding: IndexEncoding = "dense",
+        hnsw_params: Optional[Dict[str, int]] = None,
+    ):
+        """
+        Args:
+            categorical_features (List[str]): columns to one-hot encode; the others are passed through
+            backend (IndexBackend): index backend
+            encoding (IndexEncoding): encoding of the indexed instances and the queries
+            hnsw_params (Optional[Dict[str, int]]): `M`, `ef_construction` and `ef` of the "hnsw" backend
+        """
+        if backend not in ("auto", "kd_tree", "ball_tree", "brute", "hnsw"):
+            raise ValueError(f"Unsupported nearest neighbor index backend: {backend}")
+        if encoding not in ("dense", "sparse", "float32"):
+            raise ValueError(f"Unsupported nearest neighbor index encoding: {encoding}")
+        if encoding == "sparse" and backend not in ("auto", "brute"):
+            raise ValueError("The sparse encoding is only supported by the brute force backend")
+        if backend == "hnsw" and hnswlib is None:
+            raise ValueError("The hnsw backend requires hnswlib to be installed")
+        self.categorical_features = categorical_features
+        self.backend = backend
+        self.encoding = encoding
+        self.hnsw_params = {"M": 16, "ef_construction": 200, "ef": 50, **(hnsw_params or {})}
+        self.fingerprint = None
+
+    def fit(self, X: pd.DataFrame, indexed: pd.DataFrame) -> "NeighborIndex":
+        """Fits the encoding on `X` and indexes the instances of `indexed`."""
+        self.encoder = ColumnTransformer(
+            [("ohe", OneHotEncoder(sparse=self.encoding == "sparse"), self.categorical_features)],
+            remainder="passthrough",
+            sparse_threshold=1.0 if self.encoding == "sparse" else 0.0,
+        ).fit(X)
+        self.n_indexed = indexed.shape[0]
+        self.fingerprint = self.data_fingerprint(X, indexed)
+
+        encoded = self.transform(indexed)
+        if self.backend == "hnsw":
+            self.index = hnswlib.Index(space="l2", dim=encoded.shape[1])
+            self.index.init_index(
+                max_elements=max(1, self.n_indexed),
+                ef_construction=self.hnsw_params["ef_construction"],
+                M=self.hnsw_params["M"],
+            )
+            if self.n_indexed > 0:
+                self.index.add_items(encoded, np.arange(self.n_indexed))
+        else:
+            self.index = NearestNeighbors(algorithm=self.backend).fit(encoded)
+        return self
+
+    def data_fingerprint(self, X: pd.DataFrame, indexed: pd.DataFrame) -> str:
+        """Identifies the data and configuration an index is built from."""
+        return joblib.hash((
+            dataframe_fingerprint(X),
+            dataframe_fingerprint(indexed),
+            list(self.categorical_features),
+            self.backend,
+            self.encoding,
+            self.hnsw_params,
+        ))
+
+    def transform(self, instances: pd.DataFrame) -> Any:
+        encoded = self.encoder.transform(instances)
+        if self.encoding == "sparse":
+            return encoded.tocsr()
+        if self.encoding == "float32" or self.backend == "hnsw":
+            return np.asarray(encoded, dtype=np.float32)
+        return encoded
+
+    def kneighbors(self, instances: pd.DataFrame, n_neighbors: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Args:
+            instances (pd.DataFrame): query instances
+            n_neighbors (int): number of neighbors of every instance, at most the number of indexed instances
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: euclidean distances and positions
+            (in the indexed instances) of the neighbors, of shape (n_instances, n_neighbors),
+            closest first.
+        """
+        encoded = self.transform(instances)
+        if self.backend == "hnsw":
+            self.index.set_ef(max(self.hnsw_params["ef"], n_neighbors))
+            indices, squared_distances = self.index.knn_query(encoded, k=n_neighbors)
+            return np.sqrt(squared_distances), indices.astype(np.int64)
+        return self.index.kneighbors(encoded, n_neighbors=n_neighbors)
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        joblib.dump(self, path)
+
+    @staticmethod
+    def load(path: str) -> "NeighborIndex":
+        return joblib.load(path)
+
+
+def load_or_fit_index(
+    X: pd.DataFrame,
+    indexed: pd.DataFrame,
+    categorical_features: List[str],
+    backend: IndexBackend = "auto",
+    encoding: IndexEncoding = "dense",
+    index_path: Optional[str] = None,
+) -> NeighborIndex:
+    """Builds a `NeighborIndex` of `indexed`, or loads it from `index_path` if
+    it was saved there for the same data and configuration. A built index is
+    saved to `index_path`, e.g. next to the model pickle.
+    """
+    index = NeighborIndex(categorical_features, backend=backend, encoding=encoding)
+    if index_path is not None and os.path.exists(index_path):
+        try:
+            saved = NeighborIndex.load(index_path)
+        except Exception:
+            saved = None
+        if isinstance(saved, NeighborIndex) and saved.fingerprint == index.data_fingerprint(X, indexed):
+            return saved
+
+    index.fit(X, indexed)
+    if index_path is not None:
+        index.save(index_path)
+    return index
@@ -1,10 +1,12 @@
+from typing import List, Optional
+
 import pandas as pd
 from ..base import LocalCounterfactualMethod
 import numpy as np
-from sklearn.inspection import permutation_importance
+from ..utils.feature_importance import FeatureImportanceCache, permutation_importances
 
 class RandomSampling(LocalCounterfactualMethod):
-    def __init__(self, model, n_most_important, n_categorical_most_frequent, numerical_features, categorical_features, feat_to_vary, random_state=None):
+    def __init__(self, model, n_most_important, n_categorical_most_frequent, numerical_features, categorical_features, feat_to_vary, random_state=None, max_rows=2**17, importance_cache: Optional[FeatureImportanceCache] = None, importance_max_samples: Optional[int] = None, n_jobs: Optional[int] = None):
         self.model = model
         self.n_most_important = n_most_important
         self.n_categorical_most_frequent = n_categorical_most_frequent
@@ -12,12 +14,19 @@ class RandomSampling(LocalCounterfactualMethod):
         self.categorical_features = categorical_features
         self.feat_to_vary = feat_to_vary
         self.random_state = random_state
+        self.max_rows = max_rows
+        self.importance_cache = importance_cache
+        self.importance_max_samples = importance_max_samples
+        self.n_jobs = n_jobs
 
     def fit(self, X: pd.DataFrame, y: pd.Series):
         self.X_ = X
         self.feature_names_ = X.columns.tolist()
         # Check if all features are in feat_to_vary
-        if self.feat_to_vary is not None:
+        if isinstance(self.feat_to_vary, str):
+            # "all", as accepted by the other local counterfactual methods
+            all_features_included = self.feat_to_vary == "all"
+        elif self.feat_to_vary is not None:
             # If feat_to_vary contains all features, revert to the standard method
             all_features_included = set(self.feat_to_vary) == set(self.feature_names_)
         else:
@@ -28,8 +37,15 @@ class RandomSampling(LocalCounterfactualMethod):
             self.top_k_features_ = [feat for feat in self.feat_to_vary if feat in self.feature_names_]
         else:
             # Default to selecting the top-k features based on permutation importance
-            result = permutation_importance(self.model, X, y, random_state=self.random_state)
-            self.feature_importances_ = result.importances_mean
+            self.feature_importances_ = permutation_importances(
+                self.model,
+                X,
+                y,
+                random_state=self.random_state,
+                max_samples=self.importance_max_samples,
+                n_jobs=self.n_jobs,
+                cache=self.importance_cache,
+            ).to_numpy()
             top_k_indices = np.argsort(self.feature_importances_)[::-1][:self.n_most_important]
             self.top_k_features_ = X.columns[top_k_indices]
 
@@ -55,20 +71,113 @@ class RandomSampling(LocalCounterfactualMethod):
 
         return self
 
-    def _sample_instances(self, n_samples: int, fixed_feature_values, random_state=None):
-        if random_state is not None:
-            np.random.seed(random_state)
-        samples_columns = []
-        for col in self.X_.columns:
-            if col in fixed_feature_values:
-                column = [fixed_feature_values[col]] * n_samples
-            elif col in self.numerical_features:
-                column = np.random.uniform(self.numeric_min_[col], self.numeric_max_[col], n_samples)
+    def _instance_rngs(self, n_instances: int, random_state=None) -> List[np.random.Generator]:
+        """Independent random generators of the instances, derived from
+        `random_state` (or the one given at initialization), so that the
+        counterfactuals of an instance do not depend on the other instances
+        or on the global NumPy random state."""
+        seed = random_state if random_state is not None else self.random_state
+        return [np.random.default_rng(seed_sequence) for seed_sequence in np.random.SeedSequence(seed).spawn(n_instances)]
+
+    def _explain_batch(
+        self,
+        instances: pd.DataFrame,
+        num_counterfactuals: int,
+        n_samples: int,
+        rngs: List[np.random.Generator],
+    ) -> List[Optional[pd.DataFrame]]:
+        """Counterfactuals of every instance, or None if none was found.
+
+        For every instance, `n_samples` copies of it are changed one randomly
+        chosen feature of `top_k_features_` at a time, to the value of that
+        feature in a random sample, until at least two features were changed
+        and `num_counterfactuals` distinct copies flip the prediction.
+        Instances and their copies are encoded as one float matrix
+        (categories as codes), so that every round is a few fancy-indexing
+        operations and a single `predict` for all instances still searching.
+        """
+        columns = self.X_.columns.tolist()
+        top_features = [col for col in self.top_k_features_]
+        top_columns = np.array([columns.index(col) for col in top_features], dtype=int)
+        n_instances = instances.shape[0]
+        instances = instances[columns]
+
+        # Encoding: numerical values as they are, categories as codes among
+        # the values of the instances and the categories that can be sampled
+        values = np.empty((n_instances, len(columns)))
+        categories, sampled_codes = {}, {}
+        for j, col in enumerate(columns):
+            if col in self.numerical_features:
+                values[:, j] = instances[col].to_numpy(dtype=float)
             else:
-                column = np.random.choice(self.categorical_top_m_[col], n_samples)
-            samples_columns.append(column)
-        return pd.DataFrame({col_name: column for col_name, column in zip(self.X_.columns, samples_columns)})
-    
+                sampleable = list(self.categorical_top_m_[col]) if col in top_features else []
+                codes, categories[col] = pd.factorize(
+                    pd.concat([instances[col], pd.Series(sampleable, dtype=object)], ignore_index=True)
+                )
+                values[:, j] = codes[:n_instances]
+                sampled_codes[col] = codes[n_instances:]
+
+        # Values of the random samples in the features that may change
+        random_values = np.empty((n_instances, n_samples, len(top_features)))
+        for i, rng in enumerate(rngs):
+            for t, col in enumerate(top_features):
+                if col in self.numerical_features:
+                    random_values[i, :, t] = rng.uniform(self.numeric_min_[col], self.numeric_max_[col], n_samples)
+                else:
+                    random_values[i, :, t] = sampled_codes[col][rng.integers(0, len(sampled_codes[col]), n_samples)]
+
+        def to_frame(encoded: np.ndarray) -> pd.DataFrame:
+            frame = {}
+            for j, col in enumerate(columns):
+                if col in categories:
+                    frame[col] = categories[col].to_numpy()[encoded[:, j].astype(int)]
+                elif col in top_features:
+                    frame[col] = encoded[:, j]
+                else:
+                    frame[col] = encoded[:, j].astype(instances[col].dtype)
+            return pd.DataFrame(frame)
+
+        candidates = np.repeat(values, n_samples, axis=0)
+        found: List[Optional[np.ndarray]] = [None] * n_instances
+        active = np.arange(n_instances)
+        sample_idxs = np.arange(n_samples)
+        for num_features_to_vary in range(1, len(top_features) + 1):
+            if active.shape[0] == 0:
+                break
+            selected = np.stack([rngs[i].integers(0, len(top_features), n_samples) for i in active])
+            rows = active[:, None] * n_samples + sample_idxs
+            candidates[rows, top_columns[selected]] = random_values[active[:, None], sample_idxs, selected]
+
+            rows = rows.ravel()
+            preds = np.empty(rows.shape[0], dtype=bool)
+            for start in range(0, rows.shape[0], self.max_rows):
+                preds[start:start + self.max_rows] = self.model.predict(to_frame(candidates[rows[start:start + self.max_rows]])) == 1
+            preds = preds.reshape(active.shape[0], n_samples)
+
+            still_active = []
+            for position, i in enumerate(active):
+                if preds[position].any():
+                    flipped = candidates[i * n_samples + np.flatnonzero(preds[position])]
+                    rows_found = flipped if found[i] is None else np.concatenate([found[i], flipped])
+                    # Distinct rows, in order of first occurrence
+                    _, first = np.unique(rows_found, axis=0, return_index=True)
+                    found[i] = rows_found[np.sort(first)]
+                # Always change at least 2 features before stopping
+                if not (num_features_to_vary >= 2 and found[i] is not None and found[i].shape[0] >= num_counterfactuals):
+                    still_active.append(i)
+            active = np.array(still_active, dtype=int)
+
+        ret = []
+        for i in range(n_instances):
+            if found[i] is None:
+                ret.append(None)
+                continue
+            rows_found = found[i]
+            if rows_found.shape[0] > num_counterfactuals:
+                rows_found = rows_found[rngs[i].choice(rows_found.shape[0], num_counterfactuals, replace=False)]
+            ret.append(to_frame(rows_found))
+        return ret
+
     def explain(self, instance, num_counterfactuals, n_samples=1000, random_state=None):
         # Check if instance is a single row DataFrame
         if not isinstance(instance, pd.DataFrame) or instance.shape[0] != 1:
@@ -78,51 +187,52 @@ class RandomSampling(LocalCounterfactualMethod):
         if set(instance.columns) != set(self.X_.columns):
             raise ValueError("Columns of the input instance do not match the columns used during fitting.")
 
-        fixed_feature_values = {}
-        for col in self.feature_names_:
-            if col not in self.top_k_features_:
-                fixed_feature_values[col] = instance[col].item()
-        random_instances = self._sample_instances(n_samples, fixed_feature_values, random_state)
-
-        # Generate copies of the query instance that will be changed one feature
-        # at a time to encourage sparsity.
-        cfs_df = None
-        candidate_cfs = instance.apply(lambda col: col.repeat(n_samples)).reset_index(drop=True)
-        # Loop to change one feature at a time, then two features, and so on.
-        for num_features_to_vary in range(1, len(self.top_k_features_)+1):
-            selected_features = np.random.choice(self.top_k_features_, (n_samples, 1), replace=True)
-            for k in range(n_samples):
-                candidate_cfs.at[k, selected_features[k][0]] = random_instances.at[k, selected_features[k][0]]
-            preds = self.model.predict(candidate_cfs)
-            if sum(preds) > 0:
-                rows_to_add = candidate_cfs[preds == 1]
-
-                if cfs_df is None:
-                    cfs_df = rows_to_add.copy()
-                else:
-                    cfs_df = pd.concat([cfs_df, rows_to_add])
-                cfs_df.drop_duplicates(inplace=True)
-                # Always change at least 2 features before stopping
-                if num_features_to_vary >= 2 and len(cfs_df) >= num_counterfactuals:
-                    break
-
-        if cfs_df is None:
-            return None
-        
-        assert isinstance(cfs_df, pd.DataFrame)
-        if len(cfs_df) > num_counterfactuals:
-            cfs_df = cfs_df.sample(num_counterfactuals)
-        cfs_df.reset_index(inplace=True, drop=True)
-        return cfs_df
+        return self._explain_batch(instance, num_counterfactuals, n_samples, self._instance_rngs(1, random_state))[0]
 
     def explain_instances(
         self, instances: pd.DataFrame, num_counterfactuals: int, n_samples=1000, random_state=None
     ) -> pd.DataFrame:
-        cfs = []
-        for i in range(instances.shape[0]):
-            cfs_instance = self.explain(instances.iloc[i:i+1], num_counterfactuals=num_counterfactuals, n_samples=n_samples, random_state=random_state)
-            if cfs_instance is not None:
-                cfs.append(cfs_instance)
-        
-        ret = pd.concat(cfs, ignore_index=False) if cfs != [] else pd.DataFrame(columns=instances.columns).astype(instances.dtypes)
+        return self._explain_groups([instances], num_counterfactuals, n_samples, [random_state])[0]
+
+    def explain_instances_batch(
+        self,
+        instances_list: List[pd.DataFrame],
+        num_counterfactuals: int,
+        random_seeds: Optional[List[int]] = None,
+    ) -> List[pd.DataFrame]:
+        # Every group gets its own generators, so the global random state is not reseeded
+        return self._explain_groups(
+            instances_list,
+            num_counterfactuals,
+            random_states=random_seeds if random_seeds is not None else [None] * len(instances_list),
+        )
+
+    def _explain_groups(
+        self,
+        instances_list: List[pd.DataFrame],
+        num_counterfactuals: int,
+        n_samples: int = 1000,
+        random_states: Optional[List[Optional[int]]] = None,
+    ) -> List[pd.DataFrame]:
+        """Explains the instances of all groups at once."""
+        if len(instances_list) == 0:
+            return []
+        if set(instances_list[0].columns) != set(self.X_.columns):
+            raise ValueError("Columns of the input instances do not match the columns used during fitting.")
+        rngs = [
+            rng
+            for instances, random_state in zip(instances_list, random_states)
+            for rng in self._instance_rngs(instances.shape[0], random_state)
+        ]
+        cfs = self._explain_batch(pd.concat(instances_list, ignore_index=True), num_counterfactuals, n_samples, rngs)
+
+        ret, start = [], 0
+        for instances in instances_list:
+            group_cfs = [cfs_instance for cfs_instance in cfs[start:start + instances.shape[0]] if cfs_instance is not None]
+            start += instances.shape[0]
+            ret.append(
+                pd.concat(group_cfs, ignore_index=False)[instances.columns]
+                if group_cfs != []
+                else pd.DataFrame(columns=instances.columns).astype(instances.dtypes)
+            )
         return ret
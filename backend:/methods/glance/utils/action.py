@@ -1,4 +1,4 @@
-from typing import List, Any, Optional
+from typing import List, Any, Optional, Union, Callable, Tuple
 
 import numpy as np
 import numpy.typing as npt
@@ -87,6 +87,203 @@ def apply_action_numpy(
     return ret
 
 
+def apply_actions_numpy(
+    X: npt.NDArray[np.number],
+    actions: npt.NDArray[np.number],
+    numerical_columns: List[int],
+    categorical_columns: List[int],
+    categorical_no_action_token: np.number,
+) -> npt.NDArray[np.number]:
+    """Batched version of `apply_action_numpy`. Apply every row of `actions`
+    to all rows of `X` in a single broadcasted step.
+
+    Args:
+        X (npt.NDArray[np.number]): matrix of observations, shape (n_rows, n_features)
+        actions (npt.NDArray[np.number]): matrix of actions, shape (n_actions, n_features)
+        numerical_columns (List[int]): numerical column indices
+        categorical_columns (List[int]): categorical column indices
+        categorical_no_action_token (np.number): special value signifying no-action (i.e. equivalent to 0 for numerical columns)
+
+    Returns:
+        npt.NDArray[np.number]: stacked observations of shape (n_actions * n_rows, n_features),
+        where rows `i * n_rows` to `(i + 1) * n_rows` are the result of applying action `i`.
+    """
+    assert len(X.shape) == 2
+    assert len(actions.shape) == 2
+    assert (
+        X.shape[1] == actions.shape[1]
+    ), "actions should have length equal to the number of columns"
+
+    n_actions, n_rows = actions.shape[0], X.shape[0]
+    ret = np.broadcast_to(X, (n_actions, *X.shape)).copy()
+    ret[:, :, numerical_columns] += actions[:, None, numerical_columns]
+    categorical_actions = actions[:, categorical_columns]
+    ret[:, :, categorical_columns] = np.where(
+        (categorical_actions != categorical_no_action_token)[:, None, :],
+        categorical_actions[:, None, :],
+        ret[:, :, categorical_columns],
+    )
+
+    return ret.reshape(n_actions * n_rows, X.shape[1])
+
+
+class EncodedActionApplier:
+    """Array-backed engine for applying many candidate actions to the same
+    group of instances.
+
+    The instances are ordinal-encoded once at construction. Candidate actions
+    are encoded into an `(n_actions, n_features)` matrix, applied with
+    `apply_actions_numpy` and decoded back to a DataFrame with the dtypes of
+    the original instances, so that a whole batch of actions is scored with a
+    single `model.predict` call. The results are identical to calling
+    `apply_action_pandas` once per action.
+    """
+
+    def __init__(
+        self,
+        X: pd.DataFrame,
+        numerical_columns: List[str],
+        categorical_columns: List[str],
+        categorical_no_action_token: Any = "-",
+        max_batch_rows: int = 500_000,
+    ):
+        """
+        Args:
+            X (pd.DataFrame): instances the actions will be applied to
+            numerical_columns (List[str]): numerical column names
+            categorical_columns (List[str]): categorical column names
+            categorical_no_action_token (Any): special value signifying no-action
+            max_batch_rows (int): upper bound on the number of stacked rows sent to a single `model.predict` call
+        """
+        self.X = X
+        self.X_reset = X.reset_index(drop=True)
+        self.columns = X.columns
+        self.dtypes = X.dtypes
+        self.numerical_columns = list(numerical_columns)
+        self.categorical_columns = list(categorical_columns)
+        self.categorical_no_action_token = categorical_no_action_token
+        self.max_batch_rows = max_batch_rows
+        self.numerical_idxs = [X.columns.get_loc(col) for col in self.numerical_columns]
+        self.categorical_idxs = [X.columns.get_loc(col) for col in self.categorical_columns]
+
+        self.vocabulary = {col: {} for col in self.categorical_columns}
+        self.X_encoded = np.empty(X.shape, dtype=float)
+        if self.numerical_columns:
+            self.X_encoded[:, self.numerical_idxs] = X[self.numerical_columns].to_numpy(dtype=float)
+        for col, idx in zip(self.categorical_columns, self.categorical_idxs):
+            self.X_encoded[:, idx] = self._encode_values(col, X[col].to_numpy())
+
+    @property
+    def n_rows(self) -> int:
+        return self.X_encoded.shape[0]
+
+    def _encode_values(self, col: str, values: np.ndarray) -> np.ndarray:
+        vocabulary = self.vocabulary[col]
+        for value in pd.unique(values):
+            if value not in vocabulary:
+                vocabulary[value] = len(vocabulary)
+        return np.array([vocabulary[value] for value in values], dtype=float)
+
+    def encode_actions(
+        self, actions: Union[pd.DataFrame, pd.Series, List[pd.Series]]
+    ) -> npt.NDArray[np.float64]:
+        """Encode actions to an `(n_actions, n_features)` matrix. Numerical
+        no-actions are encoded as 0 and categorical no-actions as -1.
+        """
+        if isinstance(actions, pd.Series):
+            actions = actions.to_frame().T
+        elif not isinstance(actions, pd.DataFrame):
+            actions = pd.DataFrame(list(actions))
+        actions = actions[self.columns]
+
+        encoded = np.empty(actions.shape, dtype=float)
+        for col, idx in zip(self.numerical_columns, self.numerical_idxs):
+            values = actions[col].to_numpy()
+            no_action = values == self.categorical_no_action_token
+            encoded[:, idx] = np.where(no_action, 0, values).astype(float)
+        for col, idx in zip(self.categorical_columns, self.categorical_idxs):
+            values = actions[col].to_numpy()
+            no_action = values == self.categorical_no_action_token
+            encoded[:, idx] = -1
+            if not no_action.all():
+                encoded[~no_action, idx] = self._encode_values(col, values[~no_action])
+        return encoded
+
+    def apply(self, encoded_actions: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+        """Apply an encoded action matrix to the instances. Returns the stacked
+        `(n_actions * n_rows, n_features)` encoded counterfactuals."""
+        return apply_actions_numpy(
+            X=self.X_encoded,
+            actions=encoded_actions,
+            numerical_columns=self.numerical_idxs,
+            categorical_columns=self.categorical_idxs,
+            categorical_no_action_token=-1,
+        )
+
+    def decode(self, encoded: npt.NDArray[np.float64]) -> pd.DataFrame:
+        """Decode stacked encoded counterfactuals back to a DataFrame with the
+        columns and dtypes of the original instances."""
+        ret = pd.DataFrame(
+            {
+                col: encoded[:, i]
+                if col not in self.vocabulary
+                else np.array(list(self.vocabulary[col]), dtype=object)[
+                    encoded[:, i].astype(int)
+                ]
+                for i, col in enumerate(self.columns)
+            },
+            columns=self.columns,
+        )
+        return ret.astype(self.dtypes)
+
+    def repeated_instances(self, n_repeats: int) -> pd.DataFrame:
+        """The instances stacked `n_repeats` times, aligned with the output of `apply`."""
+        return self.X_reset.iloc[np.tile(np.arange(self.n_rows), n_repeats)].reset_index(drop=True)
+
+    def _action_batches(self, n_actions: int):
+        step = max(1, self.max_batch_rows // max(1, self.n_rows))
+        for start in range(0, n_actions, step):
+            yield start, min(start + step, n_actions)
+
+    def evaluate(
+        self,
+        model: Any,
+        actions: Union[pd.DataFrame, List[pd.Series], npt.NDArray[np.float64]],
+        dist_func_dataframe: Optional[Callable[[pd.DataFrame, pd.DataFrame], pd.Series]] = None,
+    ) -> Tuple[np.ndarray, Optional[npt.NDArray[np.float64]]]:
+        """Apply all `actions` to the instances and predict the outcome of the
+        counterfactuals, batching as many actions per `model.predict` call as
+        `max_batch_rows` allows.
+
+        Args:
+            model (Any): model with a `predict` method
+            actions: candidate actions, either raw (DataFrame / list of Series) or already encoded
+            dist_func_dataframe (Callable, optional): if given, also compute the cost of every counterfactual
+
+        Returns:
+            Tuple[np.ndarray, Optional[npt.NDArray[np.float64]]]: predictions and costs,
+            both of shape (n_actions, n_rows). Costs are None if no distance function is given.
+        """
+        encoded_actions = (
+            actions if isinstance(actions, np.ndarray) else self.encode_actions(actions)
+        )
+        n_actions = encoded_actions.shape[0]
+        predictions = np.zeros((n_actions, self.n_rows), dtype=int)
+        costs = None if dist_func_dataframe is None else np.zeros((n_actions, self.n_rows))
+        if n_actions == 0 or self.n_rows == 0:
+            return predictions, costs
+
+        for start, end in self._action_batches(n_actions):
+            cfs = self.decode(self.apply(encoded_actions[start:end]))
+            predictions[start:end] = np.asarray(model.predict(cfs)).reshape(end - start, self.n_rows)
+            if dist_func_dataframe is not None:
+                costs[start:end] = np.asarray(
+                    dist_func_dataframe(self.repeated_instances(end - start), cfs)
+                ).reshape(end - start, self.n_rows)
+
+        return predictions, costs
+
+
 def extract_actions_pandas(
     X: pd.DataFrame,
     cfs: pd.DataFrame,
@@ -1,6 +1,7 @@
 # import keras
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score
+import numpy as np
 import pandas as pd
 import warnings
 from sklearn import preprocessing
@@ -56,6 +57,201 @@ def one_hot(data,categorical_features,dataset_name):
         return data_oh, features
 
 
+GERMAN_CREDIT_COLUMNS = [
+    "Existing-Account-Status_A11",
+    "Existing-Account-Status_A12",
+    "Existing-Account-Status_A13",
+    "Existing-Account-Status_A14",
+    "Month-Duration",
+    "Credit-History_A30",
+    "Credit-History_A31",
+    "Credit-History_A32",
+    "Credit-History_A33",
+    "Credit-History_A34",
+    "Purpose_A40",
+    "Purpose_A41",
+    "Purpose_A410",
+    "Purpose_A42",
+    "Purpose_A43",
+    "Purpose_A44",
+    "Purpose_A45",
+    "Purpose_A46",
+    "Purpose_A48",
+    "Purpose_A49",
+    "Credit-Amount",
+    "Savings-Account_A61",
+    "Savings-Account_A62",
+    "Savings-Account_A63",
+    "Savings-Account_A64",
+    "Savings-Account_A65",
+    "Present-Employment_A71",
+    "Present-Employment_A72",
+    "Present-Employment_A73",
+    "Present-Employment_A74",
+    "Present-Employment_A75",
+    "Instalment-Rate_1",
+    "Instalment-Rate_2",
+    "Instalment-Rate_3",
+    "Instalment-Rate_4",
+    "Sex_A91",
+    "Sex_A92",
+    "Sex_A93",
+    "Sex_A94",
+    "Guarantors_A101",
+    "Guarantors_A102",
+    "Guarantors_A103",
+    "Residence_1",
+    "Residence_2",
+    "Residence_3",
+    "Residence_4",
+    "Property_A121",
+    "Property_A122",
+    "Property_A123",
+    "Property_A124",
+    "Age",
+    "Installment_A141",
+    "Installment_A142",
+    "Installment_A143",
+    "Housing_A151",
+    "Housing_A152",
+    "Housing_A153",
+    "Existing-Credits_1",
+    "Existing-Credits_2",
+    "Existing-Credits_3",
+    "Existing-Credits_4",
+    "Job_A171",
+    "Job_A172",
+    "Job_A173",
+    "Job_A174",
+    "Num-People_1",
+    "Num-People_2",
+    "Telephone_A191",
+    "Telephone_A192",
+    "Foreign-Worker_A201",
+    "Foreign-Worker_A202",
+]
+
+COMPAS_COLUMNS = [
+    "Sex_Female",
+    "Sex_Male",
+    "Age_Cat_Less than 25",
+    "Age_Cat_25 - 45",
+    "Age_Cat_Greater than 45",
+    "Race_African-American",
+    "Race_Asian",
+    "Race_Caucasian",
+    "Race_Hispanic",
+    "Race_Native American",
+    "Race_Other",
+    "C_Charge_Degree_F",
+    "C_Charge_Degree_M",
+    "Priors_Count",
+    "Time_Served",
+]
+
+DEFAULT_CREDIT_COLUMNS = [
+    "LIMIT_BAL",
+    "SEX_1",
+    "SEX_2",
+    "EDUCATION_0",
+    "EDUCATION_1",
+    "EDUCATION_2",
+    "EDUCATION_3",
+    "EDUCATION_4",
+    "EDUCATION_5",
+    "EDUCATION_6",
+    "MARRIAGE_0",
+    "MARRIAGE_1",
+    "MARRIAGE_2",
+    "MARRIAGE_3",
+    "AGE",
+    "PAY_0_-2",
+    "PAY_0_-1",
+    "PAY_0_0",
+    "PAY_0_1",
+    "PAY_0_2",
+    "PAY_0_3",
+    "PAY_0_4",
+    "PAY_0_5",
+    "PAY_0_6",
+    "PAY_0_7",
+    "PAY_0_8",
+    "PAY_2_-2",
+    "PAY_2_-1",
+    "PAY_2_0",
+    "PAY_2_1",
+    "PAY_2_2",
+    "PAY_2_3",
+    "PAY_2_4",
+    "PAY_2_5",
+    "PAY_2_6",
+    "PAY_2_7",
+    "PAY_2_8",
+    "PAY_3_-2",
+    "PAY_3_-1",
+    "PAY_3_0",
+    "PAY_3_1",
+    "PAY_3_2",
+    "PAY_3_3",
+    "PAY_3_4",
+    "PAY_3_5",
+    "PAY_3_6",
+    "PAY_3_7",
+    "PAY_3_8",
+    "PAY_4_-2",
+    "PAY_4_-1",
+    "PAY_4_0",
+    "PAY_4_1",
+    "PAY_4_2",
+    "PAY_4_3",
+    "PAY_4_4",
+    "PAY_4_5",
+    "PAY_4_6",
+    "PAY_4_7",
+    "PAY_4_8",
+    "PAY_5_-2",
+    "PAY_5_-1",
+    "PAY_5_0",
+    "PAY_5_2",
+    "PAY_5_3",
+    "PAY_5_4",
+    "PAY_5_5",
+    "PAY_5_6",
+    "PAY_5_7",
+    "PAY_5_8",
+    "PAY_6_-2",
+    "PAY_6_-1",
+    "PAY_6_0",
+    "PAY_6_2",
+    "PAY_6_3",
+    "PAY_6_4",
+    "PAY_6_5",
+    "PAY_6_6",
+    "PAY_6_7",
+    "PAY_6_8",
+    "BILL_AMT1",
+    "BILL_AMT2",
+    "BILL_AMT3",
+    "BILL_AMT4",
+    "BILL_AMT5",
+    "BILL_AMT6",
+    "PAY_AMT1",
+    "PAY_AMT2",
+    "PAY_AMT3",
+    "PAY_AMT4",
+    "PAY_AMT5",
+    "PAY_AMT6",
+]
+
+GERMAN_CATEGORICAL_FEATURES = [
+    "Existing-Account-Status", "Credit-History", "Purpose",
+    "Savings-Account", "Present-Employment", "Instalment-Rate",
+    "Sex", "Guarantors", "Residence", "Property", "Installment",
+    "Housing", "Existing-Credits", "Job", "Num-People",
+    "Telephone", "Foreign-Worker",
+]
+
+
 class dnn_with_preprocess():
     def __init__(self, dnn, dataset, X_train, X_test,num_features,cate_features):
         self.dnn = dnn
@@ -64,308 +260,148 @@ class dnn_with_preprocess():
         self.X_test = X_test
         self.num_features = num_features
         self.cate_features = cate_features
+        self._fit_preprocessing()
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Models pickled before the preprocessing was cached
+        if "_columns" not in state:
+            self._fit_preprocessing()
+
+    def _fit_preprocessing(self):
+        """
+        Fits the encoded column layout and the normalisation statistics once,
+        from the training set, instead of on every `predict` call.
+
+        The statistics are kept separately for `predict` (numerical features
+        cast to int32 before encoding, for compas and default) and for
+        `predict_proba` (no cast).
+        """
+        self._columns = None
+        self._column_index = {}
+        self._stats = {}
+        if self.dataset == "german":
+            X_train, self._columns = one_hot(self.X_train, GERMAN_CATEGORICAL_FEATURES, "german")
+            X_train = X_train.to_numpy()
+            self._stats[True] = self._stats[False] = (X_train.mean(axis=0), X_train.std(axis=0))
+        elif self.dataset in ["compas", "default"]:
+            self._columns = COMPAS_COLUMNS if self.dataset == "compas" else DEFAULT_CREDIT_COLUMNS
+            if self.dataset == "default":
+                for cast_numeric in [True, False]:
+                    X_train = self.X_train.copy()
+                    if cast_numeric:
+                        X_train[self.num_features] = X_train[self.num_features].astype('int32')
+                    X_train = pd.get_dummies(X_train).reindex(columns=self._columns).fillna(int(0)).to_numpy()
+                    self._stats[cast_numeric] = (X_train.mean(axis=0), X_train.std(axis=0))
+        elif self.dataset == "german_credit_numeric":
+            X_train = self.X_train.to_numpy()
+            self._stats[True] = self._stats[False] = (X_train.mean(axis=0), X_train.std(axis=0))
+        if self._columns is not None:
+            self._column_index = {column: i for i, column in enumerate(self._columns)}
+        self._num_features = set(self.num_features)
+
+    def _encoded_buffer(self, n_rows, out):
+        shape = (n_rows, len(self._columns))
+        if out is None:
+            return np.zeros(shape)
+        if out.shape != shape or out.dtype != np.float64:
+            raise ValueError(f"Expected a float64 buffer of shape {shape}, got {out.dtype} {out.shape}")
+        out.fill(0)
+        return out
+
+    def _set_indicators(self, out, values, name_template, column):
+        """Sets the one-hot indicators of `values` in `out`. Values with no
+        column in the layout (unseen categories, NaN) are left at 0."""
+        codes, levels = pd.factorize(values)
+        targets = np.array(
+            [self._column_index.get(name_template.format(column, level), -1) for level in levels] + [-1]
+        )[codes]
+        rows = np.flatnonzero(targets >= 0)
+        out[rows, targets[rows]] = 1
+
+    def encode(self, X, cast_numeric=True, out=None):
+        """
+        Encodes a batch of instances into the matrix taken by the dnn, using
+        the layout and statistics fitted on the training set.
+
+        Parameters:
+        - X (pd.DataFrame): instances with the original features
+        - cast_numeric (bool): cast the numerical features to int32 before encoding (compas, default), as `predict` does
+        - out (np.ndarray): optional preallocated float64 buffer of shape (len(X), n_encoded_columns), used for the german, compas and default datasets
+
+        Returns:
+        - np.ndarray: encoded (and, where applicable, normalised) instances
+        """
+        if self.dataset == "german":
+            X_encoded = self._encoded_buffer(X.shape[0], out)
+            for column in X.columns:
+                if column in GERMAN_CATEGORICAL_FEATURES:
+                    self._set_indicators(X_encoded, X[column], "{} = {}", column)
+                elif column in self._column_index:
+                    X_encoded[:, self._column_index[column]] = X[column].to_numpy()
+
+        elif self.dataset in ["compas", "default"]:
+            X_encoded = self._encoded_buffer(X.shape[0], out)
+            for column in X.columns:
+                values = X[column]
+                if cast_numeric and column in self._num_features:
+                    values = values.astype('int32')
+                if values.dtype == object or isinstance(values.dtype, (pd.CategoricalDtype, pd.StringDtype)):
+                    # One-hot encoded by pd.get_dummies
+                    self._set_indicators(X_encoded, values, "{}_{}", column)
+                elif column in self._column_index:
+                    X_encoded[:, self._column_index[column]] = values.to_numpy()
+
+        elif self.dataset in ["heloc", "german_credit_numeric"]:
+            X_encoded = X.to_numpy()
+
+        else:
+            return X
+
+        if self.dataset in ["german", "default", "german_credit_numeric"]:
+            x_means, x_stds = self._stats[cast_numeric]
+            if X_encoded.dtype == np.float64:
+                X_encoded -= x_means
+                X_encoded /= x_stds
+            else:
+                X_encoded = (X_encoded - x_means) / x_stds
+
+        return X_encoded
+
+    def predict_encoded(self, X_encoded):
+        """Predicts instances already encoded with `encode`."""
+        return self.dnn.predict(X_encoded)
+
+    def predict_proba_encoded(self, X_encoded):
+        """Predicts the class probabilities of instances already encoded with
+        `encode(X, cast_numeric=False)`."""
+        return self.dnn.predict_proba(X_encoded)
 
     def transform(self, X):
         X[self.num_features] = X[self.num_features].astype('int32')
         X = pd.get_dummies(X)
 
         if self.dataset == "german_credit":
-            cols = [
-                "Existing-Account-Status_A11",
-                "Existing-Account-Status_A12",
-                "Existing-Account-Status_A13",
-                "Existing-Account-Status_A14",
-                "Month-Duration",
-                "Credit-History_A30",
-                "Credit-History_A31",
-                "Credit-History_A32",
-                "Credit-History_A33",
-                "Credit-History_A34",
-                "Purpose_A40",
-                "Purpose_A41",
-                "Purpose_A410",
-                "Purpose_A42",
-                "Purpose_A43",
-                "Purpose_A44",
-                "Purpose_A45",
-                "Purpose_A46",
-                "Purpose_A48",
-                "Purpose_A49",
-                "Credit-Amount",
-                "Savings-Account_A61",
-                "Savings-Account_A62",
-                "Savings-Account_A63",
-                "Savings-Account_A64",
-                "Savings-Account_A65",
-                "Present-Employment_A71",
-                "Present-Employment_A72",
-                "Present-Employment_A73",
-                "Present-Employment_A74",
-                "Present-Employment_A75",
-                "Instalment-Rate_1",
-                "Instalment-Rate_2",
-                "Instalment-Rate_3",
-                "Instalment-Rate_4",
-                "Sex_A91",
-                "Sex_A92",
-                "Sex_A93",
-                "Sex_A94",
-                "Guarantors_A101",
-                "Guarantors_A102",
-                "Guarantors_A103",
-                "Residence_1",
-                "Residence_2",
-                "Residence_3",
-                "Residence_4",
-                "Property_A121",
-                "Property_A122",
-                "Property_A123",
-                "Property_A124",
-                "Age",
-                "Installment_A141",
-                "Installment_A142",
-                "Installment_A143",
-                "Housing_A151",
-                "Housing_A152",
-                "Housing_A153",
-                "Existing-Credits_1",
-                "Existing-Credits_2",
-                "Existing-Credits_3",
-                "Existing-Credits_4",
-                "Job_A171",
-                "Job_A172",
-                "Job_A173",
-                "Job_A174",
-                "Num-People_1",
-                "Num-People_2",
-                "Telephone_A191",
-                "Telephone_A192",
-                "Foreign-Worker_A201",
-                "Foreign-Worker_A202",
-            ]
-            X = X.reindex(columns=cols)
+            X = X.reindex(columns=GERMAN_CREDIT_COLUMNS)
 
         elif self.dataset == "compas":
-            cols = [
-                "Sex_Female",
-                "Sex_Male",
-                "Age_Cat_Less than 25",
-                "Age_Cat_25 - 45",
-                "Age_Cat_Greater than 45",
-                "Race_African-American",
-                "Race_Asian",
-                "Race_Caucasian",
-                "Race_Hispanic",
-                "Race_Native American",
-                "Race_Other",
-                "C_Charge_Degree_F",
-                "C_Charge_Degree_M",
-                "Priors_Count",
-                "Time_Served",
-            ]
-            X = X.reindex(columns=cols)
+            X = X.reindex(columns=COMPAS_COLUMNS)
         elif self.dataset == "default_credit":
-            cols = [
-                "LIMIT_BAL",
-                "SEX_1",
-                "SEX_2",
-                "EDUCATION_0",
-                "EDUCATION_1",
-                "EDUCATION_2",
-                "EDUCATION_3",
-                "EDUCATION_4",
-                "EDUCATION_5",
-                "EDUCATION_6",
-                "MARRIAGE_0",
-                "MARRIAGE_1",
-                "MARRIAGE_2",
-                "MARRIAGE_3",
-                "AGE",
-                "PAY_0_-2",
-                "PAY_0_-1",
-                "PAY_0_0",
-                "PAY_0_1",
-                "PAY_0_2",
-                "PAY_0_3",
-                "PAY_0_4",
-                "PAY_0_5",
-                "PAY_0_6",
-                "PAY_0_7",
-                "PAY_0_8",
-                "PAY_2_-2",
-                "PAY_2_-1",
-                "PAY_2_0",
-                "PAY_2_1",
-                "PAY_2_2",
-                "PAY_2_3",
-                "PAY_2_4",
-                "PAY_2_5",
-                "PAY_2_6",
-                "PAY_2_7",
-                "PAY_2_8",
-                "PAY_3_-2",
-                "PAY_3_-1",
-                "PAY_3_0",
-                "PAY_3_1",
-                "PAY_3_2",
-                "PAY_3_3",
-                "PAY_3_4",
-                "PAY_3_5",
-                "PAY_3_6",
-                "PAY_3_7",
-                "PAY_3_8",
-                "PAY_4_-2",
-                "PAY_4_-1",
-                "PAY_4_0",
-                "PAY_4_1",
-                "PAY_4_2",
-                "PAY_4_3",
-                "PAY_4_4",
-                "PAY_4_5",
-                "PAY_4_6",
-                "PAY_4_7",
-                "PAY_4_8",
-                "PAY_5_-2",
-                "PAY_5_-1",
-                "PAY_5_0",
-                "PAY_5_2",
-                "PAY_5_3",
-                "PAY_5_4",
-                "PAY_5_5",
-                "PAY_5_6",
-                "PAY_5_7",
-                "PAY_5_8",
-                "PAY_6_-2",
-                "PAY_6_-1",
-                "PAY_6_0",
-                "PAY_6_2",
-                "PAY_6_3",
-                "PAY_6_4",
-                "PAY_6_5",
-                "PAY_6_6",
-                "PAY_6_7",
-                "PAY_6_8",
-                "BILL_AMT1",
-                "BILL_AMT2",
-                "BILL_AMT3",
-                "BILL_AMT4",
-                "BILL_AMT5",
-                "BILL_AMT6",
-                "PAY_AMT1",
-                "PAY_AMT2",
-                "PAY_AMT3",
-                "PAY_AMT4",
-                "PAY_AMT5",
-                "PAY_AMT6",
-            ]
-            X = X.reindex(columns=cols)
+            X = X.reindex(columns=DEFAULT_CREDIT_COLUMNS)
 
         return X
 
     def fit(self, X, y):
         if self.dataset == "german":
             X = pd.get_dummies(X)
-            cols = [
-                "Existing-Account-Status_A11",
-                "Existing-Account-Status_A12",
-                "Existing-Account-Status_A13",
-                "Existing-Account-Status_A14",
-                "Month-Duration",
-                "Credit-History_A30",
-                "Credit-History_A31",
-                "Credit-History_A32",
-                "Credit-History_A33",
-                "Credit-History_A34",
-                "Purpose_A40",
-                "Purpose_A41",
-                "Purpose_A410",
-                "Purpose_A42",
-                "Purpose_A43",
-                "Purpose_A44",
-                "Purpose_A45",
-                "Purpose_A46",
-                "Purpose_A48",
-                "Purpose_A49",
-                "Credit-Amount",
-                "Savings-Account_A61",
-                "Savings-Account_A62",
-                "Savings-Account_A63",
-                "Savings-Account_A64",
-                "Savings-Account_A65",
-                "Present-Employment_A71",
-                "Present-Employment_A72",
-                "Present-Employment_A73",
-                "Present-Employment_A74",
-                "Present-Employment_A75",
-                "Instalment-Rate_1",
-                "Instalment-Rate_2",
-                "Instalment-Rate_3",
-                "Instalment-Rate_4",
-                "Sex_A91",
-                "Sex_A92",
-                "Sex_A93",
-                "Sex_A94",
-                "Guarantors_A101",
-                "Guarantors_A102",
-                "Guarantors_A103",
-                "Residence_1",
-                "Residence_2",
-                "Residence_3",
-                "Residence_4",
-                "Property_A121",
-                "Property_A122",
-                "Property_A123",
-                "Property_A124",
-                "Age",
-                "Installment_A141",
-                "Installment_A142",
-                "Installment_A143",
-                "Housing_A151",
-                "Housing_A152",
-                "Housing_A153",
-                "Existing-Credits_1",
-                "Existing-Credits_2",
-                "Existing-Credits_3",
-                "Existing-Credits_4",
-                "Job_A171",
-                "Job_A172",
-                "Job_A173",
-                "Job_A174",
-                "Num-People_1",
-                "Num-People_2",
-                "Telephone_A191",
-                "Telephone_A192",
-                "Foreign-Worker_A201",
-                "Foreign-Worker_A202",
-            ]
-
-            X = X.reindex(columns=cols)
+            X = X.reindex(columns=GERMAN_CREDIT_COLUMNS)
             X = X.fillna(int(0))
             X = X.to_numpy()
 
         elif self.dataset == "compas":
             X[self.num_features] = X[self.num_features].astype('int32')
             X = pd.get_dummies(X)
-            cols = [
-                "Sex_Female",
-                "Sex_Male",
-                "Age_Cat_Less than 25",
-                "Age_Cat_25 - 45",
-                "Age_Cat_Greater than 45",
-                "Race_African-American",
-                "Race_Asian",
-                "Race_Caucasian",
-                "Race_Hispanic",
-                "Race_Native American",
-                "Race_Other",
-                "C_Charge_Degree_F",
-                "C_Charge_Degree_M",
-                "Priors_Count",
-                "Time_Served",
-            ]
-
-            X = X.reindex(columns=cols)
+            X = X.reindex(columns=COMPAS_COLUMNS)
             X = X.fillna(int(0))
             X = X.to_numpy()
 
@@ -378,101 +414,7 @@ class dnn_with_preprocess():
         elif self.dataset == "default":
             X[self.num_features] = X[self.num_features].astype('int32')
             X = pd.get_dummies(X)
-            cols = [
-                "LIMIT_BAL",
-                "SEX_1",
-                "SEX_2",
-                "EDUCATION_0",
-                "EDUCATION_1",
-                "EDUCATION_2",
-                "EDUCATION_3",
-                "EDUCATION_4",
-                "EDUCATION_5",
-                "EDUCATION_6",
-                "MARRIAGE_0",
-                "MARRIAGE_1",
-                "MARRIAGE_2",
-                "MARRIAGE_3",
-                "AGE",
-                "PAY_0_-2",
-                "PAY_0_-1",
-                "PAY_0_0",
-                "PAY_0_1",
-                "PAY_0_2",
-                "PAY_0_3",
-                "PAY_0_4",
-                "PAY_0_5",
-                "PAY_0_6",
-                "PAY_0_7",
-                "PAY_0_8",
-                "PAY_2_-2",
-                "PAY_2_-1",
-                "PAY_2_0",
-                "PAY_2_1",
-                "PAY_2_2",
-                "PAY_2_3",
-                "PAY_2_4",
-                "PAY_2_5",
-                "PAY_2_6",
-                "PAY_2_7",
-                "PAY_2_8",
-                "PAY_3_-2",
-                "PAY_3_-1",
-                "PAY_3_0",
-                "PAY_3_1",
-                "PAY_3_2",
-                "PAY_3_3",
-                "PAY_3_4",
-                "PAY_3_5",
-                "PAY_3_6",
-                "PAY_3_7",
-                "PAY_3_8",
-                "PAY_4_-2",
-                "PAY_4_-1",
-                "PAY_4_0",
-                "PAY_4_1",
-                "PAY_4_2",
-                "PAY_4_3",
-                "PAY_4_4",
-                "PAY_4_5",
-                "PAY_4_6",
-                "PAY_4_7",
-                "PAY_4_8",
-                "PAY_5_-2",
-                "PAY_5_-1",
-                "PAY_5_0",
-                "PAY_5_2",
-                "PAY_5_3",
-                "PAY_5_4",
-                "PAY_5_5",
-                "PAY_5_6",
-                "PAY_5_7",
-                "PAY_5_8",
-                "PAY_6_-2",
-                "PAY_6_-1",
-                "PAY_6_0",
-                "PAY_6_2",
-                "PAY_6_3",
-                "PAY_6_4",
-                "PAY_6_5",
-                "PAY_6_6",
-                "PAY_6_7",
-                "PAY_6_8",
-                "BILL_AMT1",
-                "BILL_AMT2",
-                "BILL_AMT3",
-                "BILL_AMT4",
-                "BILL_AMT5",
-                "BILL_AMT6",
-                "PAY_AMT1",
-                "PAY_AMT2",
-                "PAY_AMT3",
-                "PAY_AMT4",
-                "PAY_AMT5",
-                "PAY_AMT6",
-            ]
-
-            X = X.reindex(columns=cols)
+            X = X.reindex(columns=DEFAULT_CREDIT_COLUMNS)
             X = X.fillna(int(0))
             X = X.to_numpy()
 
@@ -497,480 +439,7 @@ class dnn_with_preprocess():
         return accuracy_score(y_true=y_true, y_pred=preds)
 
     def predict(self, X):
-        
-        if self.dataset == "german":
-            cate_features = ['Existing-Account-Status', 'Credit-History', 'Purpose',
-                              'Savings-Account', 'Present-Employment', 'Instalment-Rate',
-                              'Sex', 'Guarantors', 'Residence', 'Property', 'Installment',
-                              'Housing', 'Existing-Credits', 'Job', 'Num-People',
-                              'Telephone', 'Foreign-Worker']
-            X_train, feat = one_hot(self.X_train,cate_features,'german')
-            X , feat= one_hot(X,cate_features,'german')
-            # X_train = pd.get_dummies(X_train)
-            # X_test = pd.get_dummies(X_test)
-
-            cols = [
-                "Existing-Account-Status_A11",
-                "Existing-Account-Status_A12",
-                "Existing-Account-Status_A13",
-                "Existing-Account-Status_A14",
-                "Month-Duration",
-                "Credit-History_A30",
-                "Credit-History_A31",
-                "Credit-History_A32",
-                "Credit-History_A33",
-                "Credit-History_A34",
-                "Purpose_A40",
-                "Purpose_A41",
-                "Purpose_A410",
-                "Purpose_A42",
-                "Purpose_A43",
-                "Purpose_A44",
-                "Purpose_A45",
-                "Purpose_A46",
-                "Purpose_A48",
-                "Purpose_A49",
-                "Credit-Amount",
-                "Savings-Account_A61",
-                "Savings-Account_A62",
-                "Savings-Account_A63",
-                "Savings-Account_A64",
-                "Savings-Account_A65",
-                "Present-Employment_A71",
-                "Present-Employment_A72",
-                "Present-Employment_A73",
-                "Present-Employment_A74",
-                "Present-Employment_A75",
-                "Instalment-Rate_1",
-                "Instalment-Rate_2",
-                "Instalment-Rate_3",
-                "Instalment-Rate_4",
-                "Sex_A91",
-                "Sex_A92",
-                "Sex_A93",
-                "Sex_A94",
-                "Guarantors_A101",
-                "Guarantors_A102",
-                "Guarantors_A103",
-                "Residence_1",
-                "Residence_2",
-                "Residence_3",
-                "Residence_4",
-                "Property_A121",
-                "Property_A122",
-                "Property_A123",
-                "Property_A124",
-                "Age",
-                "Installment_A141",
-                "Installment_A142",
-                "Installment_A143",
-                "Housing_A151",
-                "Housing_A152",
-                "Housing_A153",
-                "Existing-Credits_1",
-                "Existing-Credits_2",
-                "Existing-Credits_3",
-                "Existing-Credits_4",
-                "Job_A171",
-                "Job_A172",
-                "Job_A173",
-                "Job_A174",
-                "Num-People_1",
-                "Num-People_2",
-                "Telephone_A191",
-                "Telephone_A192",
-                "Foreign-Worker_A201",
-                "Foreign-Worker_A202",
-            ]
-
-            X = X.reindex(columns=X_train.columns)
-            # X_train = X_train.reindex(columns=cols)
-            # X_train = X_train.fillna(int(0))
-            X = X.fillna(int(0))
-            X = X.to_numpy()
-
-        elif self.dataset == "compas":
-            self.X_train[self.num_features] = self.X_train[self.num_features].astype('int32')
-            X_train = pd.get_dummies(self.X_train)
-            X[self.num_features] = X[self.num_features].astype('int32')
-            X = pd.get_dummies(X)
-            cols = [
-                "Sex_Female",
-                "Sex_Male",
-                "Age_Cat_Less than 25",
-                "Age_Cat_25 - 45",
-                "Age_Cat_Greater than 45",
-                "Race_African-American",
-                "Race_Asian",
-                "Race_Caucasian",
-                "Race_Hispanic",
-                "Race_Native American",
-                "Race_Other",
-                "C_Charge_Degree_F",
-                "C_Charge_Degree_M",
-                "Priors_Count",
-                "Time_Served",
-            ]
-
-            X = X.reindex(columns=cols)
-            X_train = X_train.reindex(columns=cols)
-            X_train = X_train.fillna(int(0))
-            X = X.fillna(int(0))
-            X = X.to_numpy()
-            
-
-        elif self.dataset == "heloc":
-            X_train = self.X_train
-            X = X.to_numpy()
-
-        elif self.dataset == "german_credit_numeric":
-            X_train = self.X_train
-            X = X.to_numpy()
-        elif self.dataset == "default":
-            self.X_train[self.num_features] = self.X_train[self.num_features].astype('int32')
-            X_train = pd.get_dummies(self.X_train)
-            X[self.num_features] = X[self.num_features].astype('int32')
-            X = pd.get_dummies(X)
-            cols = [
-                "LIMIT_BAL",
-                "SEX_1",
-                "SEX_2",
-                "EDUCATION_0",
-                "EDUCATION_1",
-                "EDUCATION_2",
-                "EDUCATION_3",
-                "EDUCATION_4",
-                "EDUCATION_5",
-                "EDUCATION_6",
-                "MARRIAGE_0",
-                "MARRIAGE_1",
-                "MARRIAGE_2",
-                "MARRIAGE_3",
-                "AGE",
-                "PAY_0_-2",
-                "PAY_0_-1",
-                "PAY_0_0",
-                "PAY_0_1",
-                "PAY_0_2",
-                "PAY_0_3",
-                "PAY_0_4",
-                "PAY_0_5",
-                "PAY_0_6",
-                "PAY_0_7",
-                "PAY_0_8",
-                "PAY_2_-2",
-                "PAY_2_-1",
-                "PAY_2_0",
-                "PAY_2_1",
-                "PAY_2_2",
-                "PAY_2_3",
-                "PAY_2_4",
-                "PAY_2_5",
-                "PAY_2_6",
-                "PAY_2_7",
-                "PAY_2_8",
-                "PAY_3_-2",
-                "PAY_3_-1",
-                "PAY_3_0",
-                "PAY_3_1",
-                "PAY_3_2",
-                "PAY_3_3",
-                "PAY_3_4",
-                "PAY_3_5",
-                "PAY_3_6",
-                "PAY_3_7",
-                "PAY_3_8",
-                "PAY_4_-2",
-                "PAY_4_-1",
-                "PAY_4_0",
-                "PAY_4_1",
-                "PAY_4_2",
-                "PAY_4_3",
-                "PAY_4_4",
-                "PAY_4_5",
-                "PAY_4_6",
-                "PAY_4_7",
-                "PAY_4_8",
-                "PAY_5_-2",
-                "PAY_5_-1",
-                "PAY_5_0",
-                "PAY_5_2",
-                "PAY_5_3",
-                "PAY_5_4",
-                "PAY_5_5",
-                "PAY_5_6",
-                "PAY_5_7",
-                "PAY_5_8",
-                "PAY_6_-2",
-                "PAY_6_-1",
-                "PAY_6_0",
-                "PAY_6_2",
-                "PAY_6_3",
-                "PAY_6_4",
-                "PAY_6_5",
-                "PAY_6_6",
-                "PAY_6_7",
-                "PAY_6_8",
-                "BILL_AMT1",
-                "BILL_AMT2",
-                "BILL_AMT3",
-                "BILL_AMT4",
-                "BILL_AMT5",
-                "BILL_AMT6",
-                "PAY_AMT1",
-                "PAY_AMT2",
-                "PAY_AMT3",
-                "PAY_AMT4",
-                "PAY_AMT5",
-                "PAY_AMT6",
-            ]
-
-            X = X.reindex(columns=cols)
-            X_train = X_train.reindex(columns=cols)
-            X_train = X_train.fillna(int(0))
-            X = X.fillna(int(0))
-            X = X.to_numpy()
-
-        if self.dataset in ["german", "default", "german_credit_numeric"]:
-            x_means, x_stds = X_train.to_numpy().mean(axis=0), X_train.to_numpy().std(
-                axis=0
-            )
-            X = (X - x_means) / x_stds
-        
-        return self.dnn.predict(X)
+        return self.predict_encoded(self.encode(X))
 
     def predict_proba(self, x):
-
-        if self.dataset == "german":
-            cate_features = ['Existing-Account-Status', 'Credit-History', 'Purpose',
-                              'Savings-Account', 'Present-Employment', 'Instalment-Rate',
-                              'Sex', 'Guarantors', 'Residence', 'Property', 'Installment',
-                              'Housing', 'Existing-Credits', 'Job', 'Num-People',
-                              'Telephone', 'Foreign-Worker']
-            X_train, feat = one_hot(self.X_train,cate_features,'german')
-            X_test , feat= one_hot(x,cate_features,'german')
-            # cols = [
-            #     "Existing-Account-Status_A11",
-            #     "Existing-Account-Status_A12",
-            #     "Existing-Account-Status_A13",
-            #     "Existing-Account-Status_A14",
-            #     "Month-Duration",
-            #     "Credit-History_A30",
-            #     "Credit-History_A31",
-            #     "Credit-History_A32",
-            #     "Credit-History_A33",
-            #     "Credit-History_A34",
-            #     "Purpose_A40",
-            #     "Purpose_A41",
-            #     "Purpose_A410",
-            #     "Purpose_A42",
-            #     "Purpose_A43",
-            #     "Purpose_A44",
-            #     "Purpose_A45",
-            #     "Purpose_A46",
-            #     "Purpose_A48",
-            #     "Purpose_A49",
-            #     "Credit-Amount",
-            #     "Savings-Account_A61",
-            #     "Savings-Account_A62",
-            #     "Savings-Account_A63",
-            #     "Savings-Account_A64",
-            #     "Savings-Account_A65",
-            #     "Present-Employment_A71",
-            #     "Present-Employment_A72",
-            #     "Present-Employment_A73",
-            #     "Present-Employment_A74",
-            #     "Present-Employment_A75",
-            #     "Instalment-Rate_1",
-            #     "Instalment-Rate_2",
-            #     "Instalment-Rate_3",
-            #     "Instalment-Rate_4",
-            #     "Sex_A91",
-            #     "Sex_A92",
-            #     "Sex_A93",
-            #     "Sex_A94",
-            #     "Guarantors_A101",
-            #     "Guarantors_A102",
-            #     "Guarantors_A103",
-            #     "Residence_1",
-            #     "Residence_2",
-            #     "Residence_3",
-            #     "Residence_4",
-            #     "Property_A121",
-            #     "Property_A122",
-            #     "Property_A123",
-            #     "Property_A124",
-            #     "Age",
-            #     "Installment_A141",
-            #     "Installment_A142",
-            #     "Installment_A143",
-            #     "Housing_A151",
-            #     "Housing_A152",
-            #     "Housing_A153",
-            #     "Existing-Credits_1",
-            #     "Existing-Credits_2",
-            #     "Existing-Credits_3",
-            #     "Existing-Credits_4",
-            #     "Job_A171",
-            #     "Job_A172",
-            #     "Job_A173",
-            #     "Job_A174",
-            #     "Num-People_1",
-            #     "Num-People_2",
-            #     "Telephone_A191",
-            #     "Telephone_A192",
-            #     "Foreign-Worker_A201",
-            #     "Foreign-Worker_A202",
-            # ]
-
-            X_test = X_test.reindex(columns=X_train.columns)
-            # X_train = X_train.reindex(columns=cols)
-            # X_train = X_train.fillna(int(0))
-            X_test = X_test.fillna(int(0))
-            X_test = X_test.to_numpy()
-
-        elif self.dataset == "compas":
-            X_train = pd.get_dummies(self.X_train)
-            X_test = pd.get_dummies(x)
-            cols = [
-                "Sex_Female",
-                "Sex_Male",
-                "Age_Cat_Less than 25",
-                "Age_Cat_25 - 45",
-                "Age_Cat_Greater than 45",
-                "Race_African-American",
-                "Race_Asian",
-                "Race_Caucasian",
-                "Race_Hispanic",
-                "Race_Native American",
-                "Race_Other",
-                "C_Charge_Degree_F",
-                "C_Charge_Degree_M",
-                "Priors_Count",
-                "Time_Served",
-            ]
-
-            X_test = X_test.reindex(columns=cols)
-            X_train = X_train.reindex(columns=cols)
-            X_train = X_train.fillna(int(0))
-            X_test = X_test.fillna(int(0))
-            X_test = X_test.to_numpy()
-
-        elif self.dataset == "heloc":
-            X_train = self.X_train
-            X_test = x.to_numpy()
-
-        elif self.dataset == "german_credit_numeric":
-            X_train = self.X_train
-            X_test = x.to_numpy()
-
-        elif self.dataset == "default":
-            X_train = pd.get_dummies(self.X_train)
-            X_test = pd.get_dummies(x)
-            cols = [
-                "LIMIT_BAL",
-                "SEX_1",
-                "SEX_2",
-                "EDUCATION_0",
-                "EDUCATION_1",
-                "EDUCATION_2",
-                "EDUCATION_3",
-                "EDUCATION_4",
-                "EDUCATION_5",
-                "EDUCATION_6",
-                "MARRIAGE_0",
-                "MARRIAGE_1",
-                "MARRIAGE_2",
-                "MARRIAGE_3",
-                "AGE",
-                "PAY_0_-2",
-                "PAY_0_-1",
-                "PAY_0_0",
-                "PAY_0_1",
-                "PAY_0_2",
-                "PAY_0_3",
-                "PAY_0_4",
-                "PAY_0_5",
-                "PAY_0_6",
-                "PAY_0_7",
-                "PAY_0_8",
-                "PAY_2_-2",
-                "PAY_2_-1",
-                "PAY_2_0",
-                "PAY_2_1",
-                "PAY_2_2",
-                "PAY_2_3",
-                "PAY_2_4",
-                "PAY_2_5",
-                "PAY_2_6",
-                "PAY_2_7",
-                "PAY_2_8",
-                "PAY_3_-2",
-                "PAY_3_-1",
-                "PAY_3_0",
-                "PAY_3_1",
-                "PAY_3_2",
-                "PAY_3_3",
-                "PAY_3_4",
-                "PAY_3_5",
-                "PAY_3_6",
-                "PAY_3_7",
-                "PAY_3_8",
-                "PAY_4_-2",
-                "PAY_4_-1",
-                "PAY_4_0",
-                "PAY_4_1",
-                "PAY_4_2",
-                "PAY_4_3",
-                "PAY_4_4",
-                "PAY_4_5",
-                "PAY_4_6",
-                "PAY_4_7",
-                "PAY_4_8",
-                "PAY_5_-2",
-                "PAY_5_-1",
-                "PAY_5_0",
-                "PAY_5_2",
-                "PAY_5_3",
-                "PAY_5_4",
-                "PAY_5_5",
-                "PAY_5_6",
-                "PAY_5_7",
-                "PAY_5_8",
-                "PAY_6_-2",
-                "PAY_6_-1",
-                "PAY_6_0",
-                "PAY_6_2",
-                "PAY_6_3",
-                "PAY_6_4",
-                "PAY_6_5",
-                "PAY_6_6",
-                "PAY_6_7",
-                "PAY_6_8",
-                "BILL_AMT1",
-                "BILL_AMT2",
-                "BILL_AMT3",
-                "BILL_AMT4",
-                "BILL_AMT5",
-                "BILL_AMT6",
-                "PAY_AMT1",
-                "PAY_AMT2",
-                "PAY_AMT3",
-                "PAY_AMT4",
-                "PAY_AMT5",
-                "PAY_AMT6",
-            ]
-
-            X_test = X_test.reindex(columns=cols)
-            X_train = X_train.reindex(columns=cols)
-            X_train = X_train.fillna(int(0))
-            X_test = X_test.fillna(int(0))
-            X_test = X_test.to_numpy()
-
-        if self.dataset in ["german", "default", "german_credit_numeric"]:
-            x_means, x_stds = X_train.to_numpy().mean(axis=0), X_train.to_numpy().std(
-                axis=0
-            )
-            X_test = (X_test - x_means) / x_stds
-
-        return self.dnn.predict_proba(X_test)
+        return self.predict_proba_encoded(self.encode(x, cast_numeric=False))
@@ -0,0 +1,161 @@
+from typing import Any, Optional
+from collections import OrderedDict
+import os
+import threading
+
+import joblib
+import pandas as pd
+from sklearn.inspection import permutation_importance
+from sklearn.model_selection import train_test_split
+
+from .fingerprint import model_fingerprint, object_token, dataframe_fingerprint
+
+
+class FeatureImportanceCache:
+    """Store of permutation importances, keyed by the model fingerprint, the
+    dataset fingerprint and the computation parameters. Importances are kept
+    in memory (at most `max_entries`, least recently used first out) and, if
+    `disk_dir` is given, saved there so that they survive restarts.
+    """
+
+    def __init__(self, disk_dir: Optional[str] = None, max_entries: int = 64):
+        """
+        Args:
+            disk_dir (Optional[str]): directory of the on-disk copies. If None, importances are only kept in memory
+            max_entries (int): maximum number of importances kept in memory
+        """
+        self.disk_dir = disk_dir
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, pd.Series]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {"disk_dir": self.disk_dir, "max_entries": self.max_entries}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.joblib")
+
+    def get(self, key: str, persistent: bool = True) -> Optional[pd.Series]:
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return value
+        if self.disk_dir is not None and persistent and os.path.exists(self._path(key)):
+            try:
+                value = joblib.load(self._path(key))
+            except Exception:
+                value = None
+            if isinstance(value, pd.Series):
+                self._put_memory(key, value)
+                with self._lock:
+                    self.hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _put_memory(self, key: str, value: pd.Series):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def set(self, key: str, value: pd.Series, persistent: bool = True):
+        """Stores `value`; only in memory if not `persistent`."""
+        self._put_memory(key, value)
+        if self.disk_dir is not None and persistent:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            # Written under a temporary name, so that readers never see a partial file
+            tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            joblib.dump(value, tmp_path)
+            os.replace(tmp_path, self._path(key))
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.disk_dir is not None and os.path.isdir(self.disk_dir):
+            for name in os.listdir(self.disk_dir):
+                if name.endswith(".joblib"):
+                    os.remove(os.path.join(self.disk_dir, name))
+
+
+# Shared by all consumers that are not given a cache of their own
+default_importance_cache = FeatureImportanceCache()
+
+
+def _stratified_subsample(X: pd.DataFrame, y: pd.Series, max_samples: int, random_state: Optional[int]):
+    if X.shape[0] <= max_samples:
+        return X, y
+    try:
+        X_sub, _, y_sub, _ = train_test_split(
+            X, y, train_size=max_samples, stratify=y, random_state=random_state
+        )
+    except ValueError:
+        # Classes with too few instances to stratify
+        X_sub, _, y_sub, _ = train_test_split(X, y, train_size=max_samples, random_state=random_state)
+    return X_sub, y_sub
+
+
+def permutation_importances(
+    model: Any,
+    X: pd.DataFrame,
+    y: pd.Series,
+    n_repeats: int = 5,
+    random_state: Optional[int] = None,
+    max_samples: Optional[int] = None,
+    n_jobs: Optional[int] = None,
+    cache: Optional[FeatureImportanceCache] = None,
+) -> pd.Series:
+    """Mean permutation importance (`sklearn.inspection.permutation_importance`)
+    of every feature, computed once per model, dataset and parameters.
+
+    Args:
+        model (Any): fitted model
+        X (pd.DataFrame): instances
+        y (pd.Series): their labels
+        n_repeats (int): number of permutations of every feature
+        random_state (Optional[int]): seed of the subsample and the permutations.
+            If None, the importances computed first are served afterwards
+        max_samples (Optional[int]): if given, importances are computed on a
+            subsample of at most `max_samples` instances, stratified by `y`
+        n_jobs (Optional[int]): number of jobs of the permutations (does not change the result)
+        cache (Optional[FeatureImportanceCache]): store of the importances;
+            `default_importance_cache` if None
+
+    Returns:
+        pd.Series: mean importances, indexed by the columns of `X`.
+    """
+    if cache is None:
+        cache = default_importance_cache
+    # Models that cannot be pickled are only cached in memory, for their lifetime
+    fingerprint = model_fingerprint(model)
+    persistent = fingerprint is not None
+    key = joblib.hash((
+        fingerprint if persistent else object_token(model),
+        dataframe_fingerprint(X),
+        pd.util.hash_pandas_object(pd.Series(y), index=False).to_numpy().tobytes(),
+        n_repeats,
+        random_state,
+        max_samples,
+    ))
+    importances = cache.get(key, persistent=persistent)
+    if importances is not None:
+        return importances
+
+    X_sample, y_sample = (
+        _stratified_subsample(X, y, max_samples, random_state) if max_samples is not None else (X, y)
+    )
+    result = permutation_importance(
+        model, X_sample, y_sample, n_repeats=n_repeats, random_state=random_state, n_jobs=n_jobs
+    )
+    importances = pd.Series(result.importances_mean, index=X.columns)
+    cache.set(key, importances, persistent=persistent)
+    return importances
@@ -0,0 +1,58 @@
+from typing import Any, Dict, Optional, Tuple
+import hashlib
+import threading
+import uuid
+import weakref
+
+import joblib
+import numpy as np
+import pandas as pd
+
+
+def model_fingerprint(model: Any) -> Optional[str]:
+    """Content hash of a (picklable) model. Two models with the same
+    fingerprint make the same predictions. None for models that cannot be
+    pickled, which callers identify with `object_token` instead and must not
+    persist results of."""
+    try:
+        return joblib.hash(model)
+    except Exception:
+        return None
+
+
+_object_tokens: Dict[int, Tuple[Any, str]] = {}
+_object_tokens_lock = threading.Lock()
+
+
+def object_token(obj: Any) -> str:
+    """Random token identifying a live object. Unlike `id(obj)`, a token is
+    never reused by another object, in this process or any other. Objects that
+    do not support weak references get a new token on every call."""
+    with _object_tokens_lock:
+        entry = _object_tokens.get(id(obj))
+        if entry is not None and entry[0]() is obj:
+            return entry[1]
+        token = uuid.uuid4().hex
+        try:
+            ref = weakref.ref(obj, lambda _, key=id(obj): _object_tokens.pop(key, None))
+        except TypeError:
+            return token
+        _object_tokens[id(obj)] = (ref, token)
+        return token
+
+
+def dataframe_fingerprint(X: pd.DataFrame) -> str:
+    """Content hash of a DataFrame, covering its columns, dtypes and values."""
+    digest = hashlib.sha256()
+    digest.update(repr(list(zip(X.columns, X.dtypes.astype(str)))).encode())
+    digest.update(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def row_fingerprints(X: pd.DataFrame) -> np.ndarray:
+    """Content hash of every row of a DataFrame, including the column names.
+    Rows with equal values in equal columns get equal hashes regardless of
+    their index."""
+    columns_digest = hashlib.sha256(repr(list(X.columns)).encode()).hexdigest()[:16]
+    row_hashes = pd.util.hash_pandas_object(X, index=False).to_numpy()
+    return np.array([f"{columns_digest}-{h:016x}" for h in row_hashes], dtype=object)
@@ -1,6 +1,9 @@
+from typing import Optional
+
 from ..base import ClusteringMethod, LocalCounterfactualMethod
 from ..clustering import KMeansMethod
-from ..local_cfs import DiceMethod, NearestNeighborMethod, NearestNeighborsScaled, RandomSampling
+from ..local_cfs import DiceMethod, NearestNeighborMethod, NearestNeighborsScaled, RandomSampling, CachedCounterfactualMethod, CounterfactualCache
+from .feature_importance import FeatureImportanceCache
 
 
 def _decide_cluster_method(method, n_clusters, random_seed) -> ClusteringMethod:
@@ -15,7 +18,9 @@ def _decide_cluster_method(method, n_clusters, random_seed) -> ClusteringMethod:
 
 
 def _decide_local_cf_method(
-    method, model, train_dataset, numeric_features_names, categorical_features_names, feat_to_vary, random_seed, n_most_important: int = 15, n_categorical_most_frequent: int = 15, n_scalars: int = 1000,
+    method, model, train_dataset, numeric_features_names, categorical_features_names, feat_to_vary, random_seed, n_most_important: int = 15, n_categorical_most_frequent: int = 15, n_scalars: int = 1000, cf_cache: Optional[CounterfactualCache] = None,
+    nn_index_backend: str = "auto", nn_index_encoding: str = "dense", nn_index_path: Optional[str] = None, nns_scaling: str = "all",
+    importance_cache: Optional[FeatureImportanceCache] = None,
 ) -> LocalCounterfactualMethod:
     if isinstance(method, str):
         if method == "Dice":
@@ -38,6 +43,9 @@ def _decide_local_cf_method(
                 numeric_features_names,
                 feat_to_vary,
                 random_seed,
+                index_backend=nn_index_backend,
+                index_encoding=nn_index_encoding,
+                index_path=nn_index_path,
             )
         elif method == "NearestNeighborsScaled":
             method = NearestNeighborsScaled()
@@ -48,6 +56,10 @@ def _decide_local_cf_method(
                 numeric_features_names,
                 n_scalars,
                 random_seed,
+                index_backend=nn_index_backend,
+                index_encoding=nn_index_encoding,
+                index_path=nn_index_path,
+                scaling=nns_scaling,
             )
         elif method == "RandomSampling":
             method = RandomSampling(
@@ -58,10 +70,19 @@ def _decide_local_cf_method(
                 categorical_features=categorical_features_names,
                 feat_to_vary = feat_to_vary,
                 random_state=random_seed,
+                importance_cache=importance_cache,
             )
             method.fit(train_dataset.drop(columns="target"), train_dataset["target"])
         else:
             raise ValueError(f"Unsupported local counterfactual method: {method}")
     else:
         method = method
+    if cf_cache is not None and not isinstance(method, CachedCounterfactualMethod):
+        method = CachedCounterfactualMethod(
+            method,
+            cache=cf_cache,
+            model=model,
+            train_dataset=train_dataset,
+            feat_to_vary=feat_to_vary,
+        )
     return method
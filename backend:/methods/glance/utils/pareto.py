@@ -0,0 +1,102 @@
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def unique_columns(costs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Groups identical columns of a cost matrix by hashing them.
+
+    Columns are hashed in bulk and only columns with equal hashes are
+    compared, so duplicates are found in O(n_columns) comparisons.
+
+    Args:
+        costs (np.ndarray): matrix of shape (n_instances, n_actions)
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: index of the first occurrence of every
+        distinct column (in increasing order) and, for every column, the
+        position of its distinct column in the first array.
+    """
+    n_columns = costs.shape[1]
+    # + 0.0 maps -0.0 to 0.0, which compares equal but hashes differently
+    hashes = pd.util.hash_pandas_object(pd.DataFrame(costs.T + 0.0), index=False).to_numpy()
+    firsts, inverse = [], np.empty(n_columns, dtype=int)
+    representatives = {}
+    for j in range(n_columns):
+        candidates = representatives.setdefault(hashes[j], [])
+        for position in candidates:
+            if np.array_equal(costs[:, firsts[position]], costs[:, j]):
+                inverse[j] = position
+                break
+        else:
+            candidates.append(len(firsts))
+            inverse[j] = len(firsts)
+            firsts.append(j)
+    return np.array(firsts, dtype=int), inverse
+
+
+def _dominance(a: np.ndarray, b: np.ndarray, max_elements: int) -> np.ndarray:
+    """Boolean matrix whose entry (i, j) is True if column i of `a` dominates
+    column j of `b` (no larger cost for any instance, smaller for at least one)."""
+    ret = np.zeros((a.shape[1], b.shape[1]), dtype=bool)
+    step = max(1, max_elements // max(1, a.shape[0] * b.shape[1]))
+    b = b[:, None, :]
+    for start in range(0, a.shape[1], step):
+        a_block = a[:, start:start + step, None]
+        ret[start:start + step] = (a_block <= b).all(axis=0) & (a_block < b).any(axis=0)
+    return ret
+
+
+def pareto_front(costs: np.ndarray, block_size: int = 256, max_elements: int = 2**24) -> np.ndarray:
+    """Columns of a cost matrix that are not dominated by any other column.
+
+    A column dominates another if its cost is lower or equal for every
+    instance and lower for at least one (`np.inf` costs compare as usual, so
+    identical columns do not dominate each other). Columns are visited in
+    order of (number of infinite costs, sum of finite costs), so that
+    dominating columns tend to enter the front first, and are compared to the
+    current front in blocks of `block_size`, with vectorized comparisons of
+    at most `max_elements` elements.
+
+    Args:
+        costs (np.ndarray): matrix of shape (n_instances, n_actions)
+        block_size (int): number of columns compared to the front at once
+        max_elements (int): maximum size of the intermediate comparison arrays
+
+    Returns:
+        np.ndarray: boolean mask of the non-dominated columns.
+    """
+    n_columns = costs.shape[1]
+    finite = np.isfinite(costs)
+    order = np.lexsort((np.where(finite, costs, 0).sum(axis=0), (~finite).sum(axis=0)))
+
+    front = np.array([], dtype=int)
+    for start in range(0, n_columns, block_size):
+        block = order[start:start + block_size]
+        block = block[~_dominance(costs[:, block], costs[:, block], max_elements).any(axis=0)]
+        if front.shape[0] > 0 and block.shape[0] > 0:
+            block = block[~_dominance(costs[:, front], costs[:, block], max_elements).any(axis=0)]
+            # Sums are not exact, so a later column may still dominate an earlier one
+            front = front[~_dominance(costs[:, block], costs[:, front], max_elements).any(axis=0)]
+        front = np.concatenate([front, block])
+
+    mask = np.zeros(n_columns, dtype=bool)
+    mask[front] = True
+    return mask
+
+
+def pareto_unique_actions(costs: np.ndarray, block_size: int = 256) -> np.ndarray:
+    """Indexes of the actions (columns of the instance x action cost matrix)
+    that are neither dominated nor duplicates of a previous action.
+
+    Args:
+        costs (np.ndarray): matrix of shape (n_instances, n_actions)
+        block_size (int): see `pareto_front`
+
+    Returns:
+        np.ndarray: increasing indexes of the kept actions; of identical
+        actions, the first one is kept.
+    """
+    firsts, _ = unique_columns(costs)
+    return firsts[pareto_front(costs[:, firsts], block_size=block_size)]
@@ -0,0 +1,203 @@
+from typing import Any, Dict, Optional
+from contextlib import contextmanager
+import contextvars
+import hashlib
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+_endpoint: contextvars.ContextVar = contextvars.ContextVar("prediction_cache_endpoint", default="default")
+
+
+def set_prediction_endpoint(name: str):
+    """Attribute the prediction cache hits and misses of the current context
+    (e.g. the current request) to the endpoint `name`."""
+    _endpoint.set(name)
+
+
+@contextmanager
+def prediction_endpoint(name: str):
+    token = _endpoint.set(name)
+    try:
+        yield
+    finally:
+        _endpoint.reset(token)
+
+
+def row_hashes(X: Any) -> np.ndarray:
+    """64-bit hash of every row of a DataFrame or 2d array, computed in bulk.
+    Column names (or the number of columns and dtype, for arrays) are mixed
+    in, so rows of differently shaped inputs do not collide."""
+    if isinstance(X, pd.DataFrame):
+        layout = repr(list(zip(X.columns, X.dtypes.astype(str))))
+        hashes = pd.util.hash_pandas_object(X, index=False).to_numpy()
+    else:
+        X = np.asarray(X)
+        layout = repr((X.shape[1:], X.dtype.str))
+        hashes = pd.util.hash_pandas_object(pd.DataFrame(X), index=False).to_numpy()
+    layout_hash = np.uint64(int(hashlib.sha256(layout.encode()).hexdigest()[:16], 16))
+    return hashes ^ layout_hash
+
+
+class _HashTable:
+    """Bounded open-addressing hash table from 64-bit row hashes to fixed-size
+    values, stored in NumPy arrays. Lookups and insertions are vectorized
+    over a batch of hashes. Each hash is looked up in at most `max_probes`
+    consecutive slots. When they are all taken, the entry in the home slot is
+    evicted.
+    """
+
+    def __init__(self, capacity: int, max_probes: int = 8):
+        capacity = 1 << max(0, capacity - 1).bit_length()
+        self.mask = np.uint64(capacity - 1)
+        self.max_probes = max_probes
+        self.keys = np.zeros(capacity, dtype=np.uint64)
+        self.filled = np.zeros(capacity, dtype=bool)
+        self.values: Optional[np.ndarray] = None
+
+    def _home(self, hashes: np.ndarray) -> np.ndarray:
+        return (hashes & self.mask).astype(np.int64)
+
+    def lookup(self, hashes: np.ndarray) -> np.ndarray:
+        """Slot of every hash, or -1 if it is not in the table."""
+        slots = np.full(hashes.shape[0], -1, dtype=np.int64)
+        if self.values is None:
+            return slots
+        home = self._home(hashes)
+        for probe in range(self.max_probes):
+            idx = (home + probe) & int(self.mask)
+            hit = (slots < 0) & self.filled[idx] & (self.keys[idx] == hashes)
+            slots[hit] = idx[hit]
+        return slots
+
+    def insert(self, hashes: np.ndarray, values: np.ndarray):
+        hashes, first = np.unique(hashes, return_index=True)
+        values = values[first]
+        if self.values is None or self.values.shape[1:] != values.shape[1:]:
+            self.values = np.empty((self.keys.shape[0], *values.shape[1:]), dtype=values.dtype)
+            self.filled[:] = False
+        elif not np.can_cast(values.dtype, self.values.dtype):
+            self.values = self.values.astype(np.result_type(self.values.dtype, values.dtype))
+
+        home = self._home(hashes)
+        pending = np.arange(hashes.shape[0])
+        for probe in range(self.max_probes):
+            if pending.shape[0] == 0:
+                return
+            idx = (home[pending] + probe) & int(self.mask)
+            free = ~self.filled[idx] | (self.keys[idx] == hashes[pending])
+            slots, first = np.unique(idx[free], return_index=True)
+            chosen = pending[free][first]
+            self._write(slots, hashes[chosen], values[chosen])
+            pending = pending[~np.isin(pending, chosen)]
+
+        if pending.shape[0] > 0:
+            slots, first = np.unique(home[pending], return_index=True)
+            chosen = pending[first]
+            self._write(slots, hashes[chosen], values[chosen])
+
+    def _write(self, slots: np.ndarray, hashes: np.ndarray, values: np.ndarray):
+        self.keys[slots] = hashes
+        self.values[slots] = values
+        self.filled[slots] = True
+
+    def clear(self):
+        self.filled[:] = False
+
+
+class CachedPredictor:
+    """Memoizes the `predict` and `predict_proba` outputs of a model per row.
+
+    Rows are hashed in bulk and looked up in bounded array-backed hash
+    tables. Only rows that miss are sent to the underlying model, in one
+    call. Hits and misses are counted per endpoint (see
+    `set_prediction_endpoint`). Every other attribute is forwarded to the
+    wrapped model.
+    """
+
+    def __init__(self, model: Any, capacity: int = 2**20, max_probes: int = 8):
+        """
+        Args:
+            model (Any): model with `predict` (and optionally `predict_proba`) methods
+            capacity (int): maximum number of cached rows per method, rounded up to a power of 2
+            max_probes (int): number of slots probed per row before evicting
+        """
+        self.model = model
+        self.capacity = capacity
+        self.max_probes = max_probes
+        self._tables = {
+            "predict": _HashTable(capacity, max_probes),
+            "predict_proba": _HashTable(capacity, max_probes),
+        }
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def __getattr__(self, name: str):
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def __getstate__(self):
+        return {"model": self.model, "capacity": self.capacity, "max_probes": self.max_probes}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def predict(self, X: Any) -> np.ndarray:
+        return self._cached("predict", X)
+
+    def predict_proba(self, X: Any) -> np.ndarray:
+        return self._cached("predict_proba", X)
+
+    def _cached(self, method: str, X: Any) -> np.ndarray:
+        n_rows = X.shape[0]
+        if n_rows == 0:
+            return np.asarray(getattr(self.model, method)(X))
+
+        hashes = row_hashes(X)
+        table = self._tables[method]
+        with self._lock:
+            slots = table.lookup(hashes)
+            hit = slots >= 0
+            cached = table.values[slots[hit]] if hit.any() else None
+        n_hits = int(hit.sum())
+        self._count(n_hits, n_rows - n_hits)
+
+        if n_hits == n_rows:
+            return cached
+
+        miss = ~hit
+        X_miss = X.iloc[np.flatnonzero(miss)] if isinstance(X, pd.DataFrame) else np.asarray(X)[miss]
+        computed = np.asarray(getattr(self.model, method)(X_miss))
+        with self._lock:
+            table.insert(hashes[miss], computed)
+
+        if cached is None:
+            return computed
+        ret = np.empty((n_rows, *computed.shape[1:]), dtype=np.result_type(computed.dtype, cached.dtype))
+        ret[hit] = cached
+        ret[miss] = computed
+        return ret
+
+    def _count(self, hits: int, misses: int):
+        endpoint = _endpoint.get()
+        with self._lock:
+            counters = self._counters.setdefault(endpoint, {"hits": 0, "misses": 0})
+            counters["hits"] += hits
+            counters["misses"] += misses
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Hits, misses and hit rate (in rows) per endpoint."""
+        with self._lock:
+            counters = {endpoint: dict(c) for endpoint, c in self._counters.items()}
+        for c in counters.values():
+            total = c["hits"] + c["misses"]
+            c["hit_rate"] = c["hits"] / total if total else 0.0
+        return counters
+
+    def clear(self):
+        with self._lock:
+            for table in self._tables.values():
+                table.clear()
@@ -0,0 +1,77 @@
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+
+def streaming_cumulative(
+    evaluate_chunk: Callable[[int, int], Tuple[np.ndarray, np.ndarray]],
+    n_instances: int,
+    n_actions: int,
+    chunk_size: int = 100_000,
+    keep_details: bool = True,
+) -> Tuple[
+    int,
+    float,
+    Optional[Dict[int, np.ndarray]],
+    Union[List[Union[int, float]], np.ndarray],
+    Optional[List[pd.Series]],
+    np.ndarray,
+]:
+    """Cumulative effectiveness and cost of a set of actions, where every
+    instance takes the cheapest action that flips it. Instances are
+    processed in chunks of `chunk_size` rows, keeping only the running
+    minimum cost and the argmin action of every instance.
+
+    Args:
+        evaluate_chunk (Callable[[int, int], Tuple[np.ndarray, np.ndarray]]): given the row range `[start, end)`, returns the predictions and the costs of every action on these rows, both of shape (end - start, n_actions). Costs of instances not flipped by an action should be `np.inf`
+        n_instances (int): number of instances
+        n_actions (int): number of actions
+        chunk_size (int): number of instances evaluated at once
+        keep_details (bool): also return the predictions and costs of every action for every instance, which needs n_instances x n_actions memory
+
+    Returns:
+        Tuple: number of flipped instances, total cost of the flipped instances,
+        predictions of every action (`{i + 1: predictions}`, None if not `keep_details`),
+        index of the action chosen for every instance (`np.inf` for instances not flipped;
+        a list if `keep_details`, else a float array), per-action costs (list of Series,
+        None if not `keep_details`) and the final cost of every instance.
+    """
+    final_costs = np.full(n_instances, np.inf)
+    final_output = np.full(n_instances, np.inf)
+    all_predictions = (
+        {i + 1: [] for i in range(n_actions)} if keep_details else None
+    )
+    costs = [[] for _ in range(n_actions)] if keep_details else None
+
+    for start in range(0, n_instances, chunk_size):
+        end = min(start + chunk_size, n_instances)
+        predictions, chunk_costs = evaluate_chunk(start, end)
+
+        chunk_min = chunk_costs.min(axis=1)
+        flipped = chunk_min != np.inf
+        final_costs[start:end] = chunk_min
+        final_output[start:end][flipped] = np.argmin(chunk_costs[flipped], axis=1)
+
+        if keep_details:
+            for i in range(n_actions):
+                all_predictions[i + 1].append(predictions[:, i])
+                costs[i].append(chunk_costs[:, i])
+
+    effectiveness = (final_costs != np.inf).sum()
+    cost = final_costs[final_costs != np.inf].sum()
+
+    if keep_details:
+        all_predictions = {
+            i: np.concatenate(predictions) if predictions else np.array([], dtype=int)
+            for i, predictions in all_predictions.items()
+        }
+        costs = [
+            pd.Series(np.concatenate(action_costs) if action_costs else np.array([]))
+            for action_costs in costs
+        ]
+        final_output = [
+            np.inf if output == np.inf else int(output) for output in final_output
+        ]
+
+    return effectiveness, cost, all_predictions, final_output, costs, final_costs
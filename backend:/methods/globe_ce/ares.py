@@ -7,6 +7,9 @@ import copy
 import matplotlib.pyplot as plt
 import itertools
 import warnings
+import heapq
+from collections import Counter
+from joblib import Parallel, delayed, effective_n_jobs
 
 
 def create_feature_values_tree(features_tree, use_values=False):
@@ -40,6 +43,63 @@ def create_features_tree(feature_values):
     return features_tree
 
 
+def apply_changes(cfx, changes):
+    """Applies encoded then-changes (column index, add, value) to cfx in place"""
+    for col, add, value in changes:
+        if add:
+            cfx[:, col] += value
+        else:
+            cfx[:, col] = value
+    return cfx
+
+
+def evaluate_triple_chunk(model, x_bin, x_orig, chunk, means=None, stds=None):
+    """
+    Evaluates a chunk of encoded triples (see TwoLevelRecourseSet.encode_triple).
+    Triples with the same then-changes share their counterfactuals: the changes are
+    applied once, by column index, to the rows covered by any triple of the group,
+    and the counterfactuals of all groups are predicted in one call
+
+    Input: model, x_bin (numpy, binned affected inputs used for cover),
+           x_orig (numpy, original affected inputs), chunk (list of encoded
+           triples), means/stds (numpy, if the model expects normalised inputs)
+    Output: corrects (0 or 100), costs and covers, of shape (len(chunk), n)
+    """
+    n = x_bin.shape[0]
+    covers = np.zeros((len(chunk), n), dtype=bool)
+    groups = {}
+    for t, (cover_idx, changes, _) in enumerate(chunk):
+        covers[t] = x_bin[:, cover_idx].all(axis=1)
+        groups.setdefault(changes, []).append(t)
+
+    group_rows, cfxs = [], []
+    for changes, ts in groups.items():
+        rows = np.flatnonzero(covers[ts].any(axis=0))
+        group_rows.append(rows)
+        cfxs.append(apply_changes(x_orig[rows], changes))
+
+    corrects, costs = np.zeros((len(chunk), n)), np.zeros((len(chunk), n))
+    if sum(rows.shape[0] for rows in group_rows) == 0:
+        return corrects, costs, covers
+    cfx = np.concatenate(cfxs)
+    if means is not None:
+        preds = model.predict((cfx - means) / stds)
+    else:
+        preds = model.predict(cfx)
+    preds = np.asarray(preds)
+
+    offset = 0
+    for ts, rows in zip(groups.values(), group_rows):
+        group_preds = np.zeros(n)
+        group_preds[rows] = preds[offset:offset+rows.shape[0]]
+        offset += rows.shape[0]
+        for t in ts:
+            cover = covers[t]
+            corrects[t, cover] = group_preds[cover] * 100
+            costs[t, cover] = chunk[t][2]
+    return corrects, costs, covers
+
+
 class AReS:
     def __init__(self, model, dataset, X, dropped_features=[],
                  n_bins=10, ordinal_features=[], normalise=False,
@@ -265,7 +325,7 @@ class AReS:
             self.SD_copy, self.RL_copy = copy.deepcopy(self.SD), copy.deepcopy(self.RL)
     
     def generate_groundset(self, max_width=None, RL_reduction=False,
-                           then_generation=None, save_copy=False):
+                           then_generation=None, save_copy=False, stream=False):
         """
         Compute candidate set of rules for self.optimise(). Determines if rules are valid and also applies
         maxwidth constraint. User sets self.add_redundant to False (__init__ method) if we ignore any rules
@@ -276,6 +336,8 @@ class AReS:
                 SD_lengths and RL_lengths: widths of each SD/RL element
                 feature_values_tree: as described in self.encode_feature_values
                 then_gen UPDATE
+                stream: if True, the triples are generated in chunks when evaluated
+                        instead of being stored in a set
         Output: candidate set of rules after applying constraints
         """
         # Max width
@@ -285,7 +347,8 @@ class AReS:
         self.V = TwoLevelRecourseSet()
         
         self.V.generate_triples(self.SD, self.RL, max_width=max_width,
-                                RL_reduction=RL_reduction, then_generation=then_generation)
+                                RL_reduction=RL_reduction, then_generation=then_generation,
+                                stream=stream)
                                 
         print("Ground Set Computed with Length", self.V.length)
         if save_copy:
@@ -293,10 +356,13 @@ class AReS:
             self.V_copy = copy.deepcopy(self.V)
 
     def evaluate_groundset(self, lams, r=None, save_mode=0,
-                           disable_tqdm=False, plot_accuracy=True):
+                           disable_tqdm=False, plot_accuracy=True,
+                           store_cfx=False, chunk_size=1000, n_jobs=None):
         self.V.evaluate_triples(self, r=r, save_mode=save_mode,
                                 disable_tqdm=disable_tqdm,
-                                plot_accuracy=plot_accuracy)
+                                plot_accuracy=plot_accuracy,
+                                store_cfx=store_cfx, chunk_size=chunk_size,
+                                n_jobs=n_jobs)
 
         # compute objectives for individual triples
         if len(lams) == 2:
@@ -317,7 +383,7 @@ class AReS:
         #     self.V.plot_accuracy()
 
     def optimise_groundset(self, lams, factor=1, print_updates=False,
-                           print_terms=False, save_copy=False):
+                           print_terms=False, save_copy=False, lazy_greedy=False):
         """
         Submodular maximisation. We make 2 major modifications:
             1. Don't repeat procedure k times, where k is the number of constraints. This rarely increased
@@ -326,6 +392,11 @@ class AReS:
                regarding how this is done efficiently). In this case, you might have 20 choose 2 = 190 options for
                elements to exchange (instead of just 20) which is just not a worthwhile trade-off.
 
+        Trial objectives are computed with an IncrementalObjective, in O(n) per add,
+        delete or exchange. If lazy_greedy is True, the add pass picks the candidate
+        with the largest marginal gain, using a priority queue of (stale) gains,
+        instead of adding every improving candidate in objective order
+
         Output: Final two level recourse set, S
         """
         print("Initialising Copy of Ground Set")
@@ -359,6 +430,24 @@ class AReS:
             bounds = [self.U1, self.U3, self.U4]
             self.f = AReS.f_ares
 
+        objective = IncrementalObjective(self.V_opt, lams, bounds)
+        objective.add(f_argmax)
+        subgroups = [triple[0] for triple in self.V_opt.triples_array]
+
+        def feasible(add_idx, delete_idx=None):
+            """self.constraints of the selection after the add (and delete)"""
+            size = objective.size + 1 - (delete_idx is not None)
+            if size > self.e1:
+                return False
+            counts = objective.subgroup_counts
+            n_subgroups = len(counts)
+            if delete_idx is not None and counts[subgroups[delete_idx]] == 1\
+                    and subgroups[delete_idx] != subgroups[add_idx]:
+                n_subgroups -= 1
+            if subgroups[add_idx] not in counts:
+                n_subgroups += 1
+            return n_subgroups <= self.e3
+
         # While there exists a delete/update operation do:
         print("While there exists a delete/update operation, loop:")
         delete, add, exchange = True, True, True
@@ -367,9 +456,10 @@ class AReS:
             print("Checking Delete")
             delete = False
             for idx in np.arange(N)[R_idx]:
-                R_idx[idx] = False
-                f_delete = self.f(self.V_opt, lams, bounds, idx=R_idx)
+                f_delete = objective.value(remove=idx)
                 if f_delete > f_thresh:
+                    R_idx[idx] = False
+                    objective.remove(idx)
                     if print_updates:
                         print("Deleting Element ({} >= {})".format(f_delete, f_thresh))
                     # self.min_costs.append(self.f_custom(Si_delete, return_costs=True))
@@ -379,7 +469,6 @@ class AReS:
                     f_thresh = factor * f_delete
                     delete = True
                     break
-                R_idx[idx] = True
             if (not delete) and print_updates:
                 print("No Delete Operation Found")
             if not (delete or add or exchange):
@@ -393,11 +482,16 @@ class AReS:
             print("Checking Add")
             add = False
             if R_idx.sum() < self.e1:
-                for idx in tqdm(np.arange(N)[~R_idx]):
-                    R_idx[idx] = True
-                    if self.constraints(self.V_opt.triples_array[R_idx]):
-                        f_add = self.f(self.V_opt, lams, bounds, idx=R_idx)
+                if lazy_greedy:
+                    candidates = self._lazy_greedy_candidates(objective, np.arange(N)[~R_idx], feasible)
+                else:
+                    candidates = tqdm(np.arange(N)[~R_idx])
+                for idx in candidates:
+                    if feasible(idx):
+                        f_add = objective.value(add=idx)
                         if f_add > f_thresh:
+                            R_idx[idx] = True
+                            objective.add(idx)
                             if print_updates:
                                 print("Adding Element ({} >= {})"
                                       .format(f_add, f_thresh))
@@ -408,7 +502,8 @@ class AReS:
                             f_thresh = factor * f_add
                             add = True
                             continue
-                    R_idx[idx] = False
+                    if lazy_greedy:
+                        break  # no remaining candidate has a larger gain
             if (not add) and print_updates:
                 print("No Add Operation Found")
             if not (delete or add or exchange):
@@ -420,11 +515,13 @@ class AReS:
             for add_idx in tqdm(np.arange(N)[~R_idx]):
                 # Permit only 1 removal (not k, as in algorithm)
                 for delete_idx in np.arange(N)[R_idx]:
-                    R_idx[add_idx] = True
-                    R_idx[delete_idx] = False
-                    if self.constraints(self.V_opt.triples_array[R_idx]):
-                        f_exchange = self.f(self.V_opt, lams, bounds, idx=R_idx)
+                    if feasible(add_idx, delete_idx):
+                        f_exchange = objective.value(add=add_idx, remove=delete_idx)
                         if f_exchange > f_thresh:
+                            R_idx[add_idx] = True
+                            R_idx[delete_idx] = False
+                            objective.remove(delete_idx)
+                            objective.add(add_idx)
                             if print_updates:
                                 print("Exchanging Element ({} >= {})".
                                       format(f_exchange, f_thresh))
@@ -436,8 +533,6 @@ class AReS:
                             f_thresh = factor * f_exchange
                             exchange = True
                             break
-                    R_idx[delete_idx] = True
-                    R_idx[add_idx] = False
             if (not exchange) and print_updates:
                 print("No Exchange Operation Found")
             if not (delete or add or exchange):
@@ -451,6 +546,27 @@ class AReS:
         self.R.length = len(self.R.triples)
         self.R.evaluate_triples(self)
 
+    @staticmethod
+    def _lazy_greedy_candidates(objective, candidates, feasible):
+        """
+        Yields add candidates in decreasing order of marginal gain. Gains are
+        cached in a priority queue and only recomputed when a candidate reaches
+        the top: if its updated gain is still the largest, it is yielded
+        """
+        current = objective.value()
+        heap = [(-(objective.value(add=idx) - current), idx) for idx in candidates]
+        heapq.heapify(heap)
+        while heap:
+            _, idx = heapq.heappop(heap)
+            if objective.selected[idx] or not feasible(idx):
+                continue
+            current = objective.value()
+            gain = objective.value(add=idx) - current
+            if heap and gain < -heap[0][0]:
+                heapq.heappush(heap, (-gain, idx))
+                continue
+            yield idx
+
     @staticmethod
     def f_ares(tlrs, lams, bounds, idx=None,
                singleton=False):  #, print_terms=False, plot_f=False):
@@ -586,6 +702,130 @@ class AReS:
         return costs, corrects
 
 
+class IncrementalObjective:
+    def __init__(self, tlrs, lams, bounds):
+        """
+        Objective (AReS.f_custom if len(lams) == 2, else AReS.f_ares) of a
+        selection of triples of an evaluated two level recourse set, updated
+        incrementally. Per input, the number of selected triples that are
+        correct/cover it and the best and second best costs are stored, so
+        that adding, deleting or exchanging a triple is evaluated in O(n).
+        Values are equal to those of AReS.f_custom/AReS.f_ares for cost
+        matrices without NaNs (as in AReS.optimise_groundset)
+
+        Input: tlrs (evaluated TwoLevelRecourseSet), lams, bounds (as in AReS.f_custom/AReS.f_ares)
+        """
+        self.tlrs = tlrs
+        self.lams = lams
+        self.bounds = bounds
+        self.custom = len(lams) == 2
+        N, n = tlrs.correct_matrix.shape
+        self.correct_dtype = tlrs.correct_matrix.dtype
+        self.finite_costs = bool(np.isfinite(tlrs.cost_matrix).all())
+        self.correct = (tlrs.correct_matrix != 0).astype(np.int32)
+        self.cover = (tlrs.cover_matrix != 0).astype(np.int32)
+        self.selected = np.zeros(N, dtype=bool)
+        self.subgroup_counts = Counter()
+        self.size = 0
+        self.n_correct = np.zeros(n, dtype=np.int32)
+        self.n_cover = np.zeros(n, dtype=np.int32)
+        self.best_cost = np.full(n, np.inf)
+        self.best_idx = np.full(n, -1)
+        self.second_cost = np.full(n, np.inf)
+        self.second_idx = np.full(n, -1)
+        if not self.custom:
+            self.incorrect_counts = (tlrs.correct_matrix == 0).sum(axis=1)
+        self.incorrect = 0  # f_ares terms
+        self.featurecost = 0
+        self.featurechange = 0
+
+    def add(self, idx):
+        cost = self.tlrs.cost_matrix[idx]
+        better = cost < self.best_cost
+        second = ~better & (cost < self.second_cost)
+        self.second_cost[better], self.second_idx[better] = self.best_cost[better], self.best_idx[better]
+        self.best_cost[better], self.best_idx[better] = cost[better], idx
+        self.second_cost[second], self.second_idx[second] = cost[second], idx
+        self._update(idx, 1)
+
+    def remove(self, idx):
+        self._update(idx, -1)
+        # Best and second best costs involving the removed triple are recomputed
+        stale = (self.best_idx == idx) | (self.second_idx == idx)
+        if stale.any():
+            selected = np.flatnonzero(self.selected)
+            self.best_cost[stale], self.best_idx[stale] = np.inf, -1
+            self.second_cost[stale], self.second_idx[stale] = np.inf, -1
+            if selected.shape[0]:
+                costs = self.tlrs.cost_matrix[selected][:, stale]
+                order = np.argsort(costs, axis=0, kind='stable')
+                cols = np.arange(costs.shape[1])
+                self.best_cost[stale], self.best_idx[stale] = costs[order[0], cols], selected[order[0]]
+                if selected.shape[0] > 1:
+                    self.second_cost[stale] = costs[order[1], cols]
+                    self.second_idx[stale] = selected[order[1]]
+
+    def _update(self, idx, sign):
+        self.selected[idx] = sign > 0
+        self.size += sign
+        subgroup = self.tlrs.triples_array[idx][0]
+        self.subgroup_counts[subgroup] += sign
+        if self.subgroup_counts[subgroup] == 0:
+            del self.subgroup_counts[subgroup]
+        self.n_correct += sign * self.correct[idx]
+        self.n_cover += sign * self.cover[idx]
+        if not self.custom:
+            self.incorrect += sign * self.incorrect_counts[idx]
+            self.featurecost += sign * self.tlrs.featurecost[idx]
+            self.featurechange += sign * self.tlrs.featurechange[idx]
+
+    def value(self, add=None, remove=None):
+        """Objective of the selection with triple add added and triple remove removed"""
+        size, n_correct, n_cover, best_cost = self.size, self.n_correct, self.n_cover, self.best_cost
+        incorrect, featurecost, featurechange = self.incorrect, self.featurecost, self.featurechange
+        if remove is not None:
+            size -= 1
+            n_correct = n_correct - self.correct[remove]
+            best_cost = np.where(self.best_idx == remove, self.second_cost, best_cost)
+            if not self.custom:
+                n_cover = n_cover - self.cover[remove]
+                incorrect -= self.incorrect_counts[remove]
+                featurecost -= self.tlrs.featurecost[remove]
+                featurechange -= self.tlrs.featurechange[remove]
+        if add is not None:
+            size += 1
+            n_correct = n_correct + self.correct[add]
+            best_cost = np.minimum(best_cost, self.tlrs.cost_matrix[add])
+            if not self.custom:
+                n_cover = n_cover + self.cover[add]
+                incorrect += self.incorrect_counts[add]
+                featurecost += self.tlrs.featurecost[add]
+                featurechange += self.tlrs.featurechange[add]
+
+        lams, bounds = self.lams, self.bounds
+        if self.custom:
+            if size == 0:
+                return 0
+            correct = ((n_correct > 0) * 100).astype(self.correct_dtype).mean()
+            if correct == 0:
+                cost = bounds
+            elif self.finite_costs:
+                cost = best_cost.mean()  # equal to np.nanmean without NaNs
+            else:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", category=RuntimeWarning)
+                    cost = np.nanmean(best_cost)
+                    if np.isnan(cost):
+                        cost = bounds
+            return lams[0] * correct + lams[1] * (bounds - cost)
+        if size == 0:
+            return lams[0] * bounds[0]
+        cover = (n_cover > 0).sum()
+        return lams[0] * (bounds[0] - incorrect) + lams[1] * cover\
+               + lams[2] * (bounds[1] - featurecost)\
+               + lams[3] * (bounds[2] - featurechange)
+
+
 class Apriori:
     # Takes x and (thresh OR affected_subgroup)
     # Compute features/widths/length/values from conditions
@@ -693,6 +933,9 @@ class TwoLevelRecourseSet:
         self.triples = set()
         self.triples_array = None
         self.length = 0
+        self.stream = False  # if True, triples are generated when evaluated
+        self.max_width = None
+        self._pair_index = None
         self.cfx_matrix = None  # counterfactuals after applying recourses to x_aff
         self.correct_matrix = None
         self.cost_matrix = None
@@ -711,13 +954,23 @@ class TwoLevelRecourseSet:
         self.featurecost = None
         self.featurechange = None
 
-    def generate_triples(self, SD, RL, max_width, RL_reduction=False, then_generation=None):
+    def generate_triples(self, SD, RL, max_width, RL_reduction=False, then_generation=None,
+                         stream=False):
         """
         Stores SD, RL, triples and length
+
+        Features of the itemsets are encoded as integer bitmasks, and RL is
+        bucketed by (feature mask, width): the (inner-if, then) pairs of a
+        bucket are formed once, and the buckets compatible with an outer-if
+        are found by a lookup per distinct (feature mask, width) of SD.
+        If stream is True, triples are not materialised: only their number is
+        stored, and they are generated in chunks (see iter_triple_chunks)
+        when the set is evaluated
         """
         # Initialise SD and RL
         print("Computing Ground Set of Triples V")
         self.SD, self.RL = SD, RL
+        self.max_width = max_width
         # Apply RL-Reduction if required
         if RL_reduction is True:
             print("Reducing RL")
@@ -725,11 +978,102 @@ class TwoLevelRecourseSet:
             self.RL.reduce(utilise_bug=False, print_output=False)
             print("RL Reduced from Size {} to {}".format(n, self.RL.length))
         if then_generation is not None:
+            if stream:
+                raise ValueError("Streaming triples is not supported with then_generation")
             self.RL.features_tree = create_features_tree(self.RL.x.columns)
+            self._pair_index, self.stream = None, False
+            self._generate_then_triples(max_width, then_generation)
+            self.length = len(self.triples)
+            return
+
+        self._pair_index = self.index_pairs()
+        self.stream = stream
+        self.triples = set()
+        if stream:
+            self.length = sum(len(pairs[0]) for _, pairs in self._iter_compatible_pairs())
+        else:
+            for chunk in self.iter_triple_chunks():
+                self.triples.update(chunk)
+            self.length = len(self.triples)
+
+    def feature_masks(self):
+        """Integer bitmasks of the features of every SD and RL itemset (one bit per feature)"""
+        bits = {}
+        for features in itertools.chain(self.SD.features if self.SD.length else [],
+                                        self.RL.features if self.RL.length else []):
+            for feature in features:
+                bits.setdefault(feature, len(bits))
+        def masks(features):
+            return [sum(1 << bits[feature] for feature in fs) for fs in features]
+        return (masks(self.SD.features) if self.SD.length else [],
+                masks(self.RL.features) if self.RL.length else [])
+
+    def index_pairs(self):
+        """
+        SD indexes grouped by (feature mask, width), and the (inner-if, then)
+        pairs of RL (same features, different feature values) grouped by
+        (feature mask, width)
+        """
+        sd_masks, rl_masks = self.feature_masks()
+        sd_buckets, rl_buckets = {}, {}
+        for i, key in enumerate(zip(sd_masks, self.SD.widths if self.SD.length else [])):
+            sd_buckets.setdefault(key, []).append(i)
+        for j, key in enumerate(zip(rl_masks, self.RL.widths if self.RL.length else [])):
+            rl_buckets.setdefault(key, []).append(j)
+        pairs = {}
+        for key, idxs in rl_buckets.items():
+            inner_ifs, thens = [], []
+            for j in idxs:
+                for k in idxs:
+                    if self.RL.values[j] != self.RL.values[k]:
+                        inner_ifs.append(j)
+                        thens.append(k)
+            if inner_ifs:
+                pairs[key] = (np.array(inner_ifs), np.array(thens))
+        return sd_buckets, pairs
+
+    def _iter_compatible_pairs(self):
+        """Yields (SD index, (inner-if RL indexes, then RL indexes)) for every
+        compatible SD index and RL bucket"""
+        sd_buckets, pairs = self._pair_index
+        for (sd_mask, sd_width), sd_idxs in sd_buckets.items():
+            compatible = [rl_pairs for (rl_mask, rl_width), rl_pairs in pairs.items()
+                          if not (sd_mask & rl_mask) and sd_width + rl_width <= self.max_width]
+            for i in sd_idxs:
+                for rl_pairs in compatible:
+                    yield i, rl_pairs
+
+    def iter_triple_chunks(self, chunk_size=10000):
+        """Yields the triples of the ground set in lists of at most chunk_size"""
+        if self._pair_index is None:
+            triples = list(self.triples)
+            for start in range(0, len(triples), chunk_size):
+                yield triples[start:start+chunk_size]
+            return
+        chunk = []
+        SD_values, RL_values = self.SD.values, self.RL.values
+        for i, (inner_ifs, thens) in self._iter_compatible_pairs():
+            outer_if = SD_values[i]
+            chunk.extend((outer_if, RL_values[j], RL_values[k]) for j, k in zip(inner_ifs, thens))
+            while len(chunk) >= chunk_size:
+                yield chunk[:chunk_size]
+                chunk = chunk[chunk_size:]
+        if chunk:
+            yield chunk
+
+    def iter_triples(self, chunk_size=10000):
+        """Triples to evaluate: the stored set, or the streamed ground set"""
+        if self.stream:
+            return itertools.chain.from_iterable(self.iter_triple_chunks(chunk_size))
+        return iter(self.triples)
+
+    def _generate_then_triples(self, max_width, then_generation):
+        """Triples whose then conditions are generated for each inner-if (then_generation)"""
+        sd_masks, rl_masks = self.feature_masks()
         disable_tqdm = False if self.SD.length > 1 else True
         for i in tqdm(range(self.SD.length), disable=disable_tqdm):
             for j in tqdm(range(self.RL.length), disable=(not disable_tqdm)):
-                no_matching_features = self.SD.features[i].isdisjoint(self.RL.features[j])
+                no_matching_features = not (sd_masks[i] & rl_masks[j])
                 width_constraint = (self.SD.widths[i] + self.RL.widths[j]) <= max_width
                 if width_constraint and no_matching_features:
                     width = self.RL.widths[j]
@@ -767,16 +1111,21 @@ class TwoLevelRecourseSet:
                                 rule = (self.SD.values[i], self.RL.values[j],
                                         RL2_values[k])
                                 self.triples.add(rule)
-        self.length = len(self.triples)
 
     def evaluate_triples(self, ares, r=None, save_mode=0,
-                         disable_tqdm=False, plot_accuracy=True):
+                         disable_tqdm=False, plot_accuracy=True,
+                         store_cfx=False, chunk_size=1000, n_jobs=None):
         """
         Implement objective function parameter
         Method for evaluation of two level recourse sets. This needs a massive refactor with:
         self.evaluate, self.f_custom, self.f_ares, self.objective_terms
         (finds best correctness/cost and counterfactuals for each input)
 
+        Triples are encoded as column indexes (see self.encode_triple) and evaluated
+        in chunks of chunk_size (see evaluate_triple_chunk), on n_jobs processes
+        if n_jobs is given. The (r, n, d) counterfactuals matrix self.cfx_matrix is
+        only computed if store_cfx is True
+
         Inputs: R, final two level recourse set
                 n_rules, maximum number of counterfactuals (that satisfied at least one rule)
                 update_V: 0 is no rules are saved; 1 is all rules that satisfied at least
@@ -800,37 +1149,66 @@ class TwoLevelRecourseSet:
         n = self.ares.X_aff_original.shape[0]  # number of affected inputs
         self.correct_matrix = np.zeros((r, n), dtype=int)
         self.cost_matrix = np.zeros((r, n))
-        self.cfx_matrix = np.zeros((r, *self.ares.X_aff_original.shape))
+        self.cfx_matrix = None
         self.triples_array = np.zeros(r, dtype=object)
-        self.max_idxs = np.zeros(r, dtype=bool)
-        self.cumulative_idxs = np.zeros(r, dtype=bool)
-        cor_max, cor_cumulative = 0, np.zeros(n)
-        self.correct_max = np.zeros(r)
-        self.correct_cumulative = np.zeros((r, n))
         self.cover_matrix = np.zeros((r, n))
         self.featurecost = np.zeros(r)
         self.featurechange = np.zeros(r, dtype=int)
 
-        for i, triple in tqdm(zip(range(r), self.triples), disable=disable_tqdm):
-            self.correct_matrix[i], self.cost_matrix[i], self.cfx_matrix[i],\
-                self.cover_matrix[i], self.featurecost[i], self.featurechange[i]\
-                = self.evaluate_triple(triple, ares)
-
-            cor = self.correct_matrix[i].mean()
-            if cor > cor_max:
-                cor_max = cor
-                self.max_idxs[i] = True
-            self.correct_max[i] = cor_max
-
-            self.correct_cumulative[i] = np.maximum(cor_cumulative, self.correct_matrix[i])
-            if self.correct_cumulative[i].sum() > cor_cumulative.sum():
-                self.cumulative_idxs[i] = True
-            cor_cumulative = self.correct_cumulative[i]
-
-            self.triples_array[i] = triple
-            i += 1
-            if i == r:
-                break
+        # Encoded inputs: binned one-hot (cover) and original (counterfactuals)
+        x_bin = self.ares.X_aff.values != 0
+        x_orig = self.ares.X_aff_original.values.astype(float)
+        bin_columns = {c: i for i, c in enumerate(self.ares.X_aff.columns)}
+        orig_columns = {c: i for i, c in enumerate(self.ares.X_aff_original.columns)}
+        means, stds = (ares.means, ares.stds) if ares.normalise else (None, None)
+
+        def chunks():
+            triples = zip(range(r), self.iter_triples(chunk_size))
+            while True:
+                chunk = list(itertools.islice(triples, chunk_size))
+                if not chunk:
+                    return
+                encoded = []
+                for i, triple in chunk:
+                    self.triples_array[i] = triple
+                    cover_idx, changes, self.featurecost[i], self.featurechange[i] =\
+                        self.encode_triple(triple, ares, bin_columns, orig_columns)
+                    encoded.append((cover_idx, changes, self.featurechange[i]))
+                yield encoded
+
+        # Chunks are encoded as they are dispatched and written as they are
+        # evaluated, so only a few of them are held in memory at once
+        if n_jobs is not None and effective_n_jobs(n_jobs) > 1:
+            results = Parallel(n_jobs=n_jobs, return_as="generator")(
+                delayed(evaluate_triple_chunk)(ares.model, x_bin, x_orig, encoded, means, stds)
+                for encoded in chunks())
+        else:
+            results = (evaluate_triple_chunk(ares.model, x_bin, x_orig, encoded, means, stds)
+                       for encoded in chunks())
+        start = 0  # chunks are returned in order
+        for corrects, costs, covers in tqdm(results, total=-(-r // chunk_size),
+                                            disable=disable_tqdm):
+            end = start + corrects.shape[0]
+            self.correct_matrix[start:end] = corrects
+            self.cost_matrix[start:end] = costs
+            self.cover_matrix[start:end] = covers
+            start = end
+
+        if store_cfx:
+            self.cfx_matrix = np.zeros((r, *self.ares.X_aff_original.shape))
+            for i in range(r):
+                _, changes, _, _ = self.encode_triple(self.triples_array[i], ares, bin_columns, orig_columns)
+                cover = self.cover_matrix[i] == 1
+                self.cfx_matrix[i] = x_orig
+                self.cfx_matrix[i][cover] = apply_changes(x_orig[cover], changes)
+
+        # Best single triple and cumulative coverage of the first i triples
+        cors = self.correct_matrix.mean(axis=1)
+        self.correct_max = np.maximum.accumulate(cors)
+        self.max_idxs = cors > np.concatenate([[0], self.correct_max])[:-1]
+        self.correct_cumulative = np.maximum.accumulate(self.correct_matrix, axis=0).astype(float)
+        cumulative_sums = self.correct_cumulative.sum(axis=1)
+        self.cumulative_idxs = cumulative_sums > np.concatenate([[0], cumulative_sums])[:-1]
 
         if plot_accuracy:
             self.plot_accuracy()
@@ -855,6 +1233,19 @@ class TwoLevelRecourseSet:
             elif save_mode == 2:
                 self.triples = set(self.triples_array[self.cumulative_idxs])
             self.length = len(self.triples)
+            self.stream = False
+
+    def encode_triple(self, triple, ares, bin_columns, orig_columns):
+        """
+        Column indexes of the outer-if and inner-if conditions (in X_aff), and
+        then-changes as (column index in X_aff_original, add, value) tuples
+
+        Output: cover column indexes, changes, featurecost, featurechange
+        """
+        cover_idx = [bin_columns[c] for c in list(triple[0]) + list(triple[1])]
+        featurecost, featurechange, changes = self.triple_changes(triple, ares)
+        changes = tuple((orig_columns[col], add, value) for col, add, value in changes)
+        return cover_idx, changes, featurecost, featurechange
 
     def index_terms(self, idx):
         self.correct_matrix = self.correct_matrix[idx]
@@ -906,11 +1297,14 @@ class TwoLevelRecourseSet:
                triple_cover, featurecost, featurechange
 
     @staticmethod
-    def triple_cost(triple, ares, x_aff):
+    def triple_changes(triple, ares):
+        """
+        Then-changes of a triple, as (column, add, value) tuples: value is added
+        to the column if add is True (continuous features), otherwise the
+        column is set to value (one-hot encoded features)
+        """
         outer_ifs, inner_ifs, thens = list(triple[0]), list(triple[1]), list(triple[2])
-        featurecost, featurechange = 0, int(0)
-        x_aff = x_aff.copy()
-        # Generate counterfactuals to calculate predictions and costs
+        featurecost, featurechange, changes = 0, int(0), []
         # improve this by pairing directly the order of inner_ifs and thens
         # currently the features are not guaranteed to be in the same order
         # hence the search through inner_ifs (would also make reading triples easier)
@@ -924,7 +1318,7 @@ class TwoLevelRecourseSet:
                             then_idx = ares.features.index(ares.feature_values_tree[then])
                             d = ares.bin_mids[then] - ares.bin_mids[inner_if]
                             featurechange += np.rint(abs(d * ares.feature_costs_vector[then_idx]))
-                            x_aff[then_feature] += d
+                            changes.append((then_feature, True, d))
                         else:
                             then_idx = ares.features.index(then)
                             if then in ares.ordinal_features:
@@ -934,9 +1328,21 @@ class TwoLevelRecourseSet:
                                 featurechange += np.rint(abs(then_cost - inner_if_cost))
                             else:  # bulk write features since they all match conditions
                                 featurechange += np.rint(1)  # categorical cost
-                            x_aff[inner_if] = int(0)
-                            x_aff[then] = int(1)
+                            changes.append((inner_if, False, int(0)))
+                            changes.append((then, False, int(1)))
                         break  # match found, exit inner-if loop, resume then loop
+        return featurecost, featurechange, changes  # featurecost not implemented
+
+    @staticmethod
+    def triple_cost(triple, ares, x_aff):
+        # Generate counterfactuals to calculate predictions and costs
+        featurecost, featurechange, changes = TwoLevelRecourseSet.triple_changes(triple, ares)
+        x_aff = x_aff.copy()
+        for col, add, value in changes:
+            if add:
+                x_aff[col] += value
+            else:
+                x_aff[col] = value
         return featurecost, featurechange, x_aff  # featurecost not implemented
 
     def plot_accuracy(self, n_triples=None):
@@ -982,6 +1388,7 @@ class TwoLevelRecourseSet:
         for i in self.triples_array[idx]:
             self.triples.add(i)
         self.length = len(self.triples)
+        self.stream = False
         print("Candidate Set Filtered with Length:", s)
 
 
@@ -4,6 +4,8 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 
+from methods.globe_ce.one_hot_segments import OneHotSegments
+
 class GLOBE_CE():
     def __init__(self, model, dataset, X, affected_subgroup=None,
                  dropped_features=[], ordinal_features=[], delta_init='zeros',
@@ -134,6 +136,11 @@ class GLOBE_CE():
         self.any_non_ordinal = self.non_ordinal_categories_idx.any()
         self.any_ordinal = self.ordinal_categories_idx.any()
         self.n_categorical = sum(self.categorical_idx)
+        # Segment index of the one-hot blocks and cost weights, used in the
+        # evaluation loops
+        self.segments = OneHotSegments(self.features, self.features_tree)
+        self.non_ordinal_costs = self.feature_costs_vector[self.non_ordinal_categories_idx]
+        self.ordinal_costs = self.feature_costs_vector[self.ordinal_categories_idx]
 
         # Initialise delta
         if type(delta_init) == str:
@@ -148,42 +155,35 @@ class GLOBE_CE():
         self.correct_max, self.cost_max = None, None
         self.scalars = None
   
-    def round_categorical(self, cf):
+    def round_categorical(self, cf, out=None):
         """
         This function is used after the optimization to compute the actual counterfactual
         Currently not implemented for optimization: argmax will likely break gradient descent
         
-        Input: counterfactuals computed using x_aff + global translation
+        Input: counterfactuals computed using x_aff + global translation, optional
+               output buffer of the same shape (may be cf itself, to round in place)
         Output: valid counterfactuals where one_hot encodings are integers (0 or 1), not floats
         """
-        ret = np.zeros(cf.shape)
-        i = 0
-        for feature in self.features:  # requires list to maintain correct order
-            if not self.features_tree[feature]:
-                ret[:, i] = cf[:, i]
-                i += 1
-            else:
-                n = len(self.features_tree[feature])
-                ret[np.arange(ret.shape[0]), i+np.argmax(cf[:, i:i+n], axis=1)] = 1
-                i += n
-        return ret
+        return self.segments.round(cf, out=out)
 
     def compute_costs(self, counterfactuals, x_aff=None):
         """Compute the costs of the counterfactuals"""
         if x_aff is None:
-            x_aff = self.x_aff.copy()
-        x_diff = counterfactuals - x_aff
+            x_aff = self.x_aff
+        x_diff = np.subtract(counterfactuals, x_aff)
         ret = 0
         if self.any_non_ordinal:
             # e.g. sum(abs([-0.5, 0.5])) going from one bin to another has cost 1
             # sum(abs(diff)) also applies to continuous features
-            ret += np.linalg.norm(x_diff[:, self.non_ordinal_categories_idx]*
-                                  self.feature_costs_vector[self.non_ordinal_categories_idx],
-                                  axis=1, ord=1)
+            diff = x_diff[:, self.non_ordinal_categories_idx]
+            diff *= self.non_ordinal_costs
+            np.abs(diff, out=diff)
+            ret += np.add.reduce(diff, axis=1)
         if self.any_ordinal:
             # e.g. abs(sum([1, -3])) going from 3rd bin to 1st bin has cost 2
-            ret += np.abs((x_diff[:, self.ordinal_categories_idx]*
-                           self.feature_costs_vector[self.ordinal_categories_idx]).sum(1))
+            diff = x_diff[:, self.ordinal_categories_idx]
+            diff *= self.ordinal_costs
+            ret += np.abs(diff.sum(1))
         return ret
 
     def evaluate(self, delta, idxs=None, vector=True, none_type=None,
@@ -204,7 +204,9 @@ class GLOBE_CE():
 
         # Evaluate CEs
         cost = np.zeros(x_aff.shape[0])
-        ces = self.round_categorical(x_aff+delta) if self.n_categorical else x_aff+delta
+        ces = x_aff+delta
+        if self.n_categorical:
+            self.round_categorical(ces, out=ces)
         if self.normalise:
             correct = self.model.predict((ces-self.means)/self.stds)
         else:
@@ -370,6 +372,84 @@ class GLOBE_CE():
 
         return corrects, costs, self.scalars
 
+    def first_flip_costs(self, delta, scalars='auto', n_scalars=1000, x_aff=None,
+                         eps=None, inf=False, disable_tqdm=True,
+                         max_batch_bytes=256 * 2**20):
+        """
+        Cost of every instance at its first flipping scalar, without the full
+        (n_scalars, n) sweep of scale. The scalars are swept in ascending order,
+        in blocks evaluated as one stacked model.predict call (of at most
+        max_batch_bytes), over the instances that have not flipped yet only.
+        Costs are computed once per instance, at its first flip, and an instance
+        leaves the active set as soon as it flips. Instances that flip back at
+        larger scalars are handled, as only the first flip matters
+
+        Input: delta (numpy), scalars ('auto' or numpy, NaN entries skipped),
+               x_aff (numpy, optional), eps (numpy or float, optional)
+        Output: min_costs, min_costs_idxs, scalars. Equal to
+                min_scalar_costs(scale(delta, vector=True)[1]) and the scalars of scale
+        """
+        if eps is None:
+            eps = 0
+        if x_aff is None:
+            x_aff = self.x_aff
+
+        self.scalars = scalars
+        if type(scalars) == str and scalars == 'auto':
+            max_scalar = max(self.bisection(delta), 1)
+            self.scalars = np.linspace(0, max_scalar, n_scalars)
+        scalars = np.asarray(self.scalars, dtype=float)
+
+        n, x_dim = x_aff.shape
+        min_costs = np.zeros(n)
+        min_costs_idxs = np.full(n, np.nan)
+        active = np.arange(n)  # instances without a flip (of nonzero cost) so far
+        candidates = np.flatnonzero(~np.isnan(scalars))
+        pbar = tqdm(total=candidates.shape[0], disable=disable_tqdm)
+        start = 0
+        while start < candidates.shape[0] and active.shape[0]:
+            block = candidates[start:start+self._sample_block_size(active.shape[0], max_batch_bytes)]
+            start += block.shape[0]
+            deltas = scalars[block, None] * delta + eps
+            correct, ces = self._predict_batch(deltas, x_aff[active])
+            ces = ces.reshape(block.shape[0], active.shape[0], x_dim)
+            flipped = correct == 1
+            rows = np.flatnonzero(flipped.any(axis=0))
+            while rows.shape[0]:
+                first = flipped[:, rows].argmax(axis=0)
+                if self.n_categorical:
+                    cost = self.compute_costs(counterfactuals=ces[first, rows],
+                                              x_aff=x_aff[active[rows]])
+                else:
+                    cost = np.array([np.linalg.norm(deltas[j]*self.feature_costs_vector,
+                                                    ord=self.p).item() for j in first])
+                found = cost != 0
+                min_costs[active[rows[found]]] = cost[found]
+                min_costs_idxs[active[rows[found]]] = block[first[found]]
+                # A zero cost does not count as a flip (as in min_scalar_costs)
+                flipped[first[~found], rows[~found]] = False
+                flipped[:, rows[found]] = False
+                rows = rows[~found]
+                rows = rows[flipped[:, rows].any(axis=0)]
+            active = active[np.isnan(min_costs_idxs[active])]
+            pbar.update(block.shape[0])
+        pbar.close()
+
+        print("\033[1mUnable to find recourse for {}/{} inputs\033[0m".format(np.sum(min_costs == 0), n))
+        if inf:
+            min_costs[min_costs == 0] = np.inf
+        return min_costs, min_costs_idxs, self.scalars
+
+    def _scaled_counterfactuals(self, delta, scalar, out):
+        """Rounded (and normalised, if the model expects it) x_aff + delta*scalar,
+        written into the preallocated buffer out"""
+        np.add(self.x_aff, delta*scalar, out=out)
+        self.round_categorical(out, out=out)
+        if self.normalise:
+            out -= self.means
+            out /= self.stds
+        return out
+
     def bisection(self, delta, thresh=99.9, iters=200, b_lim=100):
         """Returns the maximum scalar for which the coverage is above thresh"""
         # Takes in delta, returns the multiplier b which results in coverage ~ thresh
@@ -377,28 +457,20 @@ class GLOBE_CE():
         b = 1  # initial upper interval
         max_acc = 0  # maximum coverage
         max_b = 1  # upper interval at maximum coverage
-        ces = self.round_categorical(self.x_aff+delta*b)
-        if self.normalise:
-            ces = (ces-self.means)/self.stds
-        pred = self.model.predict(ces).mean()*100
+        ces = np.empty(self.x_aff.shape)  # reused by every iteration
+        pred = self.model.predict(self._scaled_counterfactuals(delta, b, ces)).mean()*100
         while pred < thresh and b<b_lim:
             if pred > max_acc:
                 max_b = b
             b *= 2
-            ces = self.round_categorical(self.x_aff+delta*b)
-            if self.normalise:
-                ces = (ces-self.means)/self.stds
-            pred = self.model.predict(ces).mean()*100
+            pred = self.model.predict(self._scaled_counterfactuals(delta, b, ces)).mean()*100
         if pred > max_acc:
             max_b = b
         a = b/2  # lower interval
         i = 0
         while i<iters:
             c = (a+b)/2  # midpoint
-            ces = self.round_categorical(self.x_aff+delta*c)
-            if self.normalise:
-                ces = (ces-self.means)/self.stds
-            if self.model.predict(ces).mean()*100 > thresh:
+            if self.model.predict(self._scaled_counterfactuals(delta, c, ces)).mean()*100 > thresh:
                 b = c
             else:
                 a = c
@@ -587,9 +659,65 @@ class GLOBE_CE():
             c = np.maximum(c, cors[j_max])
             self.deltas_div[i] = deltas[j_max]
 
+    def evaluate_batch(self, deltas, idxs=None, x_aff=None):
+        """
+        Evaluate several deltas at once, as one stacked (n_deltas * n, x_dim)
+        matrix sent to a single model.predict call
+
+        Input: deltas (numpy, n_deltas x x_dim), idxs (numpy, optional)
+        Output: predictions, costs (0 where predictions are 0), both of shape
+                (n_deltas, n). Equal to evaluate(delta, vector=True) per row
+        """
+        if x_aff is None:
+            x_aff = self.x_aff
+        if idxs is not None:
+            x_aff = x_aff[idxs]
+        n_deltas, (n, x_dim) = deltas.shape[0], x_aff.shape
+        correct, ces = self._predict_batch(deltas, x_aff)
+
+        cost = np.zeros((n_deltas, n))
+        flipped = correct == 1
+        if flipped.any():
+            if self.n_categorical:
+                cost[flipped] = self.compute_costs(
+                    counterfactuals=ces[flipped.ravel()],
+                    x_aff=np.broadcast_to(x_aff, (n_deltas, n, x_dim))[flipped])
+            else:
+                delta_costs = np.array([np.linalg.norm(delta*self.feature_costs_vector,
+                                                       ord=self.p).item() for delta in deltas])
+                cost[flipped] = np.broadcast_to(delta_costs[:, None], (n_deltas, n))[flipped]
+        return correct*100, cost
+
+    def _predict_batch(self, deltas, x_aff):
+        """Predictions (n_deltas, n) of the stacked counterfactuals x_aff + deltas[i],
+        and the (rounded, not normalised) counterfactuals, of shape (n_deltas * n, x_dim)"""
+        n_deltas, (n, x_dim) = deltas.shape[0], x_aff.shape
+        ces = (x_aff[None, :, :] + deltas[:, None, :]).reshape(-1, x_dim)
+        if self.n_categorical:
+            self.round_categorical(ces, out=ces)
+        if self.normalise:
+            correct = self.model.predict((ces-self.means)/self.stds)
+        else:
+            correct = self.model.predict(ces)
+        return np.asarray(correct).reshape(n_deltas, n), ces
+
+    def _sample_block_size(self, n, max_batch_bytes):
+        """Number of deltas evaluated at once so that the stacked
+        counterfactuals (and their rounded and normalised copies) fit in
+        max_batch_bytes"""
+        if max_batch_bytes is None:
+            return 1
+        bytes_per_delta = 4 * max(1, n) * self.x_dim * 8
+        return max(1, int(max_batch_bytes // bytes_per_delta))
+
     def sample(self, n_sample, magnitude=1, sparsity_power=1, idxs=None,
                n_features=None, disable_tqdm=False, plot=False,
-               seed=None, scheme='random', dropped_features=[]):
+               seed=None, scheme='random', dropped_features=[],
+               max_batch_bytes=256 * 2**20):
+        """Randomly sample n_sample deltas and evaluate them on x_aff. Deltas
+        are drawn one by one (so the random stream does not depend on the
+        batching) and evaluated in blocks whose size is derived from
+        max_batch_bytes (None evaluates them one at a time)"""
         n, x_dim = self.x_aff.shape
         if idxs is not None:
             n = idxs.sum()
@@ -607,13 +735,17 @@ class GLOBE_CE():
         if seed is not None:
             np.random.seed(seed)
         
+        block_size = self._sample_block_size(n, max_batch_bytes)
         for i in tqdm(range(n_sample), disable=disable_tqdm):
-            self.deltas[i] = self.schemes(scheme, magnitude,
-                                          sparsity_power, n_features)
-            if inactive.any():
-                self.deltas[i, inactive] = 0
-            self.correct_matrix[i], self.cost_matrix[i] =\
-                self.evaluate(self.deltas[i], vector=True, idxs=idxs)
+            if i % block_size == 0:
+                block = slice(i, min(i + block_size, n_sample))
+                for j in range(block.start, block.stop):
+                    self.deltas[j] = self.schemes(scheme, magnitude,
+                                                  sparsity_power, n_features)
+                    if inactive.any():
+                        self.deltas[j, inactive] = 0
+                self.correct_matrix[block], self.cost_matrix[block] =\
+                    self.evaluate_batch(self.deltas[block], idxs=idxs)
 
             if self.correct_matrix[i].any():
                 cos_idx = self.cost_matrix[i] != 0
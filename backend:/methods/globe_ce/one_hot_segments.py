@@ -0,0 +1,69 @@
+import numpy as np
+
+
+class OneHotSegments():
+    def __init__(self, features, features_tree):
+        """
+        Segment index of a one-hot encoded feature space, computed once from
+        the feature tree so that all categorical blocks can be rounded in one
+        vectorized pass
+
+        Input: features (ordered list of features), features_tree (dictionary
+               of form 'feature: [feature values]', empty for continuous features)
+        """
+        continuous, starts = [], {}
+        i = 0
+        for feature in features:  # requires list to maintain correct order
+            if not features_tree[feature]:
+                continuous.append(i)
+                i += 1
+            else:
+                n = len(features_tree[feature])
+                starts.setdefault(n, []).append(i)
+                i += n
+        self.x_dim = i
+        self.continuous_idx = np.array(continuous, dtype=int)
+        # Blocks grouped by length: (block offsets, column index matrix of shape (n_blocks, length))
+        self.blocks = [
+            (np.array(block_starts), np.array(block_starts)[:, None] + np.arange(n))
+            for n, block_starts in starts.items()
+        ]
+        self.categorical_idx = np.concatenate(
+            [cols.ravel() for _, cols in self.blocks] + [np.array([], dtype=int)]
+        )
+
+    def round(self, cf, out=None, chunk_rows=2048):
+        """
+        Round the categorical blocks of the counterfactuals to one-hot
+        encodings (argmax of every block set to 1, the rest to 0), copying
+        the continuous features. Rows are processed in chunks of chunk_rows,
+        which keeps the gathered blocks in cache
+
+        Input: cf (numpy, n x d), out (numpy, optional output buffer of the
+               same shape; may be cf itself)
+        Output: rounded counterfactuals (out if given)
+        """
+        zeroed = out is None
+        if zeroed:
+            out = np.zeros(cf.shape)
+        n_rows, d = cf.shape
+        # Flat view for the scatter of the winners (None if out is not contiguous)
+        flat_out = out.reshape(-1) if out.flags.c_contiguous else None
+        for start in range(0, n_rows, chunk_rows):
+            end = min(start + chunk_rows, n_rows)
+            chunk, out_chunk = cf[start:end], out[start:end]
+            row_offsets = (np.arange(start, end) * d)[:, None]
+            # Winners are found before writing, so that out may be cf
+            winners = [row_offsets + offsets[None, :] + np.argmax(chunk[:, cols], axis=2)
+                       for offsets, cols in self.blocks]
+            if out is not cf:
+                out_chunk[:, self.continuous_idx] = chunk[:, self.continuous_idx]
+            if not zeroed:
+                out_chunk[:, self.categorical_idx] = 0
+                out_chunk[:, self.x_dim:] = 0
+            for winner in winners:
+                if flat_out is not None:
+                    flat_out[winner.ravel()] = 1
+                else:
+                    out[np.divmod(winner.ravel(), d)] = 1
+        return out
@@ -9,7 +9,9 @@ from sklearn.compose import ColumnTransformer
 import warnings
 warnings.filterwarnings('ignore')
 from methods.glance.counterfactual_costs import build_dist_func_dataframe
+from methods.glance.utils.streaming import streaming_cumulative
 from IPython.display import display
+from tqdm import tqdm
 
 class Group_CF():
 
@@ -58,7 +60,7 @@ class Group_CF():
         exp = dice_ml.Dice(d, m, method='random')
         
         cfs_list = []
-        for i,cluster in enumerate(clusters):
+        for i,cluster in enumerate(tqdm(clusters, desc="Cluster counterfactuals")):
             cfs = generate_counterfactuals(clusters[i],1,exp,self.feat_to_vary)
             cfs_list.append(cfs)
             
@@ -76,7 +78,7 @@ class Group_CF():
         #Find group candidate counterfactuals from unaffected
         print("Finding candidate counterfactuals from unaffacted")
         candidate_counterfactuals_list = []
-        for i in  range(len(cfs_list)):
+        for i in tqdm(range(len(cfs_list)), desc="Candidate group counterfactuals"):
             counterfactuals = pd.concat(cfs_list[i])
             #direction_info = direction_info_list[i]
             key_features = key_difference_features_list[i]
@@ -94,7 +96,7 @@ class Group_CF():
         costs = []
         best_cfs = []
         print("Finding best counterfactual for each cluster")
-        for i in range(len(candidate_counterfactuals_list)):
+        for i in tqdm(range(len(candidate_counterfactuals_list)), desc="Best cluster counterfactuals"):
             
             best_counterfactual , best_coverage , best_cost = select_best_counterfactual(self.model, candidate_counterfactuals_list[i], clusters[i],key_difference_features_list[i],dist_func_dataframe)
             
@@ -106,7 +108,7 @@ class Group_CF():
             display(best_counterfactual.to_frame().T)
             print(f"Effectiveness : {round(best_coverage,2)*100}% with cost: {best_cost} ")
                   
-        total_eff, total_cost,all_predictions, chosen_actions, costs_list, final_costs = cumulative(self.affected, best_cfs, self.model,dist_func_dataframe)
+        total_eff, total_cost,all_predictions, chosen_actions, costs_list, final_costs = cumulative(self.affected, best_cfs, self.model,dist_func_dataframe, keep_details=False)
         print(f"Total Effectiveness : {round(total_eff,2)*100}% with cost {total_cost}")
         
         return best_cfs,effs,costs,total_eff,total_cost,all_predictions, chosen_actions, costs_list , final_costs
@@ -254,36 +256,28 @@ def select_best_counterfactual(model, candidate_counterfactuals, similar_instanc
         similar_instances = original_instances.copy(deep=True)
     return best_counterfactual , best_coverage , best_cost
 
-def cumulative(instances, best_cfs, model,dist_func_dataframe):
+def cumulative(instances, best_cfs, model,dist_func_dataframe, chunk_size=100_000, keep_details=True):
 
-    all_predictions = {}
-    original_instances = instances.copy(deep=True)
-    costs = [] 
-    i=0
-    for series in best_cfs:
-        # Apply the changes from the series to the instances DataFrame
-        for col, value in series.items():
-            instances[col] = value
-        # Predict new labels
-        new_predictions = model.predict(instances)
-        all_predictions[i+1]=new_predictions
-        i=i+1
-        cur_costs = dist_func_dataframe(original_instances.reset_index(drop=True), instances.reset_index(drop=True))
+    def evaluate_chunk(start, end):
+        original_instances = instances.iloc[start:end].reset_index(drop=True)
+        predictions = np.zeros((end - start, len(best_cfs)), dtype=int)
+        costs = np.zeros((end - start, len(best_cfs)))
+        for i, series in enumerate(best_cfs):
+            # Apply the changes from the series to the instances
+            changed_instances = original_instances.copy(deep=True)
+            for col, value in series.items():
+                changed_instances[col] = value
+            predictions[:, i] = model.predict(changed_instances)
+            costs[:, i] = dist_func_dataframe(original_instances, changed_instances)
+        costs[predictions == 0] = np.inf
+        return predictions, costs
 
-        cur_costs[new_predictions == 0] = np.inf
-        costs.append(cur_costs)
-        instances = original_instances.copy(deep=True)
-
-    final_costs = np.column_stack(costs).min(axis=1)
-    effectiveness = (final_costs != np.inf).sum()
-    cost = final_costs[final_costs != np.inf].sum()
-    final_output = []
-
-    for row in np.column_stack(costs):
-        if np.all(row == np.inf):
-            final_output.append(np.inf)
-        else:
-            min_index = np.argmin(row)  
-            final_output.append(min_index)
+    effectiveness, cost, all_predictions, final_output, costs, final_costs = streaming_cumulative(
+        evaluate_chunk,
+        n_instances=len(instances),
+        n_actions=len(best_cfs),
+        chunk_size=chunk_size,
+        keep_details=keep_details,
+    )
 
-    return effectiveness/len(original_instances), cost/effectiveness, all_predictions, final_output , costs, final_costs
\ No newline at end of file
+    return effectiveness/len(instances), cost/effectiveness, all_predictions, final_output , costs, final_costs